@@ -0,0 +1,123 @@
+"""Leitura de arquivos AFD (Arquivo Fonte de Dados) de relógios de ponto REP.
+
+Só os registros tipo 3 (marcação de ponto) interessam; os demais tipos
+são contados e ignorados. Aceita os dois leiautes em uso:
+
+* Portaria 1510/2009: NSR(9) "3" data DDMMAAAA(8) hora HHMM(4) PIS(12)
+* Portaria 671/2021:  NSR(9) "3" data-hora AAAA-MM-DDThh:mm:00-0300(24) CPF(12) CRC(4)
+
+A data-hora do leiaute 671 vem com o deslocamento UTC do REP e é
+convertida para `FUSO_HORARIO` antes de ser gravada; a do 1510 já é a
+hora local. O arquivo é lido linha a linha e devolvido em lotes de DataFrame, então o
+tamanho do arquivo não pesa na memória.
+"""
+import io
+import pandas as pd
+
+from config import FUSO_HORARIO
+
+COLUNAS_MARCACAO = ['linha', 'nsr', 'data', 'hora', 'tipo_id', 'identificador']
+
+# Guardamos o detalhe só das primeiras rejeições; as demais só contam.
+MAX_REJEICOES_DETALHADAS = 1000
+
+
+def novo_resumo():
+    return {
+        "linhas": 0,
+        "marcacoes": 0,
+        "importadas": 0,
+        "duplicadas": 0,
+        "rejeitadas": 0,
+        "outros_registros": 0,
+        "rejeicoes": [],  # (linha, motivo, conteúdo)
+    }
+
+
+def rejeitar(resumo, linha, motivo, conteudo=""):
+    resumo["rejeitadas"] += 1
+    if len(resumo["rejeicoes"]) < MAX_REJEICOES_DETALHADAS:
+        resumo["rejeicoes"].append((linha, motivo, conteudo))
+
+
+_FORMATOS = {'1510': "%d%m%Y%H%M", '671': "%Y-%m-%dT%H:%M:%S%z"}
+_MOMENTO_671 = r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}[+-](?:[01]\d|2[0-3])[0-5]\d'
+
+
+def _campos_marcacao(texto):
+    """(nsr, leiaute, data-hora em texto, tipo_id, identificador) de um registro tipo 3."""
+    if len(texto) >= 46 and texto[14] == '-':
+        return texto[0:9], '671', texto[10:34], 'cpf', texto[34:46].strip()
+    if len(texto) >= 34:
+        return texto[0:9], '1510', texto[10:22], 'pis', texto[22:34].strip()
+    return None
+
+
+def _montar_lote(brutos, resumo):
+    """DataFrame do lote com data/hora convertidas de forma vetorizada; inválidas são rejeitadas."""
+    df = pd.DataFrame(brutos, columns=['linha', 'nsr', 'leiaute', 'momento', 'tipo_id', 'identificador', 'texto'])
+    momento = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+    fuso_invalido = pd.Series(False, index=df.index)
+    for leiaute, formato in _FORMATOS.items():
+        mascara = (df['leiaute'] == leiaute).to_numpy()
+        if not mascara.any():
+            continue
+        textos = df.loc[mascara, 'momento']
+        if leiaute == '671':
+            # Horário do REP com o deslocamento dele (p.ex. -0300): vira a hora local de FUSO_HORARIO.
+            bem_formado = textos.str.fullmatch(_MOMENTO_671).fillna(False)
+            fuso_invalido[mascara] = ~bem_formado & textos.str[:19].str.fullmatch(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}').fillna(False)
+            convertido = pd.to_datetime(textos.where(bem_formado), format=formato, errors='coerce', utc=True)
+            momento[mascara] = convertido.dt.tz_convert(FUSO_HORARIO).dt.tz_localize(None).astype('datetime64[ns]')
+        else:
+            momento[mascara] = pd.to_datetime(textos, format=formato, errors='coerce')
+    nsr = pd.to_numeric(df['nsr'], errors='coerce')
+    valido = momento.notna() & nsr.notna() & df['identificador'].str.fullmatch(r'\d+').fillna(False)
+    motivos = pd.Series("marcação com NSR, data/hora ou PIS/CPF inválido", index=df.index).mask(
+        fuso_invalido, "deslocamento UTC inválido na data-hora")
+    for linha, texto, motivo in zip(df.loc[~valido, 'linha'], df.loc[~valido, 'texto'], motivos[~valido]):
+        rejeitar(resumo, linha, motivo, texto)
+    resumo["marcacoes"] += int(valido.sum())
+    df = df[valido]
+    return pd.DataFrame({
+        'linha': df['linha'],
+        'nsr': nsr[valido].astype('int64'),
+        'data': momento[valido].dt.date,
+        'hora': momento[valido].dt.time,
+        'tipo_id': df['tipo_id'],
+        'identificador': df['identificador'],
+    }, columns=COLUNAS_MARCACAO).reset_index(drop=True)
+
+
+def ler_lotes(arquivo, tamanho_lote, resumo):
+    """Gera DataFrames de até `tamanho_lote` marcações (colunas `COLUNAS_MARCACAO`).
+
+    `arquivo` é um arquivo binário (p.ex. o upload do Streamlit). Linhas
+    inválidas vão para `resumo` via `rejeitar`.
+    """
+    texto = io.TextIOWrapper(arquivo, encoding='latin-1', newline=None)
+    brutos = []
+    try:
+        for numero, linha in enumerate(texto, start=1):
+            resumo["linhas"] += 1
+            linha = linha.rstrip('\r\n')
+            if len(linha) < 10 or not linha[:9].isdigit():
+                if linha.strip():
+                    rejeitar(resumo, numero, "linha fora do leiaute AFD", linha[:60])
+                continue
+            if linha[9] != '3' or linha.startswith('999999999'):
+                resumo["outros_registros"] += 1
+                continue
+            campos = _campos_marcacao(linha)
+            if campos is None:
+                rejeitar(resumo, numero, "registro tipo 3 incompleto", linha[:60])
+                continue
+            brutos.append((numero, *campos, linha[:60]))
+            if len(brutos) >= tamanho_lote:
+                yield _montar_lote(brutos, resumo)
+                brutos = []
+        if brutos:
+            yield _montar_lote(brutos, resumo)
+    finally:
+        # Não fecha o arquivo de quem chamou.
+        texto.detach()
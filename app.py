@@ -1,22 +1,36 @@
 import streamlit as st
 import pandas as pd
+import os
 import time
-import re
-from services import get_horario_padrao
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
+import metricas
+from status_ponto import calcular_status
 from services import (
-    ler_registros_df,
+    ler_registros_filtrados_df,
+    ler_registros_ao_vivo,
+    contar_registros_filtrados,
+    ler_historico_funcionario_df,
     bater_ponto,
     verificar_login,
     obter_proximo_evento,
-    atualizar_registro,
+    atualizar_registros_em_lote,
     ler_funcionarios_df,
+    ler_hierarquia_filtros,
     adicionar_funcionario,
-    gerar_relatorio_organizado_df,
-    gerar_arquivo_excel,
+    solicitar_exportacao,
     ler_empresas,
     importar_funcionarios_em_massa,
-    excluir_funcionario
+    importar_afd,
+    excluir_funcionario,
+    obter_horarios,
+    ler_horarios_df,
+    adicionar_horario,
+    excluir_horario,
+    ler_banco_horas_df,
+    fechar_banco_horas,
+    reabrir_banco_horas,
+    obter_estatisticas_pool,
+    obter_estatisticas_cache
 )
 
 
@@ -50,10 +64,20 @@ carregar_css_customizado()
 
 if 'user_info' not in st.session_state:
     st.session_state.user_info = None
-if 'edit_id' not in st.session_state:
-    st.session_state.edit_id = None
+if 'filtros_relatorio' not in st.session_state:
+    st.session_state.filtros_relatorio = None
+if 'pagina_eventos' not in st.session_state:
+    st.session_state.pagina_eventos = 1
 if 'status_message' not in st.session_state:
     st.session_state.status_message = None
+if 'falhas_correcao' not in st.session_state:
+    st.session_state.falhas_correcao = None
+if 'historico' not in st.session_state:
+    st.session_state.historico = None
+if 'exportacao' not in st.session_state:
+    st.session_state.exportacao = None
+
+TAMANHO_PAGINA_HISTORICO = 20
 
 def tela_de_login():
     with st.container():
@@ -84,22 +108,24 @@ def tela_funcionario():
             st.info("Sua jornada de hoje já foi completamente registrada. Bom descanso!")
         else:
             if st.button(f"Confirmar {proximo_evento}", type="primary", use_container_width=True):
-                mensagem, tipo = bater_ponto(st.session_state.user_info['cpf'], st.session_state.user_info['nome'])
+                mensagem, tipo = bater_ponto(st.session_state.user_info['cpf'], st.session_state.user_info['nome'], evento_esperado=proximo_evento)
                 if tipo == "success":
                     st.success(mensagem)
+                    st.session_state.historico = None
                     time.sleep(1)
                     st.rerun()
                 else:
                     st.error(mensagem)
     with tab2:
         st.header("Histórico dos Meus Pontos")
-        df_todos_registros = ler_registros_df()
-        meus_registros_df = df_todos_registros[df_todos_registros['Código Forte'] == st.session_state.user_info['codigo']]
+        if st.session_state.historico is None:
+            pagina_df, proximo_cursor = ler_historico_funcionario_df(st.session_state.user_info['cpf'], tamanho_pagina=TAMANHO_PAGINA_HISTORICO)
+            st.session_state.historico = {"df": pagina_df, "cursor": proximo_cursor}
+        meus_registros_df = st.session_state.historico["df"]
         if meus_registros_df.empty:
             st.info("Você ainda não possui registros de ponto.")
         else:
-            df_visualizacao = meus_registros_df.sort_values(by=["Data", "Hora"], ascending=False)
-            for _, row in df_visualizacao.iterrows():
+            for _, row in meus_registros_df.iterrows():
                 with st.container(border=True):
                     data_br = datetime.strptime(row['Data'], '%Y-%m-%d').strftime('%d/%m/%Y')
                     diff = row['Diferença (min)']
@@ -112,6 +138,18 @@ def tela_funcionario():
                     col4.markdown(f"Status: **<font color='{cor_diff}'>{texto_diff}</font>**", unsafe_allow_html=True)
                     if row.get('Observação'):
                         st.markdown(f"**Obs:** *{row['Observação']}*")
+            if st.session_state.historico["cursor"] is not None:
+                if st.button("Carregar mais", use_container_width=True):
+                    pagina_df, proximo_cursor = ler_historico_funcionario_df(
+                        st.session_state.user_info['cpf'],
+                        cursor=st.session_state.historico["cursor"],
+                        tamanho_pagina=TAMANHO_PAGINA_HISTORICO,
+                    )
+                    st.session_state.historico = {
+                        "df": pd.concat([meus_registros_df, pagina_df], ignore_index=True),
+                        "cursor": proximo_cursor,
+                    }
+                    st.rerun()
 
 def tela_admin():
     st.title("Painel do Administrador")
@@ -122,37 +160,31 @@ def tela_admin():
         else: st.error(msg)
         st.session_state.status_message = None
 
-    tab1, tab2, tab3, tab4 = st.tabs(["Relatório de Pontos", "Cadastrar Funcionário", "Visualizar Funcionários", "Importar Funcionários"])
+    abas = ["Relatório de Pontos", "Cadastrar Funcionário", "Visualizar Funcionários", "Importar Funcionários", "Importar AFD", "Horários", "Banco de Horas"]
+    # A aba de diagnóstico só existe com METRICS_ENABLED.
+    if metricas.ATIVO: abas.append("Diagnóstico")
+    tabs = st.tabs(abas)
+    tab1, tab2, tab3, tab4, tab5, tab6, tab7 = tabs[:7]
     
     with tab1:
         st.header("Filtros do Relatório")
         
-        funcionarios_df = ler_funcionarios_df()
-        empresas_df = ler_empresas()
+        hierarquia = ler_hierarquia_filtros()
         
         col1_filtros, col2_filtros, col3_filtros, col4_filtros = st.columns(4)
         
         with col1_filtros:
             opcoes_empresas = {0: "Todas as Empresas"}
-            opcoes_empresas.update(dict(zip(empresas_df['id'], empresas_df['nome_empresa'])))
+            opcoes_empresas.update({empresa_id: nome for empresa_id, (nome, _) in hierarquia["empresas"].items()})
             empresa_selecionada_id = st.selectbox("Filtrar por empresa:", options=list(opcoes_empresas.keys()), format_func=lambda x: opcoes_empresas[x])
 
         with col2_filtros:
-            if empresa_selecionada_id != 0:
-                funcionarios_da_empresa = funcionarios_df[funcionarios_df['empresa_id'] == empresa_selecionada_id]
-            else:
-                funcionarios_da_empresa = funcionarios_df[funcionarios_df['role'] == 'employee']
-            
-            filiais = sorted(funcionarios_da_empresa['filial'].dropna().unique())
+            filiais = hierarquia["filiais"].get(empresa_selecionada_id, [])
             filial_selecionada = st.selectbox("Filtrar por filial:", options=["Todas as Filiais"] + filiais)
 
         with col3_filtros:
-            if filial_selecionada != "Todas as Filiais":
-                funcionarios_da_filial = funcionarios_da_empresa[funcionarios_da_empresa['filial'] == filial_selecionada]
-            else:
-                funcionarios_da_filial = funcionarios_da_empresa
-
-            setores = sorted(funcionarios_da_filial['tipo'].dropna().unique())
+            chave_filial = None if filial_selecionada == "Todas as Filiais" else filial_selecionada
+            setores = hierarquia["setores"].get((empresa_selecionada_id, chave_filial), [])
             setor_selecionado = st.selectbox("Filtrar por setor:", options=["Todos os Setores"] + setores)
         
         with col4_filtros:
@@ -162,111 +194,102 @@ def tela_admin():
         st.divider()
         st.header("Relatório de Pontos")
 
-        df_registros = ler_registros_df()
-        df_filtrado = df_registros.copy()
-        
-        if empresa_selecionada_id != 0:
-            df_filtrado = df_filtrado[df_filtrado['Empresa'] == opcoes_empresas[empresa_selecionada_id]]
-        if filial_selecionada != "Todas as Filiais":
-            df_filtrado = df_filtrado[df_filtrado['Filial'] == filial_selecionada]
-        if setor_selecionado != "Todos os Setores":
-            df_filtrado = df_filtrado[df_filtrado['Setor'] == setor_selecionado]
-            
-        if not df_filtrado.empty:
-            df_filtrado['Data_dt'] = pd.to_datetime(df_filtrado['Data'], format='%Y-%m-%d', errors='coerce').dt.date
-            df_filtrado = df_filtrado.dropna(subset=['Data_dt'])
-            df_filtrado = df_filtrado[(df_filtrado['Data_dt'] >= data_inicio) & (df_filtrado['Data_dt'] <= data_fim)]
-        
-        if df_filtrado.empty:
+        filtros = dict(
+            empresa_id=int(empresa_selecionada_id),
+            filial=filial_selecionada if filial_selecionada != "Todas as Filiais" else None,
+            setor=setor_selecionado if setor_selecionado != "Todos os Setores" else None,
+            data_inicio=data_inicio,
+            data_fim=data_fim,
+        )
+        # Em memória e atualizado só com o que mudou; None em filtros grandes demais (leitura paginada).
+        registros_vivos = ler_registros_ao_vivo(**filtros)
+        total_registros = len(registros_vivos) if registros_vivos is not None else contar_registros_filtrados(**filtros)
+
+        if total_registros == 0:
             st.info("Nenhum registro encontrado para os filtros selecionados.")
         else:
             st.subheader("Visualização dos Eventos")
-            df_visualizacao = df_filtrado.sort_values(by=["Data_dt", "Hora"], ascending=False)
-            
-            for index, row in df_visualizacao.iterrows():
-                registro_id = row['ID']
-                with st.container(border=True):
-            # formata data
-                    data_br = row['Data_dt'].strftime('%d/%m/%Y')
+            chave_filtros = repr(sorted(filtros.items()))
+            if st.session_state.filtros_relatorio != chave_filtros:
+                st.session_state.filtros_relatorio = chave_filtros
+                st.session_state.pagina_eventos = 1
 
-            # normaliza filial para inteiro
-                    filial_raw = row['Filial']
-                    try:
-                        filial = int(filial_raw)
-                    except:
-                         m = re.search(r'\d+', str(filial_raw))
-                         filial = int(m.group()) if m else None
-
-            # converte data/hora registradas em datetime
-                    data_evento = datetime.strptime(row['Data'], '%Y-%m-%d').date()
-                    hora_reg    = datetime.strptime(row['Hora'], '%H:%M:%S').time()
-                    dt_reg      = datetime.combine(data_evento, hora_reg)
-
-            # obtém horário padrão (07:30/17:30 para filial 3 e 4)
-                    horario_padrao = get_horario_padrao(filial, row['Descrição'])
-                    dt_pad         = datetime.combine(data_evento, horario_padrao)
-
-            # calcula diferença e status
-                    diff       = round((dt_reg - dt_pad).total_seconds() / 60)
-                    cor_diff   = "green" if diff == 0 else "red" if diff > 0 else "lightgray"
-                    texto_diff = (
-                        "Em ponto"
-                        if diff == 0
-                        else f"{'+' if diff > 0 else ''}{diff} min ({'atrasado' if diff > 0 else 'adiantado'})"
-                    )
+            col_tamanho, col_pagina, col_total = st.columns([1, 1, 2])
+            tamanho_pagina = col_tamanho.selectbox("Eventos por página:", options=[25, 50, 100, 200], index=1)
+            total_paginas = max(1, -(-total_registros // tamanho_pagina))
+            st.session_state.pagina_eventos = min(st.session_state.pagina_eventos, total_paginas)
+            pagina = col_pagina.number_input(f"Página (de {total_paginas}):", min_value=1, max_value=total_paginas, key="pagina_eventos")
+            col_total.caption(f"{total_registros} eventos encontrados.")
 
-            # monta 6 colunas (a última só para o botão Editar)
-                    col1, col2, col3, col4, col5, col6 = st.columns([2, 2, 2, 2, 3, 1])
-                    col1.text(f"Nome: {row['Nome']}")
-                    col2.text(f"Empresa: {row['Empresa']}")
-                    col3.text(f"Evento: {row['Descrição']}")
-                    col4.text(f"Data: {data_br}")
-                    col5.markdown(
-                        f"Hora: {row['Hora']} | Status: <font color='{cor_diff}'>**{texto_diff}**</font>",
-                        unsafe_allow_html=True
-                    )
+            if registros_vivos is not None:
+                inicio = (pagina - 1) * tamanho_pagina
+                df_pagina = registros_vivos.iloc[::-1].iloc[inicio:inicio + tamanho_pagina].reset_index(drop=True)
+            else:
+                df_pagina = ler_registros_filtrados_df(
+                    **filtros, limite=tamanho_pagina, deslocamento=(pagina - 1) * tamanho_pagina, decrescente=True
+                )
+            df_pagina['Status'] = calcular_status(df_pagina, obter_horarios())['Status']
+            df_pagina['Data'] = pd.to_datetime(df_pagina['Data'], format='%Y-%m-%d').dt.strftime('%d/%m/%Y')
+            df_pagina['Observação'] = df_pagina['Observação'].fillna('')
+            df_pagina.insert(0, 'Selecionar', False)
+            colunas_editor = ['ID', 'Selecionar', 'Nome', 'Empresa', 'Descrição', 'Data', 'Hora', 'Status', 'Observação']
+
+            df_editado = st.data_editor(
+                df_pagina[colunas_editor],
+                column_config={
+                    "ID": None,
+                    "Selecionar": st.column_config.CheckboxColumn("✔", help="Recebe a hora/observação da correção em massa abaixo"),
+                    "Descrição": st.column_config.TextColumn("Evento"),
+                    "Hora": st.column_config.TextColumn("Hora (HH:MM:SS)", validate=r"^\d{1,2}:\d{2}:\d{2}$"),
+                    "Observação": st.column_config.TextColumn("Observação"),
+                },
+                disabled=['Nome', 'Empresa', 'Descrição', 'Data', 'Status'],
+                hide_index=True, use_container_width=True,
+                key=f"editor_eventos_{chave_filtros}_{pagina}_{tamanho_pagina}",
+            )
+
+            col_hora_massa, col_obs_massa = st.columns([1, 3])
+            hora_massa = col_hora_massa.text_input("Hora para os selecionados (HH:MM:SS)", key="hora_massa").strip()
+            obs_massa = col_obs_massa.text_input("Observação para os selecionados", key="obs_massa").strip()
+
+            if st.button("Salvar alterações", type="primary"):
+                originais = df_pagina.set_index('ID')
+                alteracoes = []
+                for _, row in df_editado.iterrows():
+                    original = originais.loc[row['ID']]
+                    hora = str(row['Hora']).strip()
+                    obs = str(row['Observação'] or '').strip()
+                    if row['Selecionar']:
+                        hora, obs = hora_massa or hora, obs_massa or obs
+                    horario_mudou = hora != original['Hora'].strip()
+                    obs_mudou = obs != str(original['Observação']).strip()
+                    if horario_mudou or obs_mudou:
+                        alteracoes.append((row['ID'], hora if horario_mudou else None, obs if obs_mudou else None))
+                # Uma transação para a página inteira; o resultado vem linha a linha.
+                resultados = atualizar_registros_em_lote(alteracoes)
+                falhas = [
+                    (originais.loc[id_registro, 'Nome'], originais.loc[id_registro, 'Data'], originais.loc[id_registro, 'Hora'], msg)
+                    for id_registro, msg, tipo in resultados if tipo != "success"
+                ]
+                st.session_state.falhas_correcao = falhas or None
+                if not alteracoes:
+                    st.session_state.status_message = ("Nenhuma alteração a salvar.", "warning")
+                elif falhas:
+                    st.session_state.status_message = (f"{len(alteracoes) - len(falhas)} de {len(alteracoes)} alterações salvas.", "error")
+                else:
+                    st.session_state.status_message = (f"{len(alteracoes)} alterações salvas com sucesso.", "success")
+                st.rerun()
+
+            if st.session_state.falhas_correcao:
+                st.warning("Alterações não salvas:")
+                st.dataframe(pd.DataFrame(st.session_state.falhas_correcao, columns=["Nome", "Data", "Hora", "Motivo"]),
+                             use_container_width=True, hide_index=True)
+                st.session_state.falhas_correcao = None
 
-            # botão de Editar
-                    if col6.button("Editar", key=f"edit_{registro_id}_{index}"):
-                       st.session_state.edit_id = registro_id
-                       st.experimental_rerun()
-                            
-                    if st.session_state.edit_id == registro_id:
-                        edit_col1, edit_col2 = st.columns(2)
-                        with edit_col1: novo_horario = st.text_input("Nova Hora (HH:MM:SS):", value=row['Hora'], key=f"hora_{registro_id}")
-                        with edit_col2: nova_obs = st.text_area("Observação:", value=row.get('Observação', ''), key=f"obs_{registro_id}")
-                        col_save, col_cancel, _ = st.columns([1, 1, 5])
-                        if col_save.button("Salvar", key=f"save_{registro_id}", type="primary"):
-                            horario_mudou, obs_mudou = novo_horario.strip() != row['Hora'].strip(), nova_obs.strip() != str(row.get('Observação', '')).strip()
-                            if horario_mudou or obs_mudou:
-                                horario_para_atualizar, obs_para_atualizar = (novo_horario.strip() if horario_mudou else None), (nova_obs.strip() if obs_mudou else None)
-                                msg, tipo = atualizar_registro(registro_id, novo_horario=horario_para_atualizar, nova_observacao=obs_para_atualizar)
-                                st.session_state.status_message = (msg, tipo)
-                            st.session_state.edit_id = None
-                            st.rerun()
-                        if col_cancel.button("Cancelar", key=f"cancel_{registro_id}"):
-                            st.session_state.edit_id = None
-                            st.rerun()
-                    elif row.get('Observação'): st.markdown(f"**Obs:** *{row['Observação']}*")
-            
             st.divider()
             st.subheader("Exportar Relatório Completo")
-            
-            if empresa_selecionada_id != 0:
-                empresa_info = empresas_df[empresas_df['id'] == empresa_selecionada_id].iloc[0]
-                nome_empresa_relatorio = empresa_info['nome_empresa']
-                cnpj_relatorio = empresa_info['cnpj']
-            else:
-                nome_empresa_relatorio = "Todas as Empresas"
-                cnpj_relatorio = None
 
-            df_organizado = gerar_relatorio_organizado_df(df_filtrado)
-            df_bruto = df_filtrado.sort_values(by=["Data_dt", "Hora"]).copy()
-            df_bruto['Data'] = pd.to_datetime(df_bruto['Data']).dt.strftime('%d/%m/%Y')
-            
-            excel_buffer = gerar_arquivo_excel(df_organizado, df_bruto.drop(columns=['Data_dt']), nome_empresa_relatorio, cnpj_relatorio, data_inicio, data_fim)
-            
-            st.download_button(label="📥 Baixar Relatório Filtrado em Excel", data=excel_buffer, file_name=f"relatorio_ponto_filtrado.xlsx", mime="application/vnd.openxmlformats-officedocument-spreadsheetml.sheet", use_container_width=True)
+            tela_exportacao(filtros, chave_filtros)
 
     with tab2:
         st.header("Cadastrar Novo Funcionário")
@@ -326,7 +349,7 @@ def tela_admin():
 
     with tab4:
         st.header("Importar Funcionários em Lote via CSV")
-        st.info("O arquivo CSV precisa ter as colunas: `Arquivo`, `Empresa`, `CNPJ`, `CodTipo`, `Tipo`, `CodForte`, `Nome` e `CPF`. O CPF será o usuário e o Código Forte a senha.")
+        st.info("O arquivo CSV precisa ter as colunas: `Arquivo`, `Empresa`, `CNPJ`, `CodTipo`, `Tipo`, `CodForte`, `Nome` e `CPF` (e, opcionalmente, `PIS`, usado na importação de AFD). O CPF será o usuário e o Código Forte a senha.")
         arquivo_csv = st.file_uploader("Selecione o arquivo CSV", type=["csv"])
         if st.button("Iniciar Importação", type="primary", use_container_width=True):
             if arquivo_csv:
@@ -345,6 +368,192 @@ def tela_admin():
             else:
                 st.warning("Por favor, selecione um arquivo CSV.")
 
+    with tab5:
+        st.header("Importar Marcações do Relógio (AFD)")
+        st.info("Envie o arquivo AFD exportado do relógio REP (Portaria 1510 ou 671). As marcações são casadas pelo PIS (cadastrado na importação de funcionários) ou pelo CPF; marcações já existentes são ignoradas, então o mesmo arquivo pode ser reenviado.")
+        arquivo_afd = st.file_uploader("Selecione o arquivo AFD", type=["txt", "afd"])
+        if st.button("Importar Marcações", type="primary", use_container_width=True):
+            if arquivo_afd:
+                with st.spinner("Importando marcações..."):
+                    try:
+                        resumo = importar_afd(arquivo_afd)
+                    except Exception as e:
+                        resumo = None
+                        st.error(f"Erro ao importar o arquivo: {e}")
+                if resumo:
+                    col1, col2, col3, col4 = st.columns(4)
+                    col1.metric("Marcações no arquivo", resumo["marcacoes"])
+                    col2.metric("Importadas", resumo["importadas"])
+                    col3.metric("Já existentes", resumo["duplicadas"])
+                    col4.metric("Rejeitadas", resumo["rejeitadas"])
+                    velocidade = resumo["linhas"] / resumo["segundos"] if resumo["segundos"] else 0
+                    st.caption(f"{resumo['linhas']} linhas lidas em {resumo['segundos']:.1f}s ({velocidade:,.0f} linhas/s).")
+                    if resumo["rejeicoes"]:
+                        st.warning(f"{resumo['rejeitadas']} marcações rejeitadas (mostrando até {len(resumo['rejeicoes'])}).")
+                        st.dataframe(pd.DataFrame(resumo["rejeicoes"], columns=["Linha", "Motivo", "Conteúdo"]),
+                                     use_container_width=True, hide_index=True)
+            else:
+                st.warning("Por favor, selecione um arquivo AFD.")
+
+    with tab6:
+        tela_horarios()
+
+    with tab7:
+        tela_banco_horas()
+
+    if metricas.ATIVO:
+        with tabs[7]:
+            tela_diagnostico()
+
+DIAS_SEMANA = {0: "Todos os dias", 1: "Segunda", 2: "Terça", 3: "Quarta", 4: "Quinta", 5: "Sexta", 6: "Sábado", 7: "Domingo"}
+
+FORMATOS_EXPORTACAO = {"xlsx": "Relatório em Excel", "csv": "Eventos brutos (CSV)", "parquet": "Eventos brutos (Parquet)"}
+MIMES_EXPORTACAO = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+def tela_exportacao(filtros, chave_filtros):
+    formato = st.radio("Formato", list(FORMATOS_EXPORTACAO), format_func=FORMATOS_EXPORTACAO.get, horizontal=True, key="formato_exportacao")
+    if st.button("Gerar Exportação", use_container_width=True):
+        # Com os mesmos filtros e nada alterado no banco, volta o arquivo já gerado.
+        st.session_state.exportacao = {"filtros": chave_filtros, "formato": formato, "trabalho": solicitar_exportacao(formato, **filtros)}
+    exportacao = st.session_state.exportacao
+    if exportacao is None or exportacao["filtros"] != chave_filtros or exportacao["formato"] != formato:
+        return
+    trabalho = exportacao["trabalho"]
+    # Enquanto gera, só o fragmento se repete (a cada segundo), não a página inteira.
+    st.fragment(acompanhar_exportacao, run_every=None if trabalho.terminado else 1)(trabalho, formato, not trabalho.terminado)
+
+def acompanhar_exportacao(trabalho, formato, acompanhando):
+    if acompanhando and trabalho.terminado:
+        st.rerun()
+    if trabalho.estado == "erro":
+        st.error(f"Falha na exportação: {trabalho.erro}")
+    elif not trabalho.terminado:
+        st.progress(trabalho.progresso, text=f"Exportação {trabalho.estado}... {trabalho.progresso:.0%}")
+    elif os.path.exists(trabalho.caminho):
+        with open(trabalho.caminho, "rb") as arquivo:
+            st.download_button(label=f"📥 Baixar {FORMATOS_EXPORTACAO[formato]}", data=arquivo, file_name=f"relatorio_ponto_filtrado.{formato}",
+                               mime=MIMES_EXPORTACAO[formato], use_container_width=True)
+    else:
+        st.warning("O arquivo gerado já foi removido do cache; gere a exportação de novo.")
+
+def tela_horarios():
+    st.header("Horários Previstos")
+    st.info("Vale a regra mais específica: funcionário (CPF), depois empresa/filial/setor combinados, e por fim a regra sem escopo. No mesmo escopo, uma regra de dia da semana vence a de todos os dias. Filiais são comparadas pelo número (\"Filial 3\" = \"Filial 03\").")
+    horarios_df = ler_horarios_df()
+    if horarios_df.empty:
+        st.warning("Nenhum horário cadastrado: as batidas entram sem diferença.")
+    else:
+        df_exibicao = horarios_df.copy()
+        df_exibicao['Dia da Semana'] = df_exibicao['Dia da Semana'].fillna(0).astype(int).map(DIAS_SEMANA)
+        df_exibicao['Hora'] = df_exibicao['Hora'].astype(str)
+        df_exibicao['Excluir?'] = False
+        editado = st.data_editor(
+            df_exibicao,
+            column_config={"ID": None, "Excluir?": st.column_config.CheckboxColumn("Excluir?", default=False)},
+            disabled=[coluna for coluna in df_exibicao.columns if coluna != 'Excluir?'],
+            hide_index=True, use_container_width=True, key="editor_horarios",
+        )
+        marcados = editado[editado['Excluir?']]
+        if not marcados.empty and st.button(f"Excluir {len(marcados)} horário(s)", type="primary"):
+            resultados = [(id_horario, *excluir_horario(id_horario)) for id_horario in marcados['ID']]
+            falhas = [f"Horário {id_horario}: {msg}" for id_horario, msg, tipo in resultados if tipo != "success"]
+            if falhas:
+                excluidos = len(resultados) - len(falhas)
+                st.session_state.status_message = (f"{excluidos} de {len(resultados)} horário(s) excluído(s). " + " | ".join(falhas), "error")
+            else:
+                st.session_state.status_message = (f"{len(resultados)} horário(s) excluído(s).", "success")
+            st.rerun()
+
+    st.subheader("Adicionar Horário")
+    empresas_df = ler_empresas()
+    opcoes_empresas = {0: "Todas as Empresas"}
+    opcoes_empresas.update(dict(zip(empresas_df['id'], empresas_df['nome_empresa'])))
+    with st.form("add_horario_form", clear_on_submit=True):
+        col1, col2 = st.columns(2)
+        evento = col1.selectbox("Evento", ["Entrada", "Saída"])
+        hora = col2.text_input("Hora (HH:MM:SS)")
+        empresa_id = col1.selectbox("Empresa", options=list(opcoes_empresas.keys()), format_func=lambda x: opcoes_empresas[x])
+        filial = col2.text_input("Filial (vazio = todas)")
+        setor = col1.text_input("Setor (vazio = todos)")
+        cpf = col2.text_input("CPF do funcionário (vazio = todos)")
+        dia_semana = col1.selectbox("Dia da semana", options=list(DIAS_SEMANA.keys()), format_func=lambda x: DIAS_SEMANA[x])
+        vigencia = col2.date_input("Vigência (vazio = sempre)", value=[], format="DD/MM/YYYY")
+        if st.form_submit_button("Adicionar Horário"):
+            vigente_de = vigencia[0] if len(vigencia) > 0 else None
+            vigente_ate = vigencia[1] if len(vigencia) > 1 else None
+            msg, tipo = adicionar_horario(evento, hora, empresa_id, filial, setor, cpf, dia_semana, vigente_de, vigente_ate)
+            st.session_state.status_message = (msg, tipo)
+            st.rerun()
+
+def tela_banco_horas():
+    st.header("Banco de Horas")
+    st.info("Saldo do dia = diferença da Saída menos a da Entrada em relação ao horário previsto, já com a tolerância. Meses fechados ficam gravados; correções de ponto num mês fechado atualizam o fechamento daquele funcionário.")
+    hierarquia = ler_hierarquia_filtros()
+    opcoes_empresas = {0: "Todas as Empresas"}
+    opcoes_empresas.update({empresa_id: nome for empresa_id, (nome, _) in hierarquia["empresas"].items()})
+    empresa_id = st.selectbox("Empresa:", options=list(opcoes_empresas.keys()), format_func=lambda x: opcoes_empresas[x], key="banco_horas_empresa")
+    saldos_df = ler_banco_horas_df(empresa_id=empresa_id)
+    if saldos_df.empty:
+        st.info("Nenhum funcionário encontrado.")
+    else:
+        st.dataframe(saldos_df, use_container_width=True, hide_index=True)
+
+    mes_passado = (date.today().replace(day=1) - timedelta(days=1)).replace(day=1)
+    col1, col2 = st.columns(2)
+    with col1.form("fechar_banco_horas_form"):
+        st.subheader("Fechar Meses")
+        ate_mes = st.date_input("Fechar até o mês de", value=mes_passado, max_value=mes_passado, format="DD/MM/YYYY")
+        if st.form_submit_button("Fechar"):
+            st.session_state.status_message = fechar_banco_horas(ate_mes)
+            st.rerun()
+    with col2.form("reabrir_banco_horas_form"):
+        st.subheader("Reabrir Meses")
+        a_partir_de = st.date_input("Reabrir a partir do mês de", value=mes_passado, format="DD/MM/YYYY")
+        cpf = st.text_input("CPF do funcionário (vazio = todos)")
+        if st.form_submit_button("Reabrir"):
+            st.session_state.status_message = reabrir_banco_horas(a_partir_de, cpf.strip() or None)
+            st.rerun()
+
+def tela_diagnostico():
+    st.header("Diagnóstico de Desempenho")
+    reruns = metricas.reruns_recentes()
+    if reruns:
+        df_reruns = pd.DataFrame(reruns)
+        df_reruns['momento'] = pd.to_datetime(df_reruns['momento'], unit='s').dt.strftime('%H:%M:%S')
+        for coluna in ['segundos_total', 'segundos_sql', 'segundos_servicos', 'segundos_restante']:
+            df_reruns[coluna.replace('segundos_', '') + ' (ms)'] = (df_reruns.pop(coluna) * 1000).round(1)
+        st.subheader("Reruns recentes")
+        st.caption("'restante' é o tempo fora de services.py: pandas da própria tela e renderização dos widgets.")
+        st.dataframe(df_reruns, use_container_width=True, hide_index=True)
+
+    st.subheader("Consultas mais lentas (tempo total)")
+    consultas = metricas.consultas_mais_lentas()
+    if consultas:
+        st.dataframe(pd.DataFrame(consultas).round(2), use_container_width=True, hide_index=True)
+    else:
+        st.info("Nenhuma consulta registrada ainda.")
+
+    st.subheader("Funções de services.py mais lentas (tempo total)")
+    funcoes = metricas.funcoes_mais_lentas()
+    if funcoes:
+        st.dataframe(pd.DataFrame(funcoes).round(2), use_container_width=True, hide_index=True)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Pool de conexões")
+        st.json(obter_estatisticas_pool())
+    with col2:
+        st.subheader("Cache de leituras")
+        st.json(obter_estatisticas_cache())
+
+    st.download_button("📥 Baixar métricas (Prometheus)", data=metricas.texto_prometheus(), file_name="metricas_ponto.prom", mime="text/plain")
+
+metricas.iniciar_rerun((st.session_state.user_info or {}).get("role", "login"))
+
 if st.session_state.user_info:
     st.sidebar.image("assets/logo.png", use_container_width=True)
     if st.sidebar.button("Sair"):
@@ -355,4 +564,6 @@ if st.session_state.user_info:
     else:
         tela_funcionario()
 else:
-    tela_de_login()
\ No newline at end of file
+    tela_de_login()
+
+metricas.finalizar_rerun()
@@ -0,0 +1,290 @@
+"""Backend PostgreSQL: pool de conexões, migrações versionadas e partições mensais."""
+import atexit
+import csv
+import io
+import select
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+import metricas
+import particoes
+import resumo_diario
+from config import (
+    POOL_MIN_CONEXOES, POOL_MAX_CONEXOES, POOL_TIMEOUT_SEGUNDOS,
+    POOL_OCIOSO_MAX_SEGUNDOS, POOL_IDADE_MAX_SEGUNDOS, POOL_PING_APOS_SEGUNDOS,
+)
+from migrations import aplicar_migracoes
+from pool import ConnectionPool
+
+
+# Canal de NOTIFY das escritas em registros.
+CANAL_REGISTROS = "registros"
+
+
+class ArmazenamentoPostgres:
+    nome = "postgresql"
+    Erro = psycopg2.Error
+
+    # data/hora são DATE/TIME no banco; saem como texto para manter o formato do DataFrame.
+    SELECT_REGISTROS = "SELECT r.id, f.codigo, r.nome, to_char(r.data, 'YYYY-MM-DD') AS data, to_char(r.hora, 'HH24:MI:SS') AS hora, r.descricao, r.diferenca_min, r.observacao, e.nome_empresa, e.cnpj, f.tipo as setor, f.filial FROM registros r JOIN funcionarios f ON r.cpf_funcionario = f.cpf LEFT JOIN empresas e ON f.empresa_id = e.id"
+
+    # Mesmo valor que o gatilho registros_marcar_versao grava (ver migrations._v8_registros_versao).
+    NOVA_VERSAO_REGISTROS = "pg_current_xact_id()::text::bigint"
+
+    SELECT_RELATORIO_DIARIO = """
+        SELECT to_char(r.data, 'DD/MM/YYYY') AS data, f.codigo, r.nome, e.nome_empresa, e.cnpj,
+               r.entrada, r.saida, r.minutos_trabalhados * 60 AS segundos,
+               COALESCE(r.observacoes, '') AS observacao
+        FROM registros_diarios r JOIN funcionarios f ON r.cpf_funcionario = f.cpf JOIN empresas e ON f.empresa_id = e.id
+        {filtro}
+        ORDER BY r.data, f.codigo COLLATE "C", r.nome COLLATE "C", e.nome_empresa COLLATE "C", e.cnpj COLLATE "C"
+    """
+
+    def __init__(self, url):
+        url = urlparse(url)
+        self._conn_string = f"dbname={url.path[1:]} user={url.username} password={url.password} host={url.hostname} port={url.port}"
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        # Meses cuja partição de registros este processo já sabe que existe.
+        self._meses_com_particao = set()
+
+    def _obter_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ConnectionPool(
+                        self._conn_string,
+                        minimo=POOL_MIN_CONEXOES,
+                        maximo=POOL_MAX_CONEXOES,
+                        timeout=POOL_TIMEOUT_SEGUNDOS,
+                        ocioso_maximo=POOL_OCIOSO_MAX_SEGUNDOS,
+                        idade_maxima=POOL_IDADE_MAX_SEGUNDOS,
+                        ping_apos=POOL_PING_APOS_SEGUNDOS,
+                        connection_factory=metricas.fabrica_conexao(),
+                    )
+                    atexit.register(self._pool.fechar)
+        return self._pool
+
+    @contextmanager
+    def conexao(self):
+        pool = self._obter_pool()
+        conn = pool.obter()
+        try:
+            yield conn
+        finally:
+            # Transações não confirmadas são desfeitas na devolução, como no close() de antes.
+            pool.devolver(conn)
+
+    def estatisticas(self):
+        return self._obter_pool().estatisticas()
+
+    def preparar(self):
+        self._obter_pool().preencher()
+
+    def migrar(self, conn):
+        return aplicar_migracoes(conn)
+
+    # ------------------------------------------------------------------ #
+    def garantir_particoes(self, cursor, data_inicio, data_fim):
+        particoes.garantir_particoes(cursor, data_inicio, data_fim)
+
+    def garantir_particao_do_mes(self, conn, dia):
+        # Rede de segurança para processos que ficam no ar além das partições
+        # criadas pelo init_db; custa uma consulta por mês por processo.
+        mes = particoes.inicio_do_mes(dia)
+        if mes in self._meses_com_particao:
+            return
+        with conn.cursor() as cursor:
+            particoes.garantir_particoes(cursor, mes, mes)
+        conn.commit()
+        self._meses_com_particao.add(mes)
+
+    def arquivar_registros(self, conn, anteriores_a, diretorio, simular=False):
+        return particoes.arquivar_particoes(conn, anteriores_a, diretorio, simular=simular)
+
+    def recalcular_dias(self, cursor, dias):
+        resumo_diario.recalcular_dias(cursor, dias)
+
+    def reconstruir_dias(self, cursor, data_inicio=None, data_fim=None):
+        return resumo_diario.reconstruir_periodo(cursor, data_inicio, data_fim)
+
+    # ------------------------------------------------------------------ #
+    def criar_temporaria(self, cursor, nome, colunas):
+        """Tabela temporária que some no fim da transação."""
+        cursor.execute(f"CREATE TEMP TABLE {nome} ({colunas}) ON COMMIT DROP")
+
+    def copiar(self, cursor, tabela, colunas, df):
+        """Carrega as linhas de `df` (na ordem de `colunas`) em `tabela` por COPY."""
+        buffer = io.StringIO()
+        df.to_csv(buffer, index=False, header=False, quoting=csv.QUOTE_NONNUMERIC)
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY {tabela} ({', '.join(colunas)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+    def copiar_registros(self, cursor, colunas, df):
+        """Carrega `df` em registros por COPY; a versao vem do DEFAULT da coluna."""
+        self.copiar(cursor, "registros", colunas, df)
+
+    def inserir_linhas(self, cursor, tabela, colunas, linhas, tamanho_pagina=1000):
+        """Insere as tuplas de `linhas` em `tabela` com INSERTs de várias linhas (None vira NULL, ao contrário do COPY em CSV)."""
+        execute_values(cursor, f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES %s", linhas, page_size=tamanho_pagina)
+
+    def iterar(self, conn, query, params, tamanho_bloco):
+        """Gera `(colunas, linhas)` em blocos de até `tamanho_bloco`, por um cursor nomeado (server-side)."""
+        with conn.cursor(name=f"exportacao_{threading.get_ident()}") as cursor:
+            cursor.itersize = tamanho_bloco
+            cursor.execute(query, params)
+            colunas = None
+            while True:
+                linhas = cursor.fetchmany(tamanho_bloco)
+                if colunas is None:
+                    colunas = [d[0] for d in cursor.description]
+                if not linhas:
+                    break
+                yield colunas, linhas
+
+    # ------------------------------------------------------------------ #
+    def reservar_evento(self, cursor, cpf, data, maximo):
+        """Reserva o próximo evento do dia; retorna `(número do evento, filial, setor, empresa)` ou None se o dia já está completo.
+
+        A linha de `pontos_dia` fica travada até o commit.
+        """
+        cursor.execute(
+            """
+            WITH vaga AS (
+                INSERT INTO pontos_dia (cpf_funcionario, data, eventos) VALUES (%(cpf)s, %(data)s, 1)
+                ON CONFLICT (cpf_funcionario, data)
+                DO UPDATE SET eventos = pontos_dia.eventos + 1 WHERE pontos_dia.eventos < %(max)s
+                RETURNING eventos
+            )
+            SELECT v.eventos, f.filial, f.tipo, e.nome_empresa
+              FROM vaga v
+              LEFT JOIN funcionarios f ON f.cpf = %(cpf)s
+              LEFT JOIN empresas e ON e.id = f.empresa_id
+            """,
+            {"cpf": cpf, "data": data, "max": maximo}
+        )
+        return cursor.fetchone()
+
+    def ordenar_marcacoes(self, cursor):
+        """Numera as marcações de `afd_marcacoes` dentro do dia, depois das já registradas.
+
+        Descarta antes as que já existem em `registros`. Retorna
+        `(duplicadas, linhas)` com linhas `(linha, cpf, data, 'HH:MM:SS', ordem)`.
+        """
+        # Reimportar o mesmo arquivo (ou uma marcação já batida no app) não duplica nada.
+        cursor.execute('''
+            DELETE FROM afd_marcacoes a USING registros r
+             WHERE r.cpf_funcionario = a.cpf AND r.data = a.data AND r.hora = a.hora
+        ''')
+        duplicadas = cursor.rowcount
+
+        # Mesma serialização de bater_ponto: a linha de pontos_dia de cada dia
+        # fica travada até o commit, e a ordem do evento continua a contagem dela.
+        cursor.execute('''
+            INSERT INTO pontos_dia (cpf_funcionario, data, eventos)
+            SELECT DISTINCT cpf, data, 0 FROM afd_marcacoes
+            ON CONFLICT (cpf_funcionario, data) DO NOTHING
+        ''')
+        cursor.execute('''
+            SELECT 1 FROM pontos_dia p
+             WHERE (p.cpf_funcionario, p.data) IN (SELECT cpf, data FROM afd_marcacoes)
+             ORDER BY p.cpf_funcionario, p.data
+               FOR UPDATE
+        ''')
+        cursor.execute('''
+            SELECT a.linha, a.cpf, a.data, to_char(a.hora, 'HH24:MI:SS'),
+                   p.eventos + row_number() OVER (PARTITION BY a.cpf, a.data ORDER BY a.hora, a.nsr)
+              FROM afd_marcacoes a
+              JOIN pontos_dia p ON p.cpf_funcionario = a.cpf AND p.data = a.data
+        ''')
+        return duplicadas, cursor.fetchall()
+
+    def somar_eventos_dia(self, cursor, cpfs, datas, quantidades):
+        cursor.execute('''
+            UPDATE pontos_dia p SET eventos = p.eventos + n.quantidade
+              FROM unnest(%s::text[], %s::date[], %s::int[]) AS n(cpf, data, quantidade)
+             WHERE p.cpf_funcionario = n.cpf AND p.data = n.data
+        ''', (cpfs, datas, quantidades))
+
+    def inserir_funcionarios_importados(self, cursor):
+        """Passa `importacao_funcionarios` para empresas/funcionarios. Retorna os funcionários inseridos."""
+        # Empresa nova entra com o CNPJ da primeira linha em que aparece.
+        cursor.execute('''
+            INSERT INTO empresas (nome_empresa, cnpj)
+            SELECT DISTINCT ON (lower(i.empresa)) i.empresa, i.cnpj
+              FROM importacao_funcionarios i
+             WHERE NOT EXISTS (SELECT 1 FROM empresas e WHERE lower(e.nome_empresa) = lower(i.empresa))
+             ORDER BY lower(i.empresa), i.linha
+            ON CONFLICT (nome_empresa) DO NOTHING
+        ''')
+        cursor.execute('''
+            INSERT INTO funcionarios (cpf, codigo, nome, senha, role, empresa_id, cod_tipo, tipo, filial, pis)
+            SELECT i.cpf, i.codigo, i.nome, i.senha, 'employee', e.id, i.cod_tipo, i.tipo, i.filial, NULLIF(i.pis, '')
+              FROM importacao_funcionarios i
+             CROSS JOIN LATERAL (
+                   SELECT id FROM empresas WHERE lower(nome_empresa) = lower(i.empresa) ORDER BY id LIMIT 1
+             ) e
+             ORDER BY i.linha
+            ON CONFLICT DO NOTHING
+        ''')
+        return cursor.rowcount
+
+    # ------------------------------------------------------------------ #
+    def marca_registros(self, cursor):
+        """`(geração, posição)`: as linhas gravadas ou alteradas depois daqui terão `versao >= posição`.
+
+        A posição é o xmin do snapshot: transações ainda abertas têm id maior
+        ou igual a ele, então o que elas gravarem não escapa (ao custo de
+        reler o que já tinham gravado).
+        """
+        cursor.execute("SELECT (SELECT valor FROM registros_geracao), pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+        return tuple(cursor.fetchone())
+
+    def avisar_registros(self, cursor, motivo):
+        """NOTIFY no canal de registros; só é entregue no commit da transação de `cursor`."""
+        cursor.execute("SELECT pg_notify(%s, %s)", (CANAL_REGISTROS, motivo))
+
+    def escutar_registros(self, ao_receber):
+        """LISTEN numa thread com conexão própria; chama `ao_receber(motivo)` a cada aviso.
+
+        Também chama `ao_receber(None)` a cada (re)conexão, porque avisos
+        enviados com a escuta caída se perdem. Retorna um `threading.Event`
+        ligado enquanto a escuta está conectada.
+        """
+        conectada = threading.Event()
+
+        def escutar():
+            espera = 1
+            while True:
+                conn = None
+                try:
+                    conn = psycopg2.connect(self._conn_string)
+                    conn.autocommit = True
+                    with conn.cursor() as cursor:
+                        cursor.execute(f"LISTEN {CANAL_REGISTROS}")
+                    conectada.set()
+                    espera = 1
+                    ao_receber(None)
+                    while True:
+                        if select.select([conn], [], [], 60) == ([], [], []):
+                            # Sem tráfego há um minuto: confirma que a conexão continua viva.
+                            with conn.cursor() as cursor:
+                                cursor.execute("SELECT 1")
+                        conn.poll()
+                        while conn.notifies:
+                            ao_receber(conn.notifies.pop(0).payload)
+                except (psycopg2.Error, OSError):
+                    conectada.clear()
+                    time.sleep(espera)
+                    espera = min(espera * 2, 60)
+                finally:
+                    if conn is not None:
+                        conn.close()
+
+        threading.Thread(target=escutar, name="escuta-registros", daemon=True).start()
+        return conectada
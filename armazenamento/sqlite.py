@@ -0,0 +1,568 @@
+"""Backend SQLite embutido, para instalações de uma filial só, sem servidor de banco.
+
+O esquema é o mesmo do PostgreSQL na versão 9 de migrations.py, sem
+partições: `registros` é uma tabela comum e o arquivamento apaga os meses
+antigos depois de gravá-los em .csv.gz. O banco roda em WAL, então leituras
+não esperam a escrita; as escritas são serializadas pelo próprio SQLite
+(cada transação abre com BEGIN IMMEDIATE), o que faz o papel do upsert com
+trava de `pontos_dia` do PostgreSQL. Não há LISTEN/NOTIFY: quem acompanha
+`registros` consulta as linhas novas a cada leitura. DATE e TIME ficam como texto ISO
+('AAAA-MM-DD', 'HH:MM:SS') e voltam como `date`/`time`.
+
+As consultas SQL não passam pela instrumentação de metricas.py (que é do
+psycopg2); as funções de services.py continuam medidas.
+"""
+import csv
+import gzip
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, time
+from functools import lru_cache
+from urllib.parse import urlparse
+
+import horarios
+import particoes
+from config import POOL_TIMEOUT_SEGUNDOS
+
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(time, time.isoformat)
+sqlite3.register_converter("DATE", lambda valor: date.fromisoformat(valor.decode()))
+sqlite3.register_converter("TIME", lambda valor: time.fromisoformat(valor.decode()))
+
+_PARAMETRO = re.compile(r"%\((\w+)\)s|%s|%%")
+
+
+@lru_cache(maxsize=512)
+def _estilo_sqlite(sql):
+    """`%s` -> `?`, `%(nome)s` -> `:nome` e `%%` -> `%` (estilo do psycopg2 para o do sqlite3)."""
+    def trocar(encontrado):
+        if encontrado.group(1):
+            return ":" + encontrado.group(1)
+        return "?" if encontrado.group(0) == "%s" else "%"
+    return _PARAMETRO.sub(trocar, sql)
+
+
+class _Cursor(sqlite3.Cursor):
+    def execute(self, sql, parametros=()):
+        return super().execute(_estilo_sqlite(sql), parametros)
+
+    def executemany(self, sql, parametros):
+        return super().executemany(_estilo_sqlite(sql), parametros)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        self.close()
+
+
+class _Conexao(sqlite3.Connection):
+    def cursor(self, factory=_Cursor):
+        return super().cursor(factory)
+
+
+def _v1_esquema(cursor):
+    cursor.execute('CREATE TABLE IF NOT EXISTS empresas (id INTEGER PRIMARY KEY, nome_empresa TEXT NOT NULL UNIQUE, cnpj TEXT)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS funcionarios (
+            cpf TEXT PRIMARY KEY,
+            codigo TEXT NOT NULL,
+            nome TEXT NOT NULL,
+            senha TEXT NOT NULL,
+            role TEXT NOT NULL,
+            empresa_id INTEGER,
+            cod_tipo TEXT,
+            tipo TEXT,
+            filial TEXT,
+            pis TEXT,
+            FOREIGN KEY (empresa_id) REFERENCES empresas (id)
+        )
+    ''')
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_funcionarios_pis ON funcionarios (pis) WHERE pis IS NOT NULL")
+    # Mesma ordem de colunas da tabela particionada do PostgreSQL (e dos arquivos .csv.gz).
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS registros (
+            id INTEGER PRIMARY KEY,
+            cpf_funcionario TEXT NOT NULL,
+            nome TEXT NOT NULL,
+            descricao TEXT NOT NULL,
+            diferenca_min INTEGER NOT NULL,
+            observacao TEXT,
+            data DATE NOT NULL,
+            hora TIME NOT NULL,
+            FOREIGN KEY (cpf_funcionario) REFERENCES funcionarios (cpf)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_registros_cpf_data ON registros (cpf_funcionario, data)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_registros_data ON registros (data)")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pontos_dia (
+            cpf_funcionario TEXT NOT NULL,
+            data DATE NOT NULL,
+            eventos INTEGER NOT NULL,
+            PRIMARY KEY (cpf_funcionario, data),
+            FOREIGN KEY (cpf_funcionario) REFERENCES funcionarios (cpf)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS registros_diarios (
+            cpf_funcionario TEXT NOT NULL,
+            data DATE NOT NULL,
+            nome TEXT NOT NULL,
+            entrada TIME,
+            saida TIME,
+            minutos_trabalhados INTEGER,
+            diferenca_entrada_min INTEGER,
+            diferenca_saida_min INTEGER,
+            observacoes TEXT,
+            eventos INTEGER NOT NULL,
+            atualizado_em TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (cpf_funcionario, data),
+            FOREIGN KEY (cpf_funcionario) REFERENCES funcionarios (cpf)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_registros_diarios_data ON registros_diarios (data)")
+
+
+def _v2_horarios(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS horarios (
+            id INTEGER PRIMARY KEY,
+            empresa_id INTEGER REFERENCES empresas (id),
+            filial TEXT,
+            setor TEXT,
+            cpf_funcionario TEXT REFERENCES funcionarios (cpf),
+            dia_semana INTEGER CHECK (dia_semana BETWEEN 1 AND 7),
+            evento TEXT NOT NULL,
+            hora TIME NOT NULL,
+            vigente_de DATE,
+            vigente_ate DATE,
+            CHECK (vigente_de IS NULL OR vigente_ate IS NULL OR vigente_de <= vigente_ate)
+        )
+    ''')
+    cursor.execute("SELECT COUNT(*) FROM horarios")
+    if cursor.fetchone()[0] == 0:
+        cursor.executemany("INSERT INTO horarios (filial, evento, hora) VALUES (%s, %s, %s)", horarios.regras_iniciais())
+
+
+def _v3_registros_versao(cursor):
+    cursor.execute("ALTER TABLE registros ADD COLUMN versao INTEGER")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_registros_versao ON registros (versao)")
+    # Sem id de transação: um contador (MAX + 1). As escritas são serializadas,
+    # então ele cresce na ordem dos commits. A troca de versao não dispara o
+    # segundo gatilho, que só olha as demais colunas.
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS registros_versao_insercao AFTER INSERT ON registros BEGIN
+            UPDATE registros SET versao = (SELECT COALESCE(MAX(versao), 0) + 1 FROM registros) WHERE id = NEW.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS registros_versao_alteracao
+        AFTER UPDATE OF cpf_funcionario, nome, data, hora, descricao, diferenca_min, observacao ON registros BEGIN
+            UPDATE registros SET versao = (SELECT COALESCE(MAX(versao), 0) + 1 FROM registros) WHERE id = NEW.id;
+        END
+    ''')
+    cursor.execute("CREATE TABLE IF NOT EXISTS registros_geracao (valor INTEGER NOT NULL)")
+    cursor.execute("INSERT INTO registros_geracao (valor) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM registros_geracao)")
+
+
+def _v4_banco_horas(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS banco_horas (
+            cpf_funcionario TEXT NOT NULL REFERENCES funcionarios (cpf),
+            mes DATE NOT NULL,
+            saldo_min INTEGER NOT NULL,
+            acumulado_min INTEGER NOT NULL,
+            dias INTEGER NOT NULL,
+            fechado_em TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (cpf_funcionario, mes)
+        )
+    ''')
+
+
+def _v5_versao_por_instrucao(cursor):
+    # Cargas em massa (copiar_registros, correções em lote) já gravam a versão
+    # na própria instrução; os gatilhos só cobrem as escritas de uma linha que
+    # não a informam, sem um UPDATE a mais por linha inserida.
+    cursor.execute("DROP TRIGGER IF EXISTS registros_versao_insercao")
+    cursor.execute("DROP TRIGGER IF EXISTS registros_versao_alteracao")
+    cursor.execute('''
+        CREATE TRIGGER registros_versao_insercao AFTER INSERT ON registros WHEN NEW.versao IS NULL BEGIN
+            UPDATE registros SET versao = (SELECT COALESCE(MAX(versao), 0) + 1 FROM registros) WHERE id = NEW.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER registros_versao_alteracao
+        AFTER UPDATE OF cpf_funcionario, nome, data, hora, descricao, diferenca_min, observacao ON registros
+        WHEN NEW.versao IS OLD.versao BEGIN
+            UPDATE registros SET versao = (SELECT COALESCE(MAX(versao), 0) + 1 FROM registros) WHERE id = NEW.id;
+        END
+    ''')
+
+
+MIGRACOES = [
+    (1, "Esquema inicial (equivale à versão 6 do PostgreSQL)", _v1_esquema),
+    (2, "horarios (versão 7 do PostgreSQL)", _v2_horarios),
+    (3, "registros.versao e registros_geracao (versão 8 do PostgreSQL)", _v3_registros_versao),
+    (4, "banco_horas (versão 9 do PostgreSQL)", _v4_banco_horas),
+    (5, "Gatilhos de registros.versao só para escritas sem versão", _v5_versao_por_instrucao),
+]
+
+
+# Mesmo resultado de resumo_diario._SQL_AGREGAR. Sem ORDER BY dentro de
+# agregações, a primeira ocorrência de cada coisa no dia sai de funções de
+# janela ordenadas por (hora, id).
+_SQL_AGREGAR = """
+    WITH base AS (
+        SELECT r.id, r.cpf_funcionario, r.data, r.hora, r.nome, r.diferenca_min, r.observacao,
+               CASE r.descricao WHEN 'Início do Expediente' THEN 'Entrada'
+                                WHEN 'Fim do Expediente' THEN 'Saída'
+                                ELSE r.descricao END AS evento
+        FROM registros r
+        WHERE {filtro}
+    ),
+    numerada AS (
+        SELECT *,
+               row_number() OVER (PARTITION BY cpf_funcionario, data, evento ORDER BY hora, id) AS ordem_evento,
+               row_number() OVER (PARTITION BY cpf_funcionario, data, observacao ORDER BY hora, id) AS ordem_observacao
+        FROM base
+    ),
+    eventos AS (
+        SELECT *,
+               first_value(nome) OVER dia AS primeiro_nome,
+               group_concat(observacao, ' | ') FILTER (WHERE observacao IS NOT NULL AND ordem_observacao = 1) OVER dia AS todas_observacoes
+        FROM numerada
+        WINDOW dia AS (PARTITION BY cpf_funcionario, data ORDER BY hora, id
+                       ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)
+    ),
+    dias AS (
+        SELECT cpf_funcionario, data, MIN(primeiro_nome) AS nome,
+               MIN(hora) FILTER (WHERE evento = 'Entrada') AS entrada,
+               MIN(hora) FILTER (WHERE evento = 'Saída') AS saida,
+               MIN(diferenca_min) FILTER (WHERE evento = 'Entrada' AND ordem_evento = 1) AS diferenca_entrada_min,
+               MIN(diferenca_min) FILTER (WHERE evento = 'Saída' AND ordem_evento = 1) AS diferenca_saida_min,
+               MIN(todas_observacoes) AS observacoes,
+               COUNT(*) AS eventos
+        FROM eventos
+        GROUP BY cpf_funcionario, data
+    ),
+    duracao AS (
+        SELECT *, strftime('%%s', saida) - strftime('%%s', entrada) AS segundos FROM dias
+    )
+    INSERT INTO registros_diarios (cpf_funcionario, data, nome, entrada, saida, minutos_trabalhados,
+                                   diferenca_entrada_min, diferenca_saida_min, observacoes, eventos, atualizado_em)
+    SELECT cpf_funcionario, data, nome, entrada, saida,
+           -- divisão com arredondamento para baixo, como o FLOOR do PostgreSQL
+           (segundos - ((segundos %% 60) + 60) %% 60) / 60,
+           diferenca_entrada_min, diferenca_saida_min, observacoes, eventos, CURRENT_TIMESTAMP
+    FROM duracao
+    WHERE true
+    ON CONFLICT (cpf_funcionario, data) DO UPDATE SET
+        nome = excluded.nome,
+        entrada = excluded.entrada,
+        saida = excluded.saida,
+        minutos_trabalhados = excluded.minutos_trabalhados,
+        diferenca_entrada_min = excluded.diferenca_entrada_min,
+        diferenca_saida_min = excluded.diferenca_saida_min,
+        observacoes = excluded.observacoes,
+        eventos = excluded.eventos,
+        atualizado_em = excluded.atualizado_em
+"""
+
+_FILTRO_DIAS = "(r.cpf_funcionario, r.data) IN (SELECT cpf, data FROM temp.dias_afetados)"
+
+_FILTRO_PERIODO = "(%(inicio)s IS NULL OR r.data >= %(inicio)s) AND (%(fim)s IS NULL OR r.data <= %(fim)s)"
+
+
+class ArmazenamentoSQLite:
+    nome = "sqlite"
+    Erro = sqlite3.Error
+
+    SELECT_REGISTROS = "SELECT r.id, f.codigo, r.nome, CAST(r.data AS TEXT) AS data, CAST(r.hora AS TEXT) AS hora, r.descricao, r.diferenca_min, r.observacao, e.nome_empresa, e.cnpj, f.tipo as setor, f.filial FROM registros r JOIN funcionarios f ON r.cpf_funcionario = f.cpf LEFT JOIN empresas e ON f.empresa_id = e.id"
+
+    SELECT_RELATORIO_DIARIO = """
+        SELECT strftime('%%d/%%m/%%Y', r.data) AS data, f.codigo, r.nome, e.nome_empresa, e.cnpj,
+               r.entrada, r.saida, r.minutos_trabalhados * 60 AS segundos,
+               COALESCE(r.observacoes, '') AS observacao
+        FROM registros_diarios r JOIN funcionarios f ON r.cpf_funcionario = f.cpf JOIN empresas e ON f.empresa_id = e.id
+        {filtro}
+        ORDER BY r.data, f.codigo, r.nome, e.nome_empresa, e.cnpj
+    """
+
+    # Versão das linhas gravadas ou alteradas por uma instrução: a subconsulta
+    # não depende da linha, então é avaliada uma vez e vale para todas.
+    NOVA_VERSAO_REGISTROS = "(SELECT COALESCE(MAX(versao), 0) + 1 FROM registros)"
+
+    def __init__(self, url):
+        url = urlparse(url)
+        # sqlite:///ponto.db -> "ponto.db"; sqlite:////var/lib/ponto.db -> "/var/lib/ponto.db"
+        self.caminho = url.path[1:] if url.path.startswith("/") else url.path
+        if not self.caminho or self.caminho == ":memory:":
+            raise ValueError("O SQLite precisa de um arquivo (sqlite:///caminho/ponto.db): cada conexão em memória seria um banco separado.")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._abertas = 0
+        self._checkouts = 0
+
+    def _abrir(self):
+        conn = sqlite3.connect(
+            self.caminho,
+            timeout=POOL_TIMEOUT_SEGUNDOS,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            isolation_level="IMMEDIATE",
+            factory=_Conexao,
+        )
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        with self._lock:
+            self._abertas += 1
+        return conn
+
+    @contextmanager
+    def conexao(self):
+        # Conexões são por thread (o sqlite3 não as compartilha); abrir uma
+        # custa microssegundos, então não há limite nem espera.
+        livres = getattr(self._local, "livres", None)
+        if livres is None:
+            livres = self._local.livres = []
+        conn = livres.pop() if livres else self._abrir()
+        with self._lock:
+            self._checkouts += 1
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+            livres.append(conn)
+
+    def estatisticas(self):
+        with self._lock:
+            return {"backend": self.nome, "arquivo": os.path.abspath(self.caminho),
+                    "conexoes_abertas": self._abertas, "checkouts": self._checkouts}
+
+    def preparar(self):
+        diretorio = os.path.dirname(os.path.abspath(self.caminho))
+        os.makedirs(diretorio, exist_ok=True)
+        with self.conexao() as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+
+    def migrar(self, conn):
+        with conn.cursor() as cursor:
+            # BEGIN IMMEDIATE serializa migrações de processos que sobem juntos.
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS schema_versao (
+                    versao INTEGER PRIMARY KEY,
+                    descricao TEXT NOT NULL,
+                    aplicada_em TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            cursor.execute("SELECT COALESCE(MAX(versao), 0) FROM schema_versao")
+            atual = cursor.fetchone()[0]
+            for versao, descricao, migracao in MIGRACOES:
+                if versao <= atual:
+                    continue
+                migracao(cursor)
+                cursor.execute("INSERT INTO schema_versao (versao, descricao) VALUES (%s, %s)", (versao, descricao))
+                atual = versao
+        conn.commit()
+        return atual
+
+    # ------------------------------------------------------------------ #
+    def garantir_particoes(self, cursor, data_inicio, data_fim):
+        pass
+
+    def garantir_particao_do_mes(self, conn, dia):
+        pass
+
+    def arquivar_registros(self, conn, anteriores_a, diretorio, simular=False):
+        """Grava em .csv.gz e apaga os meses de `registros` que terminam antes de `anteriores_a`.
+
+        Mesmas colunas e nomes de arquivo das partições do PostgreSQL; cada
+        mês vai numa transação própria.
+        """
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT DISTINCT substr(data, 1, 7) FROM registros WHERE data < %s ORDER BY 1",
+                           (particoes.inicio_do_mes(anteriores_a),))
+            meses = [date(int(ano_mes[:4]), int(ano_mes[5:7]), 1) for (ano_mes,) in cursor.fetchall()]
+        caminhos = [os.path.join(diretorio, f"{particoes.nome_particao(mes)}.csv.gz") for mes in meses]
+        if simular:
+            return caminhos
+
+        os.makedirs(diretorio, exist_ok=True)
+        for mes, caminho in zip(meses, caminhos):
+            temporario = caminho + ".parcial"
+            fim = particoes.somar_meses(mes, 1)
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("BEGIN IMMEDIATE")
+                    cursor.execute(f"SELECT {particoes.COLUNAS_ARQUIVO} FROM registros WHERE data >= %s AND data < %s ORDER BY data, hora, id", (mes, fim))
+                    with gzip.open(temporario, "wt", encoding="utf-8", newline="") as arquivo:
+                        escritor = csv.writer(arquivo)
+                        escritor.writerow([d[0] for d in cursor.description])
+                        escritor.writerows(cursor)
+                    with open(temporario, "rb") as arquivo:
+                        os.fsync(arquivo.fileno())
+                    os.replace(temporario, caminho)
+                    for tabela in ("registros_diarios", "pontos_dia", "registros"):
+                        cursor.execute(f"DELETE FROM {tabela} WHERE data >= %s AND data < %s", (mes, fim))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                if os.path.exists(temporario):
+                    os.remove(temporario)
+                raise
+        return caminhos
+
+    def recalcular_dias(self, cursor, dias):
+        dias = list(dict.fromkeys(dias))
+        if not dias:
+            return
+        self.criar_temporaria(cursor, "dias_afetados", "cpf TEXT, data DATE, PRIMARY KEY (cpf, data)")
+        cursor.executemany("INSERT INTO temp.dias_afetados (cpf, data) VALUES (%s, %s)", dias)
+        cursor.execute(_SQL_AGREGAR.format(filtro=_FILTRO_DIAS))
+        # Dias que ficaram sem nenhum evento.
+        cursor.execute('''
+            DELETE FROM registros_diarios
+             WHERE (cpf_funcionario, data) IN (SELECT cpf, data FROM temp.dias_afetados)
+               AND NOT EXISTS (SELECT 1 FROM registros r
+                                WHERE r.cpf_funcionario = registros_diarios.cpf_funcionario
+                                  AND r.data = registros_diarios.data)
+        ''')
+
+    def reconstruir_dias(self, cursor, data_inicio=None, data_fim=None):
+        params = {"inicio": data_inicio, "fim": data_fim}
+        cursor.execute("DELETE FROM registros_diarios AS r WHERE " + _FILTRO_PERIODO, params)
+        cursor.execute(_SQL_AGREGAR.format(filtro=_FILTRO_PERIODO), params)
+        # O sqlite3 só preenche rowcount em comandos que começam por INSERT/UPDATE/DELETE.
+        cursor.execute("SELECT changes()")
+        return cursor.fetchone()[0]
+
+    # ------------------------------------------------------------------ #
+    def criar_temporaria(self, cursor, nome, colunas):
+        """Tabela temporária vazia. Ela continua na conexão depois do commit; a próxima chamada a recria."""
+        cursor.execute(f"DROP TABLE IF EXISTS temp.{nome}")
+        cursor.execute(f"CREATE TEMP TABLE {nome} ({colunas})")
+
+    def copiar(self, cursor, tabela, colunas, df):
+        """Carrega as linhas de `df` (na ordem de `colunas`) em `tabela` com um executemany."""
+        valores = [df[coluna].tolist() for coluna in df.columns]
+        cursor.executemany(
+            f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({', '.join(['%s'] * len(colunas))})",
+            zip(*valores),
+        )
+
+    def copiar_registros(self, cursor, colunas, df):
+        """Carrega `df` em registros com uma única versão para o lote (o gatilho de inserção não dispara)."""
+        cursor.execute(f"SELECT {self.NOVA_VERSAO_REGISTROS}")
+        self.copiar(cursor, "registros", [*colunas, 'versao'], df.assign(versao=cursor.fetchone()[0]))
+
+    def inserir_linhas(self, cursor, tabela, colunas, linhas):
+        """Insere as tuplas de `linhas` em `tabela` com um executemany."""
+        cursor.executemany(f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({', '.join(['%s'] * len(colunas))})", linhas)
+
+    def iterar(self, conn, query, params, tamanho_bloco):
+        """Gera `(colunas, linhas)` em blocos de até `tamanho_bloco`; o SQLite já lê sob demanda."""
+        with conn.cursor() as cursor:
+            cursor.arraysize = tamanho_bloco
+            cursor.execute(query, params)
+            colunas = [d[0] for d in cursor.description]
+            while True:
+                linhas = cursor.fetchmany(tamanho_bloco)
+                if not linhas:
+                    break
+                yield colunas, linhas
+
+    # ------------------------------------------------------------------ #
+    def reservar_evento(self, cursor, cpf, data, maximo):
+        """Reserva o próximo evento do dia; retorna `(número do evento, filial, setor, empresa)` ou None se o dia já está completo.
+
+        O INSERT abre a transação com BEGIN IMMEDIATE: outras escritas esperam o commit.
+        """
+        cursor.execute(
+            """
+            INSERT INTO pontos_dia (cpf_funcionario, data, eventos) VALUES (%(cpf)s, %(data)s, 1)
+            ON CONFLICT (cpf_funcionario, data)
+            DO UPDATE SET eventos = pontos_dia.eventos + 1 WHERE pontos_dia.eventos < %(max)s
+            RETURNING eventos
+            """,
+            {"cpf": cpf, "data": data, "max": maximo}
+        )
+        vaga = cursor.fetchone()
+        if vaga is None:
+            return None
+        cursor.execute("SELECT f.filial, f.tipo, e.nome_empresa FROM funcionarios f LEFT JOIN empresas e ON e.id = f.empresa_id WHERE f.cpf = %s", (cpf,))
+        return (vaga[0], *(cursor.fetchone() or (None, None, None)))
+
+    def ordenar_marcacoes(self, cursor):
+        """Numera as marcações de `afd_marcacoes` dentro do dia, depois das já registradas.
+
+        Descarta antes as que já existem em `registros`. Retorna
+        `(duplicadas, linhas)` com linhas `(linha, cpf, data, 'HH:MM:SS', ordem)`.
+        """
+        cursor.execute('''
+            DELETE FROM temp.afd_marcacoes
+             WHERE EXISTS (SELECT 1 FROM registros r
+                            WHERE r.cpf_funcionario = afd_marcacoes.cpf
+                              AND r.data = afd_marcacoes.data AND r.hora = afd_marcacoes.hora)
+        ''')
+        duplicadas = cursor.rowcount
+        cursor.execute('''
+            INSERT INTO pontos_dia (cpf_funcionario, data, eventos)
+            SELECT DISTINCT cpf, data, 0 FROM temp.afd_marcacoes WHERE true
+            ON CONFLICT (cpf_funcionario, data) DO NOTHING
+        ''')
+        cursor.execute('''
+            SELECT a.linha, a.cpf, a.data, CAST(a.hora AS TEXT),
+                   p.eventos + row_number() OVER (PARTITION BY a.cpf, a.data ORDER BY a.hora, a.nsr)
+              FROM temp.afd_marcacoes a
+              JOIN pontos_dia p ON p.cpf_funcionario = a.cpf AND p.data = a.data
+        ''')
+        return duplicadas, cursor.fetchall()
+
+    def somar_eventos_dia(self, cursor, cpfs, datas, quantidades):
+        cursor.executemany(
+            "UPDATE pontos_dia SET eventos = eventos + %s WHERE cpf_funcionario = %s AND data = %s",
+            zip(quantidades, cpfs, datas),
+        )
+
+    def inserir_funcionarios_importados(self, cursor):
+        """Passa `importacao_funcionarios` para empresas/funcionarios. Retorna os funcionários inseridos."""
+        # Empresa nova entra com o CNPJ da primeira linha em que aparece.
+        cursor.execute('''
+            INSERT INTO empresas (nome_empresa, cnpj)
+            SELECT empresa, cnpj FROM (
+                   SELECT i.empresa, i.cnpj, i.linha,
+                          row_number() OVER (PARTITION BY lower(i.empresa) ORDER BY i.linha) AS ordem
+                     FROM temp.importacao_funcionarios i
+                   ) primeiras
+             WHERE ordem = 1
+               AND NOT EXISTS (SELECT 1 FROM empresas e WHERE lower(e.nome_empresa) = lower(primeiras.empresa))
+             ORDER BY lower(empresa)
+            ON CONFLICT (nome_empresa) DO NOTHING
+        ''')
+        cursor.execute('''
+            INSERT INTO funcionarios (cpf, codigo, nome, senha, role, empresa_id, cod_tipo, tipo, filial, pis)
+            SELECT i.cpf, i.codigo, i.nome, i.senha, 'employee',
+                   (SELECT id FROM empresas WHERE lower(nome_empresa) = lower(i.empresa) ORDER BY id LIMIT 1),
+                   i.cod_tipo, i.tipo, i.filial, NULLIF(i.pis, '')
+              FROM temp.importacao_funcionarios i
+             WHERE true
+             ORDER BY i.linha
+            ON CONFLICT DO NOTHING
+        ''')
+        return cursor.rowcount
+
+    # ------------------------------------------------------------------ #
+    def marca_registros(self, cursor):
+        """`(geração, posição)`: as linhas gravadas depois daqui terão `versao >= posição`."""
+        cursor.execute("SELECT (SELECT valor FROM registros_geracao), (SELECT COALESCE(MAX(versao), 0) + 1 FROM registros)")
+        return tuple(cursor.fetchone())
+
+    def avisar_registros(self, cursor, motivo):
+        pass
+
+    def escutar_registros(self, ao_receber):
+        return None
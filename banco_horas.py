@@ -0,0 +1,68 @@
+"""Banco de horas: saldo diário contra os horários previstos, fechado mês a mês.
+
+O saldo de um dia é a diferença tolerada da Saída menos a da Entrada, com
+a mesma regra de `status_ponto` e o horário previsto de `horarios`: sair
+depois ou entrar antes do previsto gera crédito; o contrário, débito. Dias
+sem Entrada ou sem Saída, ou sem horário previsto, valem 0.
+
+Fechar um mês grava na tabela `banco_horas` uma linha por funcionário com
+o saldo do mês e o acumulado até ele. O saldo atual é o acumulado do
+último mês fechado mais os meses abertos, calculados na hora a partir de
+`registros_diarios`. Uma alteração de ponto num mês fechado recalcula só
+aquele funcionário/mês e desloca pela diferença o acumulado dos meses
+fechados seguintes; mudar os horários previstos não mexe no que já foi
+fechado.
+"""
+import numpy as np
+import pandas as pd
+
+from status_ponto import aplicar_tolerancia
+
+# Colunas lidas de registros_diarios (com a lotação do funcionário) por `saldos_diarios`.
+COLUNAS_DIAS = ['cpf', 'data', 'entrada', 'saida', 'empresa', 'filial', 'setor']
+
+
+def inicio_do_mes(datas):
+    """Primeiro dia do mês de cada data (`date` ou 'AAAA-MM-DD'), como `date`."""
+    return pd.to_datetime(pd.Series(datas)).dt.to_period('M').dt.start_time.dt.date
+
+
+def _segundos(horas):
+    return pd.to_timedelta(pd.Series(horas).astype('string'), errors='coerce').dt.total_seconds()
+
+
+def saldos_diarios(dias, horarios):
+    """Saldo, em minutos, de cada linha de `dias` (colunas de `COLUNAS_DIAS`)."""
+    if dias.empty:
+        return pd.Series(0, index=dias.index, dtype='int64')
+    base = pd.DataFrame({
+        'CPF': dias['cpf'], 'Data': dias['data'],
+        'Empresa': dias['empresa'], 'Filial': dias['filial'], 'Setor': dias['setor'],
+    })
+    diferencas = {}
+    for evento, coluna in (('Entrada', 'entrada'), ('Saída', 'saida')):
+        previsto = horarios.segundos_previstos(base.assign(**{'Descrição': evento}))
+        diferencas[evento] = np.round((_segundos(dias[coluna]) - previsto).to_numpy(dtype=float) / 60)
+    completo = ~np.isnan(diferencas['Entrada']) & ~np.isnan(diferencas['Saída'])
+    saldo = aplicar_tolerancia(np.nan_to_num(diferencas['Saída'])) - aplicar_tolerancia(np.nan_to_num(diferencas['Entrada']))
+    return pd.Series(np.where(completo, saldo, 0).astype('int64'), index=dias.index)
+
+
+def saldos_mensais(dias, horarios):
+    """Saldo e dias computados por (cpf, mês): DataFrame com cpf, mes, saldo_min e dias."""
+    if dias.empty:
+        return pd.DataFrame({'cpf': [], 'mes': [], 'saldo_min': [], 'dias': []}).astype({'saldo_min': 'int64', 'dias': 'int64'})
+    saldos = pd.DataFrame({'cpf': dias['cpf'], 'mes': inicio_do_mes(dias['data']).to_numpy(), 'saldo_min': saldos_diarios(dias, horarios)})
+    return saldos.groupby(['cpf', 'mes'], as_index=False, sort=True).agg(saldo_min=('saldo_min', 'sum'), dias=('saldo_min', 'size'))
+
+
+def meses_a_fechar(inicio, fim):
+    """Primeiros dias dos meses de `inicio` a `fim`, inclusive."""
+    return [periodo.start_time.date() for periodo in pd.period_range(inicio, fim, freq='M')]
+
+
+def formatar_minutos(minutos):
+    """Saldos em minutos como "+HH:MM" / "-HH:MM"."""
+    minutos = pd.Series(minutos).fillna(0).astype('int64')
+    horas, resto = np.divmod(minutos.abs(), 60)
+    return np.where(minutos < 0, '-', '+') + horas.astype(str).str.zfill(2) + ':' + resto.astype(str).str.zfill(2)
@@ -0,0 +1,142 @@
+"""Gerador de dados sintéticos para os benchmarks.
+
+No PostgreSQL tudo é gerado no próprio banco (generate_series + random com
+semente fixa), então escalas de milhões de eventos levam segundos e não
+passam pela memória do Python. No SQLite os dados (mesma forma e mesma
+distribuição, não os mesmos sorteios) saem do numpy. Todos os funcionários
+sintéticos usam a senha `SENHA_SINTETICA`, com um único hash, para não
+pagar a KDF na carga.
+"""
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from senhas import gerar_hash
+
+SENHA_SINTETICA = "bench"
+
+FILIAIS = ["Matriz", "Filial 02", "Filial 03", "Filial 04"]
+SETORES = ["Administrativo", "Operacional", "Logística", "Comercial", "RH", "TI"]
+
+
+def cpf_sintetico(indice):
+    return f"{indice:011d}"
+
+
+def recriar_esquema(banco, conn):
+    """Apaga tudo do banco de benchmark (o schema public, no PostgreSQL)."""
+    with conn.cursor() as cursor:
+        if banco.nome == "sqlite":
+            cursor.execute("PRAGMA foreign_keys = OFF")
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%%'")
+            for (tabela,) in cursor.fetchall():
+                cursor.execute(f'DROP TABLE "{tabela}"')
+            cursor.execute("PRAGMA foreign_keys = ON")
+        else:
+            cursor.execute("DROP SCHEMA public CASCADE")
+            cursor.execute("CREATE SCHEMA public")
+    conn.commit()
+
+
+def popular(banco, conn, funcionarios, dias, data_fim, empresas=10, semente=0.42):
+    """Empresas, funcionários e `dias` dias corridos de ponto (até `data_fim`).
+
+    Cada funcionário tem Entrada por volta das 08:00 e Saída por volta das
+    18:00 em todos os dias úteis; cerca de 2% dos eventos têm observação.
+    Retorna o número de eventos gerados. Espera o esquema já migrado.
+    """
+    data_inicio = data_fim - timedelta(days=dias - 1)
+    if banco.nome == "sqlite":
+        return _popular_numpy(banco, conn, funcionarios, data_inicio, data_fim, empresas, semente)
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT setseed(%s)", (semente,))
+        cursor.execute(
+            "INSERT INTO empresas (nome_empresa, cnpj) "
+            "SELECT 'Empresa ' || g, lpad(g::text, 14, '0') FROM generate_series(1, %s) g",
+            (empresas,),
+        )
+        cursor.execute('''
+            INSERT INTO funcionarios (cpf, codigo, nome, senha, role, empresa_id, cod_tipo, tipo, filial)
+            SELECT lpad(g::text, 11, '0'), g::text, 'Funcionario ' || g, %(senha)s, 'employee',
+                   (SELECT MIN(id) FROM empresas) + g %% %(empresas)s,
+                   (g %% %(setores)s + 1)::text, (%(lista_setores)s::text[])[g %% %(setores)s + 1],
+                   (%(lista_filiais)s::text[])[g %% %(filiais)s + 1]
+              FROM generate_series(1, %(funcionarios)s) g
+        ''', {
+            "senha": gerar_hash(SENHA_SINTETICA), "empresas": empresas, "funcionarios": funcionarios,
+            "setores": len(SETORES), "lista_setores": SETORES,
+            "filiais": len(FILIAIS), "lista_filiais": FILIAIS,
+        })
+        banco.garantir_particoes(cursor, data_inicio, data_fim)
+        cursor.execute('''
+            INSERT INTO registros (cpf_funcionario, nome, data, hora, descricao, diferenca_min, observacao)
+            SELECT cpf, nome, data, previsto + make_interval(secs => desvio), evento,
+                   -- diferença já com a tolerância padrão de 5 minutos
+                   CASE WHEN abs(floor(desvio / 60)) <= 5 THEN 0 ELSE floor(desvio / 60)::integer END,
+                   CASE WHEN com_observacao THEN 'Observação sintética' ELSE '' END
+              FROM (
+                    SELECT f.cpf, f.nome, d::date AS data, e.evento, e.previsto,
+                           floor(random() * 1200 - 600) AS desvio, random() < 0.02 AS com_observacao
+                      FROM funcionarios f
+                     CROSS JOIN generate_series(%(inicio)s::date, %(fim)s::date, interval '1 day') d
+                     CROSS JOIN (VALUES ('Entrada', time '08:00'), ('Saída', time '18:00')) e(evento, previsto)
+                     WHERE f.role = 'employee' AND extract(isodow FROM d) < 6
+              ) sorteio
+        ''', {"inicio": data_inicio, "fim": data_fim})
+        eventos = cursor.rowcount
+        cursor.execute('''
+            INSERT INTO pontos_dia (cpf_funcionario, data, eventos)
+            SELECT cpf_funcionario, data, COUNT(*) FROM registros GROUP BY cpf_funcionario, data
+        ''')
+        banco.reconstruir_dias(cursor, data_inicio, data_fim)
+        cursor.execute("ANALYZE")
+    conn.commit()
+    return eventos
+
+
+def _popular_numpy(banco, conn, funcionarios, data_inicio, data_fim, empresas, semente):
+    sorteio = np.random.default_rng(int(semente * 1_000_000))
+    indices = np.arange(1, funcionarios + 1)
+    cpfs = np.array([cpf_sintetico(i) for i in indices], dtype=object)
+    nomes = np.array([f"Funcionario {i}" for i in indices], dtype=object)
+    datas = np.array([d.date() for d in pd.date_range(data_inicio, data_fim) if d.isoweekday() < 6], dtype=object)
+
+    # Um dia útil por funcionário vira duas linhas: Entrada e Saída.
+    eventos = pd.DataFrame({
+        "cpf": np.repeat(cpfs, len(datas) * 2),
+        "nome": np.repeat(nomes, len(datas) * 2),
+        "data": np.tile(np.repeat(datas, 2), funcionarios),
+        "descricao": np.tile(np.array(["Entrada", "Saída"], dtype=object), funcionarios * len(datas)),
+    })
+    desvio = np.floor(sorteio.random(len(eventos)) * 1200 - 600).astype(int)
+    segundos = np.where(eventos["descricao"] == "Entrada", 8 * 3600, 18 * 3600) + desvio
+    eventos["hora"] = [f"{s // 3600:02d}:{s % 3600 // 60:02d}:{s % 60:02d}" for s in segundos.tolist()]
+    minutos = desvio // 60
+    eventos["diferenca_min"] = np.where(np.abs(minutos) <= 5, 0, minutos)
+    eventos["observacao"] = np.where(sorteio.random(len(eventos)) < 0.02, "Observação sintética", "")
+
+    with conn.cursor() as cursor:
+        cursor.executemany("INSERT INTO empresas (nome_empresa, cnpj) VALUES (%s, %s)",
+                           [(f"Empresa {g}", f"{g:014d}") for g in range(1, empresas + 1)])
+        cursor.execute("SELECT MIN(id) FROM empresas")
+        primeira_empresa = cursor.fetchone()[0]
+        senha = gerar_hash(SENHA_SINTETICA)
+        cursor.executemany(
+            "INSERT INTO funcionarios (cpf, codigo, nome, senha, role, empresa_id, cod_tipo, tipo, filial) "
+            "VALUES (%s, %s, %s, %s, 'employee', %s, %s, %s, %s)",
+            [(cpf, str(g), nome, senha, primeira_empresa + g % empresas, str(g % len(SETORES) + 1),
+              SETORES[g % len(SETORES)], FILIAIS[g % len(FILIAIS)])
+             for g, cpf, nome in zip(indices.tolist(), cpfs, nomes)],
+        )
+        banco.copiar_registros(cursor,
+                               ["cpf_funcionario", "nome", "data", "hora", "descricao", "diferenca_min", "observacao"],
+                               eventos[["cpf", "nome", "data", "hora", "descricao", "diferenca_min", "observacao"]])
+        cursor.execute('''
+            INSERT INTO pontos_dia (cpf_funcionario, data, eventos)
+            SELECT cpf_funcionario, data, COUNT(*) FROM registros GROUP BY cpf_funcionario, data
+        ''')
+        banco.reconstruir_dias(cursor, data_inicio, data_fim)
+        cursor.execute("ANALYZE")
+    conn.commit()
+    return len(eventos)
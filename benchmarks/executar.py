@@ -0,0 +1,234 @@
+"""Benchmark de services.py em várias escalas de dados sintéticos.
+
+    python -m benchmarks.executar --banco postgresql://.../ponto_bench \\
+        --escalas 1000x20 10000x20 100000x20 --saida resultado.json
+    python -m benchmarks.executar --banco ... --base base.json          # compara e falha se regredir
+    python -m benchmarks.executar --banco ... --saida base.json          # grava uma nova base
+    python -m benchmarks.executar --banco postgresql://.../ponto_bench sqlite:///bench.db   # compara backends
+
+ATENÇÃO: o banco em `--banco` (o schema public, no PostgreSQL; todas as
+tabelas, no SQLite) é apagado e recriado a cada escala; use um banco
+dedicado. Com mais de um `--banco`, cada um roda todas as escalas e o
+resultado traz o backend em "banco". Cada escala `FUNCIONARIOSxDIAS` gera
+os dados até ontem (para `bater_ponto` medir o primeiro evento do dia).
+
+Para cada caso são medidos, em `--repeticoes` execuções, os percentis de
+latência e as linhas/s; o pico de memória vem de uma execução extra sob
+tracemalloc (alocações do Python e do numpy/pandas, não as da libpq).
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+
+def _percentil(amostras, fracao):
+    ordenadas = sorted(amostras)
+    return ordenadas[min(len(ordenadas) - 1, int(round(fracao * (len(ordenadas) - 1))))]
+
+
+def _medir(caso, repeticoes):
+    """Roda `caso(i)` (que retorna as linhas processadas) e resume latência, vazão e memória."""
+    latencias, linhas = [], 0
+    for i in range(repeticoes):
+        inicio = time.perf_counter()
+        linhas = caso(i)
+        latencias.append(time.perf_counter() - inicio)
+
+    tracemalloc.start()
+    try:
+        caso(repeticoes)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    mediana = _percentil(latencias, 0.5)
+    return {
+        "repeticoes": repeticoes,
+        "linhas": linhas,
+        "latencia_ms": {
+            "p50": mediana * 1000,
+            "p95": _percentil(latencias, 0.95) * 1000,
+            "max": max(latencias) * 1000,
+            "media": sum(latencias) / len(latencias) * 1000,
+        },
+        "linhas_por_s": linhas / mediana if mediana > 0 else None,
+        "pico_memoria_mb": pico / 1024 / 1024,
+    }
+
+
+def _casos(services, dados, funcionarios, periodo, tamanho_importacao):
+    """Casos medidos; o índice `i` da execução separa os dados de cada uma."""
+    estado = {}
+
+    def ler_registros(i):
+        estado["bruto"] = services.ler_registros_df.__wrapped__()
+        return len(estado["bruto"])
+
+    def relatorio_organizado(i):
+        estado["organizado"] = services.gerar_relatorio_organizado_df(estado["bruto"])
+        return len(estado["bruto"])
+
+    def relatorio_diario(i):
+        return len(services.gerar_relatorio_diario_df.__wrapped__(data_inicio=periodo[0], data_fim=periodo[1]))
+
+    def arquivo_excel(i):
+        bruto = estado["bruto"].assign(Data=pd.to_datetime(estado["bruto"]["Data"]).dt.strftime('%d/%m/%Y'))
+        services.gerar_arquivo_excel(estado["organizado"], bruto, "Todas as Empresas", None, *periodo)
+        return len(estado["organizado"]) + len(bruto)
+
+    def importar(i):
+        primeiro = funcionarios + 1 + i * tamanho_importacao
+        cpfs = [dados.cpf_sintetico(n) for n in range(primeiro, primeiro + tamanho_importacao)]
+        arquivo = pd.DataFrame({
+            'ARQUIVO': 'Funcionarios Filial 02', 'EMPRESA': 'Empresa Importada', 'CNPJ': '99999999999999',
+            'CODTIPO': '1', 'TIPO': 'Operacional', 'CODFORTE': cpfs, 'NOME': 'Importado', 'CPF': cpfs,
+        })
+        sucesso, _, _ = services.importar_funcionarios_em_massa(arquivo)
+        return sucesso
+
+    def login(i):
+        _, erro = services.verificar_login(dados.cpf_sintetico(i % funcionarios + 1), dados.SENHA_SINTETICA)
+        if erro:
+            raise RuntimeError(erro)
+        return 1
+
+    def ponto(i):
+        cpf = dados.cpf_sintetico(i % funcionarios + 1)
+        services.bater_ponto(cpf, "Funcionario")
+        return 1
+
+    return [
+        ("ler_registros_df", ler_registros),
+        ("gerar_relatorio_organizado_df", relatorio_organizado),
+        ("gerar_relatorio_diario_df", relatorio_diario),
+        ("gerar_arquivo_excel", arquivo_excel),
+        ("importar_funcionarios_em_massa", importar),
+        ("verificar_login", login),
+        ("bater_ponto", ponto),
+    ]
+
+
+def _escala(texto):
+    funcionarios, dias = texto.lower().split("x")
+    return int(funcionarios), int(dias)
+
+
+def _versao_banco(services):
+    if services._banco.nome == "sqlite":
+        return sqlite3.sqlite_version
+    with services.get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SHOW server_version")
+            return cursor.fetchone()[0]
+
+
+def executar(args):
+    # services lê DATABASE_URL na importação.
+    os.environ["DATABASE_URL"] = args.banco[0]
+    import armazenamento
+    import services
+    from benchmarks import dados
+
+    resultados, versoes = [], {}
+    for url in args.banco:
+        # Troca o backend de services.py sem reimportar o módulo.
+        services._banco = armazenamento.abrir(url)
+        banco = services._banco.nome
+        for texto in args.escalas:
+            funcionarios, dias = _escala(texto)
+            with services.get_db_connection() as conn:
+                dados.recriar_esquema(services._banco, conn)
+            services.init_db()
+            inicio = time.perf_counter()
+            data_fim = date.today() - timedelta(days=1)
+            with services.get_db_connection() as conn:
+                eventos = dados.popular(services._banco, conn, funcionarios, dias, data_fim)
+            print(f"[{banco} {texto}] {eventos} eventos gerados em {time.perf_counter() - inicio:.1f}s", file=sys.stderr)
+            services._cache.limpar()
+
+            for nome, caso in _casos(services, dados, funcionarios, (data_fim - timedelta(days=dias - 1), data_fim), args.importacao):
+                medida = _medir(caso, args.repeticoes)
+                resultados.append({"banco": banco, "escala": texto, "funcionarios": funcionarios, "dias": dias,
+                                   "eventos": eventos, "caso": nome, **medida})
+                print(f"[{banco} {texto}] {nome:<32} p50 {medida['latencia_ms']['p50']:10.1f} ms  "
+                      f"pico {medida['pico_memoria_mb']:8.1f} MB", file=sys.stderr)
+        versoes[banco] = _versao_banco(services)
+
+    return {
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "ambiente": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            **versoes,
+            "cpus": os.cpu_count(),
+            "maquina": platform.machine(),
+        },
+        "resultados": resultados,
+    }
+
+
+# Diferenças absolutas abaixo disso são ruído de medição, não regressão.
+_RUIDO = {"latencia_p50_ms": 5.0, "pico_memoria_mb": 1.0}
+
+
+def comparar(atual, base, tolerancia):
+    """Lista de regressões (latência p50 ou pico de memória acima de base × (1 + tolerância))."""
+    # Bases gravadas antes do SQLite não têm "banco": eram todas do PostgreSQL.
+    indice = {(r.get("banco", "postgresql"), r["escala"], r["caso"]): r for r in base["resultados"]}
+    regressoes = []
+    for resultado in atual["resultados"]:
+        anterior = indice.get((resultado["banco"], resultado["escala"], resultado["caso"]))
+        if anterior is None:
+            continue
+        for metrica, valor, valor_base in (
+            ("latencia_p50_ms", resultado["latencia_ms"]["p50"], anterior["latencia_ms"]["p50"]),
+            ("pico_memoria_mb", resultado["pico_memoria_mb"], anterior["pico_memoria_mb"]),
+        ):
+            variacao = (valor - valor_base) / valor_base if valor_base else 0.0
+            if variacao > tolerancia and valor - valor_base > _RUIDO[metrica]:
+                regressoes.append({"banco": resultado["banco"], "escala": resultado["escala"], "caso": resultado["caso"], "metrica": metrica,
+                                   "base": valor_base, "atual": valor, "variacao": variacao})
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--banco", nargs="+", required=True,
+                        help="URL de um ou mais bancos dedicados ao benchmark (postgresql://... ou sqlite:///...)")
+    parser.add_argument("--escalas", nargs="+", default=["1000x20"], help="FUNCIONARIOSxDIAS (padrão: 1000x20)")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--importacao", type=int, default=200, help="funcionários por importação medida")
+    parser.add_argument("--saida", help="arquivo JSON do resultado (padrão: stdout)")
+    parser.add_argument("--base", help="JSON de um resultado anterior para comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="piora aceita sobre a base (padrão: 0.2 = 20%%)")
+    args = parser.parse_args()
+
+    resultado = executar(args)
+    if args.base:
+        with open(args.base, encoding="utf-8") as arquivo:
+            resultado["regressoes"] = comparar(resultado, json.load(arquivo), args.tolerancia)
+
+    texto = json.dumps(resultado, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            arquivo.write(texto + "\n")
+    else:
+        print(texto)
+
+    for regressao in resultado.get("regressoes", []):
+        print(f"REGRESSÃO [{regressao['banco']} {regressao['escala']}] {regressao['caso']} {regressao['metrica']}: "
+              f"{regressao['base']:.1f} -> {regressao['atual']:.1f} (+{regressao['variacao']:.0%})", file=sys.stderr)
+    if resultado.get("regressoes"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Vazão do hash de senhas e da importação em massa com a KDF configurada.
+
+    python -m benchmarks.hash_senhas --quantidade 2000 --processos 1 4
+    python -m benchmarks.hash_senhas --quantidade 2000 --importar   # usa DATABASE_URL
+
+Com `--importar`, os funcionários sintéticos (CPFs começando em "bench")
+são importados e depois removidos do banco.
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from config import SENHA_ALGORITMO
+from senhas import gerar_hashes_em_lote
+
+
+def _medir(funcao):
+    inicio = time.perf_counter()
+    resultado = funcao()
+    return resultado, time.perf_counter() - inicio
+
+
+def _arquivo_rh(quantidade):
+    return pd.DataFrame({
+        'ARQUIVO': ['Funcionarios Filial 02'] * quantidade,
+        'EMPRESA': [f'Empresa Bench {i % 20}' for i in range(quantidade)],
+        'CNPJ': ['00000000000000'] * quantidade,
+        'CODTIPO': ['1'] * quantidade,
+        'TIPO': ['Operacional'] * quantidade,
+        'CODFORTE': [f'{i:06d}' for i in range(quantidade)],
+        'NOME': [f'Funcionario {i}' for i in range(quantidade)],
+        'CPF': [f'bench{i:011d}' for i in range(quantidade)],
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quantidade', type=int, default=1000)
+    parser.add_argument('--processos', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--importar', action='store_true', help='mede também importar_funcionarios_em_massa')
+    args = parser.parse_args()
+
+    senhas = [f'{i:06d}' for i in range(args.quantidade)]
+    print(f"algoritmo={SENHA_ALGORITMO} senhas={args.quantidade}")
+    for processos in args.processos:
+        _, segundos = _medir(lambda: gerar_hashes_em_lote(senhas, processos=processos))
+        print(f"  hash em lote, {processos:>2} processo(s): {segundos:8.2f}s  {args.quantidade / segundos:10.1f} senhas/s")
+
+    if args.importar:
+        from services import get_db_connection, importar_funcionarios_em_massa, init_db
+        init_db()
+        (sucesso, ignorados, erros), segundos = _medir(lambda: importar_funcionarios_em_massa(_arquivo_rh(args.quantidade)))
+        print(f"  importação: {sucesso} importados, {ignorados} ignorados, {len(erros)} erros em {segundos:.2f}s"
+              f"  ({args.quantidade / segundos:.1f} funcionários/s)")
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM funcionarios WHERE cpf LIKE 'bench%%'")
+                cursor.execute("DELETE FROM empresas e WHERE nome_empresa LIKE 'Empresa Bench %%' AND NOT EXISTS (SELECT 1 FROM funcionarios f WHERE f.empresa_id = e.id)")
+            conn.commit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def _copiar(valor):
+    # Quem chama costuma alterar o DataFrame devolvido (p.ex. df['Data_dt'] = ...).
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        return valor.copy()
+    if isinstance(valor, tuple):
+        return tuple(_copiar(v) for v in valor)
+    return valor
+
+
+class CacheConsultas:
+    """Cache de leituras com TTL, limite de itens (LRU) e versões por tabela.
+
+    Cada entrada guarda a versão das tabelas de que depende no momento em
+    que foi calculada; `invalidar(tabela)` incrementa a versão e descarta na
+    hora as entradas afetadas. As versões são do processo: outras réplicas
+    só enxergam uma escrita quando o TTL vence.
+    """
+
+    def __init__(self, ttl=60.0, max_itens=256):
+        self.ttl = ttl
+        self.max_itens = max_itens
+        self._lock = threading.Lock()
+        self._itens = OrderedDict()  # chave -> (valor, expira_em, tabelas, versoes)
+        self._versoes = {}
+        self._hits = 0
+        self._misses = 0
+        self._expirados = 0
+        self._despejados = 0
+        self._invalidacoes = 0
+
+    def _versoes_de(self, tabelas):
+        return tuple(self._versoes.get(t, 0) for t in tabelas)
+
+    def obter_ou_calcular(self, chave, tabelas, calcular):
+        agora = time.monotonic()
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None:
+                valor, expira_em, _, versoes = item
+                if expira_em > agora and versoes == self._versoes_de(tabelas):
+                    self._itens.move_to_end(chave)
+                    self._hits += 1
+                    return _copiar(valor)
+                del self._itens[chave]
+                self._expirados += 1
+            self._misses += 1
+            versoes = self._versoes_de(tabelas)
+
+        valor = calcular()
+
+        with self._lock:
+            # Se houve escrita durante o cálculo, o resultado já nasce velho.
+            if versoes == self._versoes_de(tabelas):
+                self._itens[chave] = (valor, time.monotonic() + self.ttl, tabelas, versoes)
+                self._itens.move_to_end(chave)
+                while len(self._itens) > self.max_itens:
+                    self._itens.popitem(last=False)
+                    self._despejados += 1
+        return _copiar(valor)
+
+    def invalidar(self, *tabelas):
+        with self._lock:
+            for tabela in tabelas:
+                self._versoes[tabela] = self._versoes.get(tabela, 0) + 1
+            self._invalidacoes += 1
+            afetadas = set(tabelas)
+            for chave in [c for c, item in self._itens.items() if afetadas.intersection(item[2])]:
+                del self._itens[chave]
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self._hits + self._misses
+            return {
+                "itens": len(self._itens),
+                "max_itens": self.max_itens,
+                "ttl_segundos": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "taxa_acerto": (self._hits / consultas) if consultas else 0.0,
+                "expirados": self._expirados,
+                "despejados": self._despejados,
+                "invalidacoes": self._invalidacoes,
+                "versoes": dict(self._versoes),
+            }
+
+    def cacheado(self, *tabelas):
+        """Decorador: guarda o resultado por (função, argumentos).
+
+        A função original continua acessível em `func.__wrapped__` para
+        leituras que precisam ignorar o cache.
+        """
+        def decorador(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                chave = (func.__qualname__, args, tuple(sorted(kwargs.items())))
+                return self.obter_ou_calcular(chave, tabelas, lambda: func(*args, **kwargs))
+            return wrapper
+        return decorador
@@ -1,3 +1,4 @@
+import os
 from zoneinfo import ZoneInfo
 from datetime import time
 
@@ -5,7 +6,62 @@ FUSO_HORARIO = ZoneInfo("America/Fortaleza")
 
 TOLERANCIA_MINUTOS = 5
 
+# Eventos do dia, em ordem. Os horários daqui e de HORARIOS_POR_FILIAL só
+# povoam a tabela `horarios` quando ela é criada; depois valem os da tabela
+# (ver horarios.py).
 HORARIOS_PADRAO = {
     "Entrada": time(8, 0, 0),
     "Saída": time(18, 0, 0)
-}
\ No newline at end of file
+}
+
+# Filiais (pelo número em "Filial 03", "Filial 3", ...) com horário próprio
+HORARIOS_POR_FILIAL = {
+    3: {"Entrada": time(7, 30, 0), "Saída": time(17, 30, 0)},
+    4: {"Entrada": time(7, 30, 0), "Saída": time(17, 30, 0)},
+}
+
+# Pool de conexões com o PostgreSQL (ver pool.py). Com DATABASE_URL=sqlite:///...
+# só DB_POOL_TIMEOUT vale: é quanto uma escrita espera pela outra (ver armazenamento/sqlite.py).
+POOL_MIN_CONEXOES = int(os.getenv("DB_POOL_MIN", "1"))
+POOL_MAX_CONEXOES = int(os.getenv("DB_POOL_MAX", "10"))
+POOL_TIMEOUT_SEGUNDOS = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_OCIOSO_MAX_SEGUNDOS = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+POOL_IDADE_MAX_SEGUNDOS = float(os.getenv("DB_POOL_MAX_LIFETIME", "3600"))
+POOL_PING_APOS_SEGUNDOS = float(os.getenv("DB_POOL_PING_AFTER", "10"))
+
+# Cache de leituras em services.py (ver cache.py)
+CACHE_TTL_SEGUNDOS = float(os.getenv("CACHE_TTL", "60"))
+CACHE_MAX_ITENS = int(os.getenv("CACHE_MAX_ITEMS", "256"))
+
+# Relatório ao vivo do administrador (ver services.ler_registros_ao_vivo).
+# Acima de MAX_LINHAS o filtro volta a ser lido página a página.
+RELATORIO_AO_VIVO_MAX_LINHAS = int(os.getenv("LIVE_REPORT_MAX_ROWS", "200000"))
+RELATORIO_AO_VIVO_MAX_FILTROS = int(os.getenv("LIVE_REPORT_MAX_FILTERS", "16"))
+
+# Hash de senhas (ver senhas.py). Trocar o algoritmo ou os parâmetros faz os
+# hashes antigos serem regravados no próximo login de cada funcionário.
+SENHA_ALGORITMO = os.getenv("PASSWORD_HASHER", "scrypt")
+SENHA_SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2**14)))
+SENHA_SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+SENHA_SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+SENHA_PBKDF2_ITERACOES = int(os.getenv("PASSWORD_PBKDF2_ITERATIONS", "600000"))
+SENHA_PROCESSOS_HASH = int(os.getenv("PASSWORD_HASH_WORKERS", "0"))
+
+# Partições mensais de registros (ver particoes.py)
+PARTICOES_FUTURAS_MESES = int(os.getenv("REGISTROS_FUTURE_PARTITIONS", "3"))
+RETENCAO_REGISTROS_MESES = int(os.getenv("REGISTROS_RETENTION_MONTHS", "60"))
+DIRETORIO_ARQUIVO_REGISTROS = os.getenv("REGISTROS_ARCHIVE_DIR", "arquivo_registros")
+
+# Exportações do relatório geradas em segundo plano (ver exportacoes.py)
+EXPORTACAO_DIRETORIO = os.getenv("EXPORT_CACHE_DIR", "cache_exportacoes")
+EXPORTACAO_TRABALHADORES = int(os.getenv("EXPORT_WORKERS", "2"))
+EXPORTACAO_MAX_ARQUIVOS = int(os.getenv("EXPORT_CACHE_MAX_FILES", "50"))
+EXPORTACAO_VALIDADE_SEGUNDOS = float(os.getenv("EXPORT_CACHE_TTL", "86400"))
+
+# Instrumentação (ver metricas.py); desligada por padrão
+METRICAS_ATIVAS = os.getenv("METRICS_ENABLED", "").lower() in ("1", "true", "sim", "yes")
+METRICAS_ARQUIVO = os.getenv("METRICS_FILE", "")
+METRICAS_ARQUIVO_INTERVALO_SEGUNDOS = float(os.getenv("METRICS_FILE_INTERVAL", "15"))
+METRICAS_PORTA = int(os.getenv("METRICS_PORT", "0"))
+# O endpoint não tem autenticação: só escuta fora da máquina se METRICS_HOST pedir (ex.: 0.0.0.0).
+METRICAS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
@@ -0,0 +1,118 @@
+"""Exportações do relatório geradas em segundo plano e guardadas em disco.
+
+`solicitar(chave, extensao, gerar)` devolve o `Trabalho` da chave. Se o
+arquivo já está em `EXPORTACAO_DIRETORIO`, o trabalho volta pronto na hora.
+Se a mesma chave já está sendo gerada (por qualquer sessão do processo),
+volta o mesmo trabalho. Senão `gerar(caminho, progresso)` entra na fila de
+um pool de threads e grava num arquivo temporário, renomeado ao terminar.
+
+Quem chama monta a chave com a versão dos dados (ver
+`services.solicitar_exportacao`), então um arquivo guardado nunca é servido
+depois de os registros mudarem. A cada solicitação são apagados os arquivos
+parados há mais de `EXPORTACAO_VALIDADE_SEGUNDOS` e os mais antigos além de
+`EXPORTACAO_MAX_ARQUIVOS`.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (
+    EXPORTACAO_DIRETORIO, EXPORTACAO_TRABALHADORES, EXPORTACAO_MAX_ARQUIVOS, EXPORTACAO_VALIDADE_SEGUNDOS,
+)
+
+
+class Trabalho:
+    """Uma exportação: `estado` é "na fila", "gerando", "pronto" ou "erro"; `progresso` vai de 0 a 1."""
+
+    def __init__(self, chave, caminho, estado="na fila"):
+        self.chave = chave
+        self.caminho = caminho
+        self.estado = estado
+        self.progresso = 1.0 if estado == "pronto" else 0.0
+        self.erro = None
+        self.criado_em = time.time()
+
+    @property
+    def terminado(self):
+        return self.estado in ("pronto", "erro")
+
+    def avancar(self, fracao):
+        self.progresso = min(max(float(fracao), 0.0), 1.0)
+
+
+_lock = threading.Lock()
+_trabalhos = {}   # chave -> Trabalho, enquanto o arquivo existir
+_executor = None
+
+
+def _obter_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=EXPORTACAO_TRABALHADORES, thread_name_prefix="exportacao")
+    return _executor
+
+
+def caminho_do_arquivo(chave, extensao):
+    return os.path.join(EXPORTACAO_DIRETORIO, f"{chave}.{extensao}")
+
+
+def solicitar(chave, extensao, gerar):
+    """Trabalho da `chave`: reaproveitado, já pronto em disco ou recém-posto na fila."""
+    caminho = caminho_do_arquivo(chave, extensao)
+    with _lock:
+        trabalho = _trabalhos.get(chave)
+        if trabalho is not None and (not trabalho.terminado or (trabalho.estado == "pronto" and os.path.exists(caminho))):
+            return trabalho
+        if os.path.exists(caminho):
+            # Uso recente: adia a limpeza deste arquivo.
+            os.utime(caminho)
+            trabalho = _trabalhos[chave] = Trabalho(chave, caminho, estado="pronto")
+            return trabalho
+        trabalho = _trabalhos[chave] = Trabalho(chave, caminho)
+    _limpar()
+    _obter_executor().submit(_executar, trabalho, gerar)
+    return trabalho
+
+
+def _executar(trabalho, gerar):
+    trabalho.estado = "gerando"
+    temporario = f"{trabalho.caminho}.{threading.get_ident()}.parcial"
+    try:
+        os.makedirs(EXPORTACAO_DIRETORIO, exist_ok=True)
+        gerar(temporario, trabalho.avancar)
+        os.replace(temporario, trabalho.caminho)
+        trabalho.progresso = 1.0
+        trabalho.estado = "pronto"
+    except Exception as e:
+        trabalho.erro = str(e)
+        trabalho.estado = "erro"
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+
+def _limpar():
+    """Apaga arquivos vencidos ou excedentes e esquece os trabalhos terminados sem arquivo."""
+    try:
+        nomes = [nome for nome in os.listdir(EXPORTACAO_DIRETORIO) if not nome.endswith(".parcial")]
+    except FileNotFoundError:
+        return
+    arquivos = []
+    for nome in nomes:
+        caminho = os.path.join(EXPORTACAO_DIRETORIO, nome)
+        try:
+            arquivos.append((os.path.getmtime(caminho), caminho))
+        except FileNotFoundError:
+            continue
+    arquivos.sort(reverse=True)
+    limite = time.time() - EXPORTACAO_VALIDADE_SEGUNDOS
+    for posicao, (modificado_em, caminho) in enumerate(arquivos):
+        if posicao >= EXPORTACAO_MAX_ARQUIVOS or modificado_em < limite:
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+    with _lock:
+        for chave in [chave for chave, trabalho in _trabalhos.items()
+                      if trabalho.terminado and not os.path.exists(trabalho.caminho)]:
+            del _trabalhos[chave]
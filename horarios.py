@@ -0,0 +1,204 @@
+"""Horários previstos por empresa, filial, setor ou funcionário, compilados em memória.
+
+Cada linha da tabela `horarios` define a hora prevista de um evento
+("Entrada", "Saída") num escopo: qualquer combinação de empresa, filial e
+setor, ou um funcionário (CPF); sem escopo nenhum, vale para todos. A regra
+pode se limitar a um dia da semana (ISO: 1 = segunda, 7 = domingo) e a um
+período de vigência, ambos opcionais.
+
+`TabelaHorarios` indexa as regras uma vez: `previsto` resolve uma batida
+com no máximo uma consulta a dicionário por nível de `NIVEIS`, e
+`segundos_previstos` resolve um DataFrame inteiro com um merge por nível.
+
+Precedência: vence o nível mais específico que tenha regra vigente no dia;
+no mesmo nível, a regra de um dia da semana vence a de todos os dias, e
+entre vigências sobrepostas vence a que começou por último.
+"""
+import re
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from config import HORARIOS_PADRAO, HORARIOS_POR_FILIAL
+from status_ponto import ALIASES_EVENTOS
+
+ESCOPOS = ('cpf', 'empresa', 'filial', 'setor')
+
+# Do mais para o menos específico. Funcionário vence tudo; setor vence filial,
+# que vence empresa; () é o horário padrão.
+NIVEIS = [
+    ('cpf',),
+    ('empresa', 'filial', 'setor'),
+    ('filial', 'setor'),
+    ('empresa', 'setor'),
+    ('empresa', 'filial'),
+    ('setor',),
+    ('filial',),
+    ('empresa',),
+    (),
+]
+
+_NUMERO = re.compile(r'\d+')
+
+
+def chave_filial(filial):
+    """"3" para 3, "3", "Filial 03" ou "Filial 3"; sem número, o nome em minúsculas."""
+    if filial is None or pd.isna(filial):
+        return None
+    texto = str(filial).strip()
+    numero = _NUMERO.search(texto)
+    if numero:
+        return str(int(numero.group()))
+    return texto.casefold() or None
+
+
+def _chave_texto(valor):
+    if valor is None or pd.isna(valor):
+        return None
+    return str(valor).strip().casefold() or None
+
+
+def _chave_cpf(cpf):
+    if cpf is None or pd.isna(cpf):
+        return None
+    return str(cpf).strip() or None
+
+
+def _chaves(serie, normalizar):
+    """`normalizar` aplicada a cada valor distinto de `serie` (filiais, setores e empresas são poucos)."""
+    codigos, distintos = pd.factorize(serie)
+    chaves = np.array([normalizar(valor) for valor in distintos] + [None], dtype=object)
+    return pd.Series(chaves[codigos], index=serie.index, dtype='string')
+
+
+def regras_iniciais():
+    """`(filial, evento, hora)` com que a tabela `horarios` começa (valores de config.py)."""
+    regras = [(None, evento, hora) for evento, hora in HORARIOS_PADRAO.items()]
+    for numero, horarios in HORARIOS_POR_FILIAL.items():
+        regras += [(f"Filial {numero:02d}", evento, hora) for evento, hora in horarios.items()]
+    return regras
+
+
+def _nivel(regra):
+    if regra['cpf']:
+        return ('cpf',)
+    return tuple(campo for campo in ('empresa', 'filial', 'setor') if regra[campo] is not None)
+
+
+def _segundos(hora):
+    return hora.hour * 3600 + hora.minute * 60 + hora.second
+
+
+class TabelaHorarios:
+    """Regras de `horarios` compiladas para consulta por batida ou por DataFrame.
+
+    `regras` são tuplas `(cpf, empresa, filial, setor, dia_semana, evento,
+    hora, vigente_de, vigente_ate)`, com empresa pelo nome e None onde não
+    há restrição. `codigos` mapeia `(empresa, código forte) -> cpf` dos
+    funcionários com horário próprio, para DataFrames que não trazem CPF.
+    """
+
+    def __init__(self, regras, codigos=()):
+        self._indice = {}   # (nível, chave, evento, dia_semana) -> [(prioridade, de, até, hora)]
+        linhas = []
+        for cpf, empresa, filial, setor, dia_semana, evento, hora, vigente_de, vigente_ate in regras:
+            regra = {
+                'cpf': _chave_cpf(cpf),
+                'empresa': _chave_texto(empresa),
+                'filial': chave_filial(filial),
+                'setor': _chave_texto(setor),
+            }
+            nivel = _nivel(regra)
+            chave = tuple(regra[campo] for campo in nivel)
+            evento = ALIASES_EVENTOS.get(evento, evento)
+            de, ate = vigente_de or date.min, vigente_ate or date.max
+            # Regra de todos os dias vira uma por dia da semana, atrás das específicas.
+            for dia in ([dia_semana] if dia_semana else range(1, 8)):
+                prioridade = (0 if dia_semana else 1, -de.toordinal())
+                self._indice.setdefault((nivel, chave, evento, dia), []).append((prioridade, de, ate, hora))
+                linhas.append((nivel, *(regra[campo] for campo in ESCOPOS), evento, dia, de, ate, _segundos(hora), *prioridade))
+        for entradas in self._indice.values():
+            entradas.sort(key=lambda entrada: entrada[0])
+        self._niveis = [nivel for nivel in NIVEIS if any(linha[0] == nivel for linha in linhas)]
+        self._quadros = self._montar_quadros(linhas)
+        self._cpf_por_codigo = {
+            f"{_chave_texto(empresa) or ''}\x1f{str(codigo).strip()}": cpf for empresa, codigo, cpf in codigos
+        }
+
+    def _montar_quadros(self, linhas):
+        if not linhas:
+            return {}
+        quadro = pd.DataFrame(linhas, columns=['nivel', *ESCOPOS, 'evento', 'dia_semana', 'vigente_de', 'vigente_ate', 'segundos', 'todos_os_dias', 'recencia'])
+        for campo in (*ESCOPOS, 'evento'):
+            quadro[campo] = quadro[campo].astype('string')
+        # date.min/date.max não cabem em datetime64[ns].
+        for campo, limite in (('vigente_de', pd.Timestamp.min), ('vigente_ate', pd.Timestamp.max)):
+            quadro[campo] = pd.to_datetime(quadro[campo].where(~quadro[campo].isin([date.min, date.max])), errors='coerce').fillna(limite)
+        return {nivel: grupo[[*nivel, 'evento', 'dia_semana', 'vigente_de', 'vigente_ate', 'segundos', 'todos_os_dias', 'recencia']]
+                for nivel, grupo in quadro.groupby('nivel', sort=False)}
+
+    def previsto(self, evento, dia, cpf=None, empresa=None, filial=None, setor=None):
+        """Hora prevista (`time`) do evento no dia para o funcionário; None se nenhuma regra se aplica."""
+        evento = ALIASES_EVENTOS.get(evento, evento)
+        valores = {
+            'cpf': _chave_cpf(cpf),
+            'empresa': _chave_texto(empresa),
+            'filial': chave_filial(filial),
+            'setor': _chave_texto(setor),
+        }
+        dia_semana = dia.isoweekday()
+        for nivel in self._niveis:
+            chave = tuple(valores[campo] for campo in nivel)
+            if None in chave:
+                continue
+            for _, de, ate, hora in self._indice.get((nivel, chave, evento, dia_semana), ()):
+                if de <= dia <= ate:
+                    return hora
+        return None
+
+    def segundos_previstos(self, df):
+        """Hora prevista, em segundos desde 00:00, de cada linha de `df` (NaN sem regra).
+
+        Usa as colunas 'Descrição', 'Data' ('AAAA-MM-DD' ou `date`), 'Empresa',
+        'Filial', 'Setor' e 'CPF' (ou, na falta dela, 'Código Forte' com a
+        empresa); as que faltarem contam como vazias.
+        """
+        vazia = pd.Series(pd.NA, index=df.index, dtype='string')
+        coluna = lambda nome: df[nome] if nome in df.columns else vazia
+        data = pd.to_datetime(coluna('Data'), errors='coerce')
+        empresa = _chaves(coluna('Empresa'), _chave_texto)
+        if 'CPF' in df.columns:
+            cpf = _chaves(df['CPF'], _chave_cpf)
+        else:
+            cpf = (empresa.fillna('') + '\x1f' + coluna('Código Forte').astype('string').str.strip()).map(self._cpf_por_codigo)
+        quadro = pd.DataFrame({
+            'cpf': cpf.astype('string'),
+            'empresa': empresa,
+            'filial': _chaves(coluna('Filial'), chave_filial),
+            'setor': _chaves(coluna('Setor'), _chave_texto),
+            'evento': coluna('Descrição').replace(ALIASES_EVENTOS).astype('string'),
+            # 0 (nenhuma regra) para datas inválidas.
+            'dia_semana': data.dt.dayofweek.fillna(-1).astype('int64').to_numpy() + 1,
+            'data': data,
+            'posicao': np.arange(len(df)),
+        })
+
+        previsto = np.full(len(df), np.nan)
+        pendente = np.ones(len(df), dtype=bool)
+        for nivel in self._niveis:
+            if not pendente.any():
+                break
+            campos = [*nivel, 'evento', 'dia_semana']
+            candidatos = quadro.loc[pendente, [*campos, 'data', 'posicao']].dropna(subset=campos)
+            if candidatos.empty:
+                continue
+            casados = candidatos.merge(self._quadros[nivel], on=campos)
+            casados = casados[(casados['data'] >= casados['vigente_de']) & (casados['data'] <= casados['vigente_ate'])]
+            if casados.empty:
+                continue
+            casados = casados.sort_values(['todos_os_dias', 'recencia'], kind='stable').drop_duplicates('posicao')
+            posicoes = casados['posicao'].to_numpy()
+            previsto[posicoes] = casados['segundos'].to_numpy(dtype=float)
+            pendente[posicoes] = False
+        return pd.Series(previsto, index=df.index)
@@ -0,0 +1,54 @@
+"""Tarefas de manutenção do banco, executadas fora do Streamlit.
+
+    python manutencao.py reconstruir-diarios --inicio 2024-01-01 --fim 2024-12-31
+    python manutencao.py arquivar-registros --meses 60 --diretorio /backup/ponto
+"""
+import argparse
+from datetime import date
+
+from config import RETENCAO_REGISTROS_MESES, DIRETORIO_ARQUIVO_REGISTROS
+from services import init_db, reconstruir_registros_diarios, arquivar_registros_antigos
+
+
+def _data(texto):
+    return date.fromisoformat(texto)
+
+
+def _reconstruir_diarios(args):
+    dias = reconstruir_registros_diarios(args.inicio, args.fim)
+    periodo = f"{args.inicio or '...'} a {args.fim or '...'}"
+    print(f"registros_diarios reconstruído ({periodo}): {dias} funcionário(s)/dia.")
+
+
+def _arquivar_registros(args):
+    arquivos = arquivar_registros_antigos(args.meses, args.diretorio, simular=args.simular)
+    if not arquivos:
+        print(f"Nenhuma partição com mais de {args.meses} mês(es).")
+    for caminho in arquivos:
+        print(f"{'seria arquivada em' if args.simular else 'arquivada em'} {caminho}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manutenção do banco do Ponto Omega.")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    reconstruir = comandos.add_parser("reconstruir-diarios", help="refaz registros_diarios a partir de registros")
+    reconstruir.add_argument("--inicio", type=_data, help="primeiro dia (AAAA-MM-DD); padrão: sem limite")
+    reconstruir.add_argument("--fim", type=_data, help="último dia (AAAA-MM-DD); padrão: sem limite")
+    reconstruir.set_defaults(executar=_reconstruir_diarios)
+
+    arquivar = comandos.add_parser("arquivar-registros", help="arquiva e remove partições antigas de registros")
+    arquivar.add_argument("--meses", type=int, default=RETENCAO_REGISTROS_MESES,
+                          help=f"meses mantidos no banco, contando o atual (padrão: {RETENCAO_REGISTROS_MESES})")
+    arquivar.add_argument("--diretorio", default=DIRETORIO_ARQUIVO_REGISTROS,
+                          help=f"destino dos arquivos .csv.gz (padrão: {DIRETORIO_ARQUIVO_REGISTROS})")
+    arquivar.add_argument("--simular", action="store_true", help="só lista o que seria arquivado")
+    arquivar.set_defaults(executar=_arquivar_registros)
+
+    args = parser.parse_args()
+    init_db()
+    args.executar(args)
+
+
+if __name__ == "__main__":
+    main()
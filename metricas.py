@@ -0,0 +1,343 @@
+"""Instrumentação opcional de consultas SQL, funções de services.py e reruns.
+
+Ligada por `METRICS_ENABLED=1`. Desligada, nada é envolvido: o pool abre
+conexões psycopg2 comuns, as funções de services.py ficam como estão e
+`iniciar_rerun`/`finalizar_rerun` retornam na primeira linha.
+
+Ligada, registra por impressão digital da consulta (texto normalizado, sem
+literais) e por função pública de services.py: contagem, histograma de
+latência e linhas retornadas. Por rerun do Streamlit, conta as consultas e
+separa o tempo gasto em SQL, em services.py e o restante (pandas da tela e
+renderização). Os dados saem no formato texto do Prometheus, em
+`METRICS_FILE` (regravado a cada `METRICS_FILE_INTERVAL` segundos) e/ou em
+`http://METRICS_HOST:METRICS_PORT/metrics` (127.0.0.1 por padrão; o endpoint
+não tem autenticação).
+"""
+import functools
+import hashlib
+import http.server
+import inspect
+import os
+import re
+import threading
+import time
+from collections import deque
+
+import psycopg2.extensions
+
+from config import METRICAS_ATIVAS, METRICAS_ARQUIVO, METRICAS_ARQUIVO_INTERVALO_SEGUNDOS, METRICAS_HOST, METRICAS_PORTA
+
+ATIVO = METRICAS_ATIVAS
+
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_BUCKETS_CONSULTAS_RERUN = (1, 2, 5, 10, 20, 50, 100, 200)
+
+_lock = threading.Lock()
+_local = threading.local()
+
+
+class _Histograma:
+    __slots__ = ("buckets", "contagens", "soma", "total", "maximo")
+
+    def __init__(self, buckets=_BUCKETS):
+        self.buckets = buckets
+        self.contagens = [0] * len(buckets)
+        self.soma = 0.0
+        self.total = 0
+        self.maximo = 0.0
+
+    def observar(self, valor):
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                self.contagens[i] += 1
+                break
+        self.soma += valor
+        self.total += 1
+        if valor > self.maximo:
+            self.maximo = valor
+
+    def linhas_prometheus(self, nome, rotulos):
+        base = ",".join(f'{chave}="{_escapar(valor)}"' for chave, valor in rotulos.items())
+        separador = "," if base else ""
+        acumulado = 0
+        linhas = []
+        for limite, contagem in zip(self.buckets, self.contagens):
+            acumulado += contagem
+            linhas.append(f'{nome}_bucket{{{base}{separador}le="{limite}"}} {acumulado}')
+        linhas.append(f'{nome}_bucket{{{base}{separador}le="+Inf"}} {self.total}')
+        linhas.append(f"{nome}_sum{{{base}}} {self.soma}")
+        linhas.append(f"{nome}_count{{{base}}} {self.total}")
+        return linhas
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+# impressão digital -> {"texto", "latencia": _Histograma, "linhas": int}
+_consultas = {}
+# nome da função -> _Histograma
+_funcoes = {}
+_consultas_por_rerun = _Histograma(_BUCKETS_CONSULTAS_RERUN)
+_reruns_recentes = deque(maxlen=50)
+
+
+# ---------------------------------------------------------------------- #
+# Consultas
+_LITERAL_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_NUMERO = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAMETRO = re.compile(r"%\(\w+\)s|%s")
+_LISTA = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+_ESPACOS = re.compile(r"\s+")
+
+
+def impressao_digital(sql):
+    """(id curto, texto normalizado) da consulta: literais e parâmetros viram `?`."""
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    elif not isinstance(sql, str):
+        sql = str(sql)
+    texto = _PARAMETRO.sub("?", sql)
+    texto = _LITERAL_TEXTO.sub("?", texto)
+    texto = _NUMERO.sub("?", texto)
+    texto = _LISTA.sub("(...)", texto)
+    texto = _ESPACOS.sub(" ", texto).strip()
+    return hashlib.md5(texto.encode("utf-8")).hexdigest()[:12], texto
+
+
+def _registrar_consulta(sql, segundos, linhas):
+    digital, texto = impressao_digital(sql)
+    with _lock:
+        item = _consultas.get(digital)
+        if item is None:
+            item = _consultas[digital] = {"texto": texto, "latencia": _Histograma(), "linhas": 0}
+        item["latencia"].observar(segundos)
+        if linhas > 0:
+            item["linhas"] += linhas
+    if getattr(_local, "rerun_inicio", None) is not None:
+        _local.consultas += 1
+        _local.segundos_sql += segundos
+
+
+class _CursorInstrumentado:
+    """Mixin que mede execute/executemany/copy_expert de qualquer classe de cursor."""
+
+    def execute(self, query, vars=None):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _registrar_consulta(query, time.perf_counter() - inicio, self.rowcount)
+
+    def executemany(self, query, vars_list):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            _registrar_consulta(query, time.perf_counter() - inicio, self.rowcount)
+
+    def copy_expert(self, sql, file, size=8192):
+        inicio = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            _registrar_consulta(sql, time.perf_counter() - inicio, self.rowcount)
+
+
+@functools.lru_cache(maxsize=None)
+def _classe_instrumentada(classe_cursor):
+    return type(f"Instrumentado{classe_cursor.__name__}", (_CursorInstrumentado, classe_cursor), {})
+
+
+class ConexaoInstrumentada(psycopg2.extensions.connection):
+    """Conexão cujos cursores (inclusive DictCursor e nomeados) são medidos."""
+
+    def cursor(self, *args, **kwargs):
+        classe = kwargs.get("cursor_factory") or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs["cursor_factory"] = _classe_instrumentada(classe)
+        return super().cursor(*args, **kwargs)
+
+
+def fabrica_conexao():
+    """`connection_factory` para o pool: None quando a instrumentação está desligada."""
+    return ConexaoInstrumentada if ATIVO else None
+
+
+# ---------------------------------------------------------------------- #
+# Funções de services.py
+def _medir_funcao(nome, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profundidade = getattr(_local, "profundidade", 0)
+        _local.profundidade = profundidade + 1
+        inicio = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            segundos = time.perf_counter() - inicio
+            _local.profundidade = profundidade
+            with _lock:
+                histograma = _funcoes.get(nome)
+                if histograma is None:
+                    histograma = _funcoes[nome] = _Histograma()
+                histograma.observar(segundos)
+            # Só a chamada mais externa conta no tempo de services do rerun.
+            if profundidade == 0 and getattr(_local, "rerun_inicio", None) is not None:
+                _local.segundos_servicos += segundos
+    # Quem usa `func.__wrapped__` para furar o cache continua chegando à original.
+    wrapper.__wrapped__ = getattr(func, "__wrapped__", func)
+    return wrapper
+
+
+def instrumentar_modulo(namespace, modulo):
+    """Envolve as funções públicas definidas em `modulo` (exceto geradores e context managers)."""
+    if not ATIVO:
+        return
+    for nome, objeto in list(namespace.items()):
+        if nome.startswith("_") or not inspect.isfunction(objeto):
+            continue
+        original = inspect.unwrap(objeto)
+        if original.__module__ != modulo or inspect.isgeneratorfunction(original):
+            continue
+        if getattr(objeto, "__wrapped__", None) is not None and inspect.isgeneratorfunction(objeto.__wrapped__):
+            continue  # @contextmanager
+        namespace[nome] = _medir_funcao(nome, objeto)
+
+
+# ---------------------------------------------------------------------- #
+# Reruns do Streamlit
+def iniciar_rerun(pagina=""):
+    if not ATIVO:
+        return
+    if getattr(_local, "rerun_inicio", None) is not None:
+        # O rerun anterior saiu por exceção (st.rerun, st.stop) antes de finalizar.
+        finalizar_rerun()
+    _local.rerun_inicio = time.perf_counter()
+    _local.pagina = pagina
+    _local.consultas = 0
+    _local.segundos_sql = 0.0
+    _local.segundos_servicos = 0.0
+
+
+def finalizar_rerun():
+    if not ATIVO or getattr(_local, "rerun_inicio", None) is None:
+        return
+    total = time.perf_counter() - _local.rerun_inicio
+    _local.rerun_inicio = None
+    resumo = {
+        "momento": time.time(),
+        "pagina": _local.pagina,
+        "consultas": _local.consultas,
+        "segundos_total": total,
+        "segundos_sql": _local.segundos_sql,
+        "segundos_servicos": _local.segundos_servicos,
+        "segundos_restante": max(0.0, total - _local.segundos_servicos),
+    }
+    with _lock:
+        _consultas_por_rerun.observar(_local.consultas)
+        _reruns_recentes.append(resumo)
+
+
+# ---------------------------------------------------------------------- #
+# Leitura e exportação
+def consultas_mais_lentas(limite=20):
+    with _lock:
+        itens = [
+            {"impressao_digital": digital, "consulta": item["texto"], "chamadas": item["latencia"].total,
+             "media_ms": item["latencia"].soma / item["latencia"].total * 1000,
+             "max_ms": item["latencia"].maximo * 1000, "total_ms": item["latencia"].soma * 1000,
+             "linhas": item["linhas"]}
+            for digital, item in _consultas.items() if item["latencia"].total
+        ]
+    return sorted(itens, key=lambda item: item["total_ms"], reverse=True)[:limite]
+
+
+def funcoes_mais_lentas(limite=20):
+    with _lock:
+        itens = [
+            {"funcao": nome, "chamadas": h.total, "media_ms": h.soma / h.total * 1000,
+             "max_ms": h.maximo * 1000, "total_ms": h.soma * 1000}
+            for nome, h in _funcoes.items() if h.total
+        ]
+    return sorted(itens, key=lambda item: item["total_ms"], reverse=True)[:limite]
+
+
+def reruns_recentes():
+    with _lock:
+        return list(reversed(_reruns_recentes))
+
+
+def texto_prometheus():
+    with _lock:
+        linhas = [
+            "# HELP ponto_db_consulta_segundos Latência das consultas SQL por impressão digital.",
+            "# TYPE ponto_db_consulta_segundos histogram",
+        ]
+        for digital, item in _consultas.items():
+            linhas += item["latencia"].linhas_prometheus("ponto_db_consulta_segundos", {"digital": digital})
+        linhas += ["# HELP ponto_db_linhas_total Linhas retornadas ou afetadas por impressão digital.",
+                   "# TYPE ponto_db_linhas_total counter"]
+        for digital, item in _consultas.items():
+            linhas.append(f'ponto_db_linhas_total{{digital="{digital}"}} {item["linhas"]}')
+        linhas += ["# HELP ponto_db_consulta_info Texto normalizado de cada impressão digital.",
+                   "# TYPE ponto_db_consulta_info gauge"]
+        for digital, item in _consultas.items():
+            linhas.append(f'ponto_db_consulta_info{{digital="{digital}",consulta="{_escapar(item["texto"][:200])}"}} 1')
+        linhas += ["# HELP ponto_servico_segundos Latência das funções públicas de services.py.",
+                   "# TYPE ponto_servico_segundos histogram"]
+        for nome, histograma in _funcoes.items():
+            linhas += histograma.linhas_prometheus("ponto_servico_segundos", {"funcao": nome})
+        linhas += ["# HELP ponto_rerun_consultas Consultas SQL por rerun do Streamlit.",
+                   "# TYPE ponto_rerun_consultas histogram"]
+        linhas += _consultas_por_rerun.linhas_prometheus("ponto_rerun_consultas", {})
+    return "\n".join(linhas) + "\n"
+
+
+def _gravar_arquivo_periodicamente(caminho, intervalo):
+    while True:
+        time.sleep(intervalo)
+        temporario = f"{caminho}.{os.getpid()}.tmp"
+        try:
+            with open(temporario, "w", encoding="utf-8") as arquivo:
+                arquivo.write(texto_prometheus())
+            os.replace(temporario, caminho)
+        except OSError:
+            pass
+
+
+class _HandlerMetricas(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        corpo = texto_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+_exportadores_iniciados = False
+
+
+def iniciar_exportadores():
+    """Sobe o gravador de arquivo e/ou o endpoint HTTP, uma vez por processo."""
+    global _exportadores_iniciados
+    with _lock:
+        if not ATIVO or _exportadores_iniciados:
+            return
+        _exportadores_iniciados = True
+    if METRICAS_ARQUIVO:
+        threading.Thread(target=_gravar_arquivo_periodicamente,
+                         args=(METRICAS_ARQUIVO, METRICAS_ARQUIVO_INTERVALO_SEGUNDOS),
+                         name="metricas-arquivo", daemon=True).start()
+    if METRICAS_PORTA:
+        try:
+            servidor = http.server.ThreadingHTTPServer((METRICAS_HOST, METRICAS_PORTA), _HandlerMetricas)
+        except OSError:
+            return  # porta ocupada (outro worker já exporta)
+        threading.Thread(target=servidor.serve_forever, name="metricas-http", daemon=True).start()
@@ -0,0 +1,323 @@
+"""Migrações versionadas do esquema.
+
+Cada migração é uma função `(conn) -> None` registrada em `MIGRACOES` com um
+número de versão crescente. `aplicar_migracoes` executa, em ordem, as que
+ainda não constam em `schema_versao`. Migrações longas podem fazer commits
+intermediários, desde que sejam seguras para reexecutar caso sejam
+interrompidas no meio.
+"""
+
+import horarios
+import particoes
+import resumo_diario
+
+# Chave do advisory lock que serializa migrações entre processos/réplicas.
+_LOCK_MIGRACOES = 7_301_001
+
+LOTE_MIGRACAO = 5000
+
+
+def _v1_esquema_inicial(conn):
+    with conn.cursor() as cursor:
+        cursor.execute('CREATE TABLE IF NOT EXISTS empresas (id SERIAL PRIMARY KEY, nome_empresa TEXT NOT NULL UNIQUE, cnpj TEXT)')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS funcionarios (
+                cpf TEXT PRIMARY KEY,
+                codigo TEXT NOT NULL,
+                nome TEXT NOT NULL,
+                senha TEXT NOT NULL,
+                role TEXT NOT NULL,
+                empresa_id INTEGER,
+                cod_tipo TEXT,
+                tipo TEXT,
+                filial TEXT,
+                FOREIGN KEY (empresa_id) REFERENCES empresas (id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS registros (
+                id TEXT PRIMARY KEY,
+                cpf_funcionario TEXT NOT NULL,
+                nome TEXT NOT NULL,
+                data TEXT NOT NULL,
+                hora TEXT NOT NULL,
+                descricao TEXT NOT NULL,
+                diferenca_min INTEGER NOT NULL,
+                observacao TEXT,
+                FOREIGN KEY (cpf_funcionario) REFERENCES funcionarios (cpf)
+            )
+        ''')
+    conn.commit()
+
+
+def _v2_registros_tipados(conn):
+    """data/hora TEXT -> DATE/TIME, id TEXT -> BIGINT e índices de consulta.
+
+    As linhas existentes são convertidas em lotes de `LOTE_MIGRACAO`, com
+    commit a cada lote; a coluna `id_novo` nula marca o que ainda falta.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT data_type FROM information_schema.columns WHERE table_name = 'registros' AND column_name = 'data'")
+        if cursor.fetchone()[0] == 'date':
+            return
+
+        cursor.execute("CREATE SEQUENCE IF NOT EXISTS registros_id_seq AS BIGINT")
+        cursor.execute('''
+            ALTER TABLE registros
+                ADD COLUMN IF NOT EXISTS id_novo BIGINT,
+                ADD COLUMN IF NOT EXISTS data_nova DATE,
+                ADD COLUMN IF NOT EXISTS hora_nova TIME
+        ''')
+        conn.commit()
+
+        while True:
+            cursor.execute('''
+                UPDATE registros
+                   SET id_novo = nextval('registros_id_seq'),
+                       data_nova = data::date,
+                       hora_nova = hora::time
+                 WHERE ctid = ANY (ARRAY(
+                       SELECT ctid FROM registros WHERE id_novo IS NULL
+                       ORDER BY data, hora LIMIT %s))
+            ''', (LOTE_MIGRACAO,))
+            convertidas = cursor.rowcount
+            conn.commit()
+            if convertidas < LOTE_MIGRACAO:
+                break
+
+        cursor.execute("LOCK TABLE registros IN ACCESS EXCLUSIVE MODE")
+        # Linhas inseridas por versões antigas do app durante a conversão.
+        cursor.execute('''
+            UPDATE registros
+               SET id_novo = nextval('registros_id_seq'), data_nova = data::date, hora_nova = hora::time
+             WHERE id_novo IS NULL
+        ''')
+        cursor.execute("ALTER TABLE registros DROP CONSTRAINT IF EXISTS registros_pkey")
+        cursor.execute("ALTER TABLE registros DROP COLUMN id, DROP COLUMN data, DROP COLUMN hora")
+        cursor.execute("ALTER TABLE registros RENAME COLUMN id_novo TO id")
+        cursor.execute("ALTER TABLE registros RENAME COLUMN data_nova TO data")
+        cursor.execute("ALTER TABLE registros RENAME COLUMN hora_nova TO hora")
+        cursor.execute('''
+            ALTER TABLE registros
+                ALTER COLUMN id SET DEFAULT nextval('registros_id_seq'),
+                ALTER COLUMN id SET NOT NULL,
+                ALTER COLUMN data SET NOT NULL,
+                ALTER COLUMN hora SET NOT NULL,
+                ADD PRIMARY KEY (id)
+        ''')
+        cursor.execute("ALTER SEQUENCE registros_id_seq OWNED BY registros.id")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_registros_cpf_data ON registros (cpf_funcionario, data)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_registros_data ON registros (data)")
+    conn.commit()
+
+
+def _v3_pontos_dia(conn):
+    """Estado diário do ponto por funcionário, que serializa `bater_ponto`."""
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS pontos_dia (
+                cpf_funcionario TEXT NOT NULL,
+                data DATE NOT NULL,
+                eventos SMALLINT NOT NULL,
+                PRIMARY KEY (cpf_funcionario, data),
+                FOREIGN KEY (cpf_funcionario) REFERENCES funcionarios (cpf)
+            )
+        ''')
+        cursor.execute("LOCK TABLE registros IN SHARE MODE")
+        cursor.execute('''
+            INSERT INTO pontos_dia (cpf_funcionario, data, eventos)
+            SELECT cpf_funcionario, data, COUNT(*) FROM registros GROUP BY cpf_funcionario, data
+            ON CONFLICT (cpf_funcionario, data) DO UPDATE SET eventos = EXCLUDED.eventos
+        ''')
+    conn.commit()
+
+
+def _v4_registros_diarios(conn):
+    """Resumo por funcionário/dia, preenchido a partir de todo o histórico."""
+    with conn.cursor() as cursor:
+        resumo_diario.criar_tabela(cursor)
+        cursor.execute("LOCK TABLE registros IN SHARE MODE")
+        resumo_diario.reconstruir_periodo(cursor)
+    conn.commit()
+
+
+def _v5_registros_particionados(conn):
+    """registros passa a ser particionada por mês de `data`.
+
+    Os dados são copiados mês a mês para a nova tabela numa única transação,
+    com a antiga travada contra escrita (leituras continuam). A chave
+    primária vira (id, data), exigência do particionamento; `id` continua
+    vindo de `registros_id_seq` e segue único.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = 'registros'::regclass")
+        if cursor.fetchone()[0] == 'p':
+            return
+        cursor.execute("LOCK TABLE registros IN EXCLUSIVE MODE")
+        cursor.execute('''
+            CREATE TABLE registros_particionada (
+                id BIGINT NOT NULL DEFAULT nextval('registros_id_seq'),
+                cpf_funcionario TEXT NOT NULL,
+                nome TEXT NOT NULL,
+                descricao TEXT NOT NULL,
+                diferenca_min INTEGER NOT NULL,
+                observacao TEXT,
+                data DATE NOT NULL,
+                hora TIME NOT NULL,
+                PRIMARY KEY (id, data),
+                FOREIGN KEY (cpf_funcionario) REFERENCES funcionarios (cpf)
+            ) PARTITION BY RANGE (data)
+        ''')
+        cursor.execute("SELECT MIN(data), MAX(data) FROM registros")
+        primeiro, ultimo = cursor.fetchone()
+        mes = particoes.inicio_do_mes(primeiro) if primeiro else None
+        while mes is not None and mes <= ultimo:
+            particoes.criar_particao(cursor, mes, tabela="registros_particionada")
+            cursor.execute('''
+                INSERT INTO registros_particionada (id, cpf_funcionario, nome, descricao, diferenca_min, observacao, data, hora)
+                SELECT id, cpf_funcionario, nome, descricao, diferenca_min, observacao, data, hora
+                  FROM registros WHERE data >= %s AND data < %s
+            ''', (mes, particoes.somar_meses(mes, 1)))
+            mes = particoes.somar_meses(mes, 1)
+        cursor.execute("ALTER SEQUENCE registros_id_seq OWNED BY NONE")
+        cursor.execute("DROP TABLE registros")
+        cursor.execute("ALTER TABLE registros_particionada RENAME TO registros")
+        cursor.execute("ALTER TABLE registros RENAME CONSTRAINT registros_particionada_pkey TO registros_pkey")
+        cursor.execute("ALTER TABLE registros RENAME CONSTRAINT registros_particionada_cpf_funcionario_fkey TO registros_cpf_funcionario_fkey")
+        cursor.execute("ALTER SEQUENCE registros_id_seq OWNED BY registros.id")
+        cursor.execute("CREATE INDEX idx_registros_cpf_data ON registros (cpf_funcionario, data)")
+        cursor.execute("CREATE INDEX idx_registros_data ON registros (data)")
+    conn.commit()
+
+
+def _v6_funcionarios_pis(conn):
+    """PIS do funcionário, usado para casar as marcações de arquivos AFD antigos."""
+    with conn.cursor() as cursor:
+        cursor.execute("ALTER TABLE funcionarios ADD COLUMN IF NOT EXISTS pis TEXT")
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_funcionarios_pis ON funcionarios (pis) WHERE pis IS NOT NULL")
+    conn.commit()
+
+
+def _v7_horarios(conn):
+    """Horários previstos por escopo, dia da semana e vigência (ver horarios.py)."""
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS horarios (
+                id SERIAL PRIMARY KEY,
+                empresa_id INTEGER REFERENCES empresas (id),
+                filial TEXT,
+                setor TEXT,
+                cpf_funcionario TEXT REFERENCES funcionarios (cpf),
+                dia_semana SMALLINT CHECK (dia_semana BETWEEN 1 AND 7),
+                evento TEXT NOT NULL,
+                hora TIME NOT NULL,
+                vigente_de DATE,
+                vigente_ate DATE,
+                CHECK (vigente_de IS NULL OR vigente_ate IS NULL OR vigente_de <= vigente_ate)
+            )
+        ''')
+        cursor.execute("SELECT COUNT(*) FROM horarios")
+        if cursor.fetchone()[0] == 0:
+            cursor.executemany("INSERT INTO horarios (filial, evento, hora) VALUES (%s, %s, %s)", horarios.regras_iniciais())
+    conn.commit()
+
+
+def _v8_registros_versao(conn):
+    """registros.versao: id da transação que gravou ou alterou a linha por último.
+
+    Serve às leituras incrementais (`ler_registros_ao_vivo`). O DEFAULT não
+    reescreve a tabela: linhas anteriores ficam com versao NULL. Exclusões
+    não deixam linha para trás, então incrementam `registros_geracao`.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("ALTER TABLE registros ADD COLUMN IF NOT EXISTS versao BIGINT")
+        cursor.execute("ALTER TABLE registros ALTER COLUMN versao SET DEFAULT pg_current_xact_id()::text::bigint")
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION registros_marcar_versao() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                NEW.versao := pg_current_xact_id()::text::bigint;
+                RETURN NEW;
+            END
+            $$
+        ''')
+        cursor.execute("DROP TRIGGER IF EXISTS registros_versao ON registros")
+        cursor.execute('''
+            CREATE TRIGGER registros_versao BEFORE UPDATE ON registros
+               FOR EACH ROW EXECUTE FUNCTION registros_marcar_versao()
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_registros_versao ON registros (versao)")
+        cursor.execute("CREATE TABLE IF NOT EXISTS registros_geracao (valor BIGINT NOT NULL)")
+        cursor.execute("INSERT INTO registros_geracao (valor) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM registros_geracao)")
+    conn.commit()
+
+
+def _v9_banco_horas(conn):
+    """Saldos mensais fechados do banco de horas (ver banco_horas.py)."""
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS banco_horas (
+                cpf_funcionario TEXT NOT NULL REFERENCES funcionarios (cpf),
+                mes DATE NOT NULL,
+                saldo_min INTEGER NOT NULL,
+                acumulado_min INTEGER NOT NULL,
+                dias INTEGER NOT NULL,
+                fechado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+                PRIMARY KEY (cpf_funcionario, mes)
+            )
+        ''')
+    conn.commit()
+
+
+MIGRACOES = [
+    (1, "Esquema inicial (empresas, funcionarios, registros)", _v1_esquema_inicial),
+    (2, "registros: DATE/TIME, id BIGINT e índices (cpf_funcionario, data) e (data)", _v2_registros_tipados),
+    (3, "pontos_dia: contador diário de eventos por funcionário", _v3_pontos_dia),
+    (4, "registros_diarios: resumo de entrada, saída e horas por funcionário/dia", _v4_registros_diarios),
+    (5, "registros particionada por mês de data", _v5_registros_particionados),
+    (6, "funcionarios.pis para importação de AFD", _v6_funcionarios_pis),
+    (7, "horarios: horário previsto por empresa, filial, setor ou funcionário", _v7_horarios),
+    (8, "registros.versao e registros_geracao para leituras incrementais", _v8_registros_versao),
+    (9, "banco_horas: saldo mensal fechado por funcionário", _v9_banco_horas),
+]
+
+
+def versao_atual(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT to_regclass('schema_versao')")
+        if cursor.fetchone()[0] is None:
+            return 0
+        cursor.execute("SELECT COALESCE(MAX(versao), 0) FROM schema_versao")
+        return cursor.fetchone()[0]
+
+
+def aplicar_migracoes(conn):
+    """Leva o banco até a última versão de `MIGRACOES`. Retorna a versão final."""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(%s)", (_LOCK_MIGRACOES,))
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS schema_versao (
+                    versao INTEGER PRIMARY KEY,
+                    descricao TEXT NOT NULL,
+                    aplicada_em TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            ''')
+        conn.commit()
+        atual = versao_atual(conn)
+        for versao, descricao, migracao in MIGRACOES:
+            if versao <= atual:
+                continue
+            migracao(conn)
+            with conn.cursor() as cursor:
+                cursor.execute("INSERT INTO schema_versao (versao, descricao) VALUES (%s, %s)", (versao, descricao))
+            conn.commit()
+            atual = versao
+        return atual
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (_LOCK_MIGRACOES,))
+        conn.commit()
@@ -0,0 +1,104 @@
+"""Partições mensais de `registros` (RANGE por `data`) e arquivamento das antigas.
+
+Cada mês fica em `registros_AAAA_MM`. `garantir_particoes` cria as que
+faltam num intervalo; `arquivar_particoes` desanexa as partições que
+terminam antes de um corte, grava cada uma em `<diretorio>/registros_AAAA_MM.csv.gz`
+e só então as remove.
+"""
+import gzip
+import os
+import re
+from datetime import date
+
+_NOME_PARTICAO = re.compile(r"^registros_(\d{4})_(\d{2})$")
+
+# Colunas gravadas nos arquivos; `versao` só tem sentido dentro do banco.
+COLUNAS_ARQUIVO = "id, cpf_funcionario, nome, descricao, diferenca_min, observacao, data, hora"
+
+
+def inicio_do_mes(dia):
+    return dia.replace(day=1)
+
+
+def somar_meses(dia, meses):
+    indice = dia.year * 12 + dia.month - 1 + meses
+    return date(indice // 12, indice % 12 + 1, 1)
+
+
+def nome_particao(mes):
+    return f"registros_{mes.year:04d}_{mes.month:02d}"
+
+
+def criar_particao(cursor, mes, tabela="registros"):
+    """Cria (se não existir) a partição do mês de `mes` em `tabela`."""
+    mes = inicio_do_mes(mes)
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {nome_particao(mes)} PARTITION OF {tabela} "
+        "FOR VALUES FROM (%s) TO (%s)",
+        (mes, somar_meses(mes, 1)),
+    )
+
+
+def garantir_particoes(cursor, data_inicio, data_fim):
+    """Cria as partições de todos os meses entre `data_inicio` e `data_fim`."""
+    existentes = set(listar_particoes(cursor))
+    mes = inicio_do_mes(data_inicio)
+    while mes <= data_fim:
+        if mes not in existentes:
+            criar_particao(cursor, mes)
+        mes = somar_meses(mes, 1)
+
+
+def listar_particoes(cursor):
+    """Meses (primeiro dia) das partições anexadas a `registros`, em ordem."""
+    cursor.execute('''
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+         WHERE i.inhparent = 'registros'::regclass
+    ''')
+    meses = []
+    for (nome,) in cursor.fetchall():
+        encontrado = _NOME_PARTICAO.match(nome)
+        if encontrado:
+            meses.append(date(int(encontrado.group(1)), int(encontrado.group(2)), 1))
+    return sorted(meses)
+
+
+def arquivar_particoes(conn, anteriores_a, diretorio, simular=False):
+    """Arquiva e remove as partições cujos meses terminam antes de `anteriores_a`.
+
+    Cada partição vai numa transação própria: desanexa, copia para o
+    arquivo .csv.gz (com cabeçalho), remove a tabela e apaga os dados
+    derivados (`pontos_dia`, `registros_diarios`) do mesmo mês. Se algo
+    falhar, o rollback devolve a partição intacta. Retorna os arquivos gravados.
+    """
+    with conn.cursor() as cursor:
+        meses = [mes for mes in listar_particoes(cursor) if somar_meses(mes, 1) <= anteriores_a]
+    if simular:
+        return [os.path.join(diretorio, f"{nome_particao(mes)}.csv.gz") for mes in meses]
+
+    os.makedirs(diretorio, exist_ok=True)
+    arquivos = []
+    for mes in meses:
+        nome = nome_particao(mes)
+        caminho = os.path.join(diretorio, f"{nome}.csv.gz")
+        temporario = caminho + ".parcial"
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f"ALTER TABLE registros DETACH PARTITION {nome}")
+                with gzip.open(temporario, "wb") as arquivo:
+                    cursor.copy_expert(f"COPY (SELECT {COLUNAS_ARQUIVO} FROM {nome} ORDER BY data, hora, id) TO STDOUT WITH (FORMAT csv, HEADER)", arquivo)
+                with open(temporario, "rb") as arquivo:
+                    os.fsync(arquivo.fileno())
+                os.replace(temporario, caminho)
+                fim = somar_meses(mes, 1)
+                cursor.execute("DELETE FROM registros_diarios WHERE data >= %s AND data < %s", (mes, fim))
+                cursor.execute("DELETE FROM pontos_dia WHERE data >= %s AND data < %s", (mes, fim))
+                cursor.execute(f"DROP TABLE {nome}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+        arquivos.append(caminho)
+    return arquivos
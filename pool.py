@@ -0,0 +1,222 @@
+import os
+import threading
+import time
+from collections import deque
+
+import psycopg2
+import psycopg2.extensions
+
+
+class PoolEsgotado(psycopg2.OperationalError):
+    """Nenhuma conexão ficou livre dentro do tempo limite de espera."""
+
+
+class ConnectionPool:
+    """Pool de conexões psycopg2 thread-safe.
+
+    Mantém até `maximo` conexões abertas, reaproveita as ociosas (LIFO) e
+    descarta as que estão quebradas, ociosas há tempo demais ou mais velhas
+    que `idade_maxima`. Conexões ociosas há mais de `ping_apos` segundos
+    passam por um `SELECT 1` antes de serem entregues.
+    """
+
+    def __init__(self, conn_string, minimo=1, maximo=10, timeout=30.0,
+                 ocioso_maximo=300.0, idade_maxima=3600.0, ping_apos=10.0,
+                 connection_factory=None):
+        if maximo < 1 or minimo < 0 or minimo > maximo:
+            raise ValueError("Limites do pool inválidos: exige 0 <= minimo <= maximo e maximo >= 1.")
+        self._conn_string = conn_string
+        self._connection_factory = connection_factory
+        self.minimo = minimo
+        self.maximo = maximo
+        self.timeout = timeout
+        self.ocioso_maximo = ocioso_maximo
+        self.idade_maxima = idade_maxima
+        self.ping_apos = ping_apos
+
+        self._cond = threading.Condition()
+        self._ociosas = deque()  # (conn, criada_em, devolvida_em)
+        self._em_uso = {}        # id(conn) -> criada_em
+        self._herdadas = []      # conexões de antes de um fork (ver _resetar_apos_fork)
+        self._total = 0          # conexões abertas ou em abertura
+        self._pid = os.getpid()
+        self._fechado = False
+
+        self._checkouts = 0
+        self._esperas = 0
+        self._timeouts = 0
+        self._criadas = 0
+        self._descartadas = 0
+        self._latencia_total = 0.0
+        self._latencia_max = 0.0
+        self._latencias = deque(maxlen=1024)
+
+    # ------------------------------------------------------------------ #
+    def _abrir(self):
+        conn = psycopg2.connect(self._conn_string, connection_factory=self._connection_factory)
+        with self._cond:
+            self._criadas += 1
+        return conn
+
+    def _descartar(self, conn):
+        with self._cond:
+            self._descartadas += 1
+            self._total -= 1
+            self._cond.notify()
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _saudavel(self, conn, devolvida_em, agora):
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if agora - devolvida_em >= self.ping_apos:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def _resetar_apos_fork(self):
+        # Conexões herdadas de outro processo não podem ser reutilizadas nem
+        # liberadas: o psycopg2 fecha a conexão quando o objeto é destruído, e
+        # o PQfinish manda o Terminate pelo socket que o processo pai ainda
+        # usa. Ficam referenciadas em `_herdadas` enquanto o processo viver.
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._herdadas.extend(conn for conn, _, _ in self._ociosas)
+            self._ociosas.clear()
+            self._em_uso.clear()
+            self._total = 0
+
+    # ------------------------------------------------------------------ #
+    def obter(self):
+        inicio = time.perf_counter()
+        limite = time.monotonic() + self.timeout
+        esperou = False
+        while True:
+            candidata = None
+            with self._cond:
+                if self._fechado:
+                    raise PoolEsgotado("O pool de conexões foi encerrado.")
+                self._resetar_apos_fork()
+                if self._ociosas:
+                    candidata = self._ociosas.pop()
+                elif self._total < self.maximo:
+                    self._total += 1
+                else:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        self._timeouts += 1
+                        raise PoolEsgotado(
+                            f"Tempo de espera por conexão esgotado ({self.timeout:.0f}s, {self.maximo} em uso)."
+                        )
+                    if not esperou:
+                        self._esperas += 1
+                        esperou = True
+                    self._cond.wait(restante)
+                    continue
+
+            if candidata is not None:
+                conn, criada_em, devolvida_em = candidata
+                agora = time.monotonic()
+                expirada = (agora - devolvida_em > self.ocioso_maximo
+                            or agora - criada_em > self.idade_maxima)
+                if expirada or not self._saudavel(conn, devolvida_em, agora):
+                    self._descartar(conn)
+                    continue
+            else:
+                try:
+                    conn = self._abrir()
+                except Exception:
+                    with self._cond:
+                        self._total -= 1
+                        self._cond.notify()
+                    raise
+                criada_em = time.monotonic()
+
+            latencia = time.perf_counter() - inicio
+            with self._cond:
+                self._em_uso[id(conn)] = criada_em
+                self._checkouts += 1
+                self._latencia_total += latencia
+                self._latencia_max = max(self._latencia_max, latencia)
+                self._latencias.append(latencia)
+            return conn
+
+    def devolver(self, conn):
+        with self._cond:
+            self._resetar_apos_fork()
+            criada_em = self._em_uso.pop(id(conn), None)
+            if criada_em is None:
+                # Conexão desconhecida: em uso no pai na hora do fork.
+                self._herdadas.append(conn)
+                return
+        reutilizavel = not self._fechado and not conn.closed
+        if reutilizavel:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                if conn.autocommit:
+                    conn.autocommit = False
+            except psycopg2.Error:
+                reutilizavel = False
+        if reutilizavel:
+            with self._cond:
+                self._ociosas.append((conn, criada_em, time.monotonic()))
+                self._cond.notify()
+        else:
+            self._descartar(conn)
+
+    def preencher(self):
+        """Abre conexões até atingir o mínimo configurado."""
+        while True:
+            with self._cond:
+                self._resetar_apos_fork()
+                if self._total >= self.minimo:
+                    return
+                self._total += 1
+            try:
+                conn = self._abrir()
+            except Exception:
+                with self._cond:
+                    self._total -= 1
+                raise
+            agora = time.monotonic()
+            with self._cond:
+                self._ociosas.append((conn, agora, agora))
+                self._cond.notify()
+
+    def fechar(self):
+        with self._cond:
+            self._fechado = True
+            self._resetar_apos_fork()
+            ociosas = list(self._ociosas)
+            self._ociosas.clear()
+            self._cond.notify_all()
+        for conn, _, _ in ociosas:
+            self._descartar(conn)
+
+    def estatisticas(self):
+        with self._cond:
+            latencias = sorted(self._latencias)
+            p95 = latencias[int(0.95 * (len(latencias) - 1))] if latencias else 0.0
+            return {
+                "em_uso": len(self._em_uso),
+                "ociosas": len(self._ociosas),
+                "total": self._total,
+                "maximo": self.maximo,
+                "checkouts": self._checkouts,
+                "esperas": self._esperas,
+                "timeouts": self._timeouts,
+                "criadas": self._criadas,
+                "descartadas": self._descartadas,
+                "latencia_checkout_media_ms": (self._latencia_total / self._checkouts * 1000) if self._checkouts else 0.0,
+                "latencia_checkout_p95_ms": p95 * 1000,
+                "latencia_checkout_max_ms": self._latencia_max * 1000,
+            }
@@ -0,0 +1,108 @@
+"""Resumo diário do ponto (`registros_diarios`): uma linha por funcionário/dia.
+
+Guarda o que o relatório diário precisa — primeira Entrada e Saída, minutos
+trabalhados, diferenças e observações — para que ele não tenha de
+re-pivotar os eventos brutos. Toda escrita em `registros` deve chamar
+`recalcular_dias` na mesma transação com os (cpf, data) afetados;
+`reconstruir_periodo` refaz um intervalo inteiro a partir de `registros`.
+"""
+
+# Agrega `registros` por (cpf, data). `{filtro}` restringe as linhas lidas
+# e recebe os mesmos parâmetros nomeados em todas as chamadas.
+_SQL_AGREGAR = """
+    WITH base AS (
+        SELECT r.id, r.cpf_funcionario, r.data, r.hora, r.nome, r.diferenca_min, r.observacao,
+               CASE r.descricao WHEN 'Início do Expediente' THEN 'Entrada'
+                                WHEN 'Fim do Expediente' THEN 'Saída'
+                                ELSE r.descricao END AS evento
+        FROM registros r
+        WHERE {filtro}
+    ),
+    dias AS (
+        SELECT cpf_funcionario, data,
+               (array_agg(nome ORDER BY hora, id))[1] AS nome,
+               MIN(hora) FILTER (WHERE evento = 'Entrada') AS entrada,
+               MIN(hora) FILTER (WHERE evento = 'Saída') AS saida,
+               (array_agg(diferenca_min ORDER BY hora, id) FILTER (WHERE evento = 'Entrada'))[1] AS diferenca_entrada_min,
+               (array_agg(diferenca_min ORDER BY hora, id) FILTER (WHERE evento = 'Saída'))[1] AS diferenca_saida_min,
+               COUNT(*) AS eventos
+        FROM base
+        GROUP BY cpf_funcionario, data
+    ),
+    obs AS (
+        SELECT cpf_funcionario, data, string_agg(observacao, ' | ' ORDER BY hora, id) AS observacoes
+        FROM (
+            SELECT DISTINCT ON (cpf_funcionario, data, observacao) cpf_funcionario, data, observacao, hora, id
+            FROM base WHERE observacao IS NOT NULL
+            ORDER BY cpf_funcionario, data, observacao, hora, id
+        ) distintas
+        GROUP BY cpf_funcionario, data
+    )
+    INSERT INTO registros_diarios (cpf_funcionario, data, nome, entrada, saida, minutos_trabalhados,
+                                   diferenca_entrada_min, diferenca_saida_min, observacoes, eventos, atualizado_em)
+    SELECT d.cpf_funcionario, d.data, d.nome, d.entrada, d.saida,
+           FLOOR(EXTRACT(EPOCH FROM d.saida - d.entrada) / 60)::integer,
+           d.diferenca_entrada_min, d.diferenca_saida_min, o.observacoes, d.eventos, now()
+    FROM dias d LEFT JOIN obs o ON o.cpf_funcionario = d.cpf_funcionario AND o.data = d.data
+    ON CONFLICT (cpf_funcionario, data) DO UPDATE SET
+        nome = EXCLUDED.nome,
+        entrada = EXCLUDED.entrada,
+        saida = EXCLUDED.saida,
+        minutos_trabalhados = EXCLUDED.minutos_trabalhados,
+        diferenca_entrada_min = EXCLUDED.diferenca_entrada_min,
+        diferenca_saida_min = EXCLUDED.diferenca_saida_min,
+        observacoes = EXCLUDED.observacoes,
+        eventos = EXCLUDED.eventos,
+        atualizado_em = EXCLUDED.atualizado_em
+"""
+
+_FILTRO_DIAS = "(r.cpf_funcionario, r.data) IN (SELECT * FROM unnest(%(cpfs)s::text[], %(datas)s::date[]))"
+
+_FILTRO_PERIODO = "(%(inicio)s::date IS NULL OR r.data >= %(inicio)s) AND (%(fim)s::date IS NULL OR r.data <= %(fim)s)"
+
+
+def criar_tabela(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS registros_diarios (
+            cpf_funcionario TEXT NOT NULL,
+            data DATE NOT NULL,
+            nome TEXT NOT NULL,
+            entrada TIME,
+            saida TIME,
+            minutos_trabalhados INTEGER,
+            diferenca_entrada_min INTEGER,
+            diferenca_saida_min INTEGER,
+            observacoes TEXT,
+            eventos SMALLINT NOT NULL,
+            atualizado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (cpf_funcionario, data),
+            FOREIGN KEY (cpf_funcionario) REFERENCES funcionarios (cpf)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_registros_diarios_data ON registros_diarios (data)")
+
+
+def recalcular_dias(cursor, dias):
+    """Recalcula o resumo dos pares (cpf, data) em `dias`; não faz commit."""
+    dias = list(dict.fromkeys(dias))
+    if not dias:
+        return
+    params = {"cpfs": [cpf for cpf, _ in dias], "datas": [data for _, data in dias]}
+    cursor.execute(_SQL_AGREGAR.format(filtro=_FILTRO_DIAS), params)
+    # Dias que ficaram sem nenhum evento.
+    cursor.execute('''
+        DELETE FROM registros_diarios d
+         WHERE (d.cpf_funcionario, d.data) IN (SELECT * FROM unnest(%(cpfs)s::text[], %(datas)s::date[]))
+           AND NOT EXISTS (SELECT 1 FROM registros r WHERE r.cpf_funcionario = d.cpf_funcionario AND r.data = d.data)
+    ''', params)
+
+
+def reconstruir_periodo(cursor, data_inicio=None, data_fim=None):
+    """Refaz o resumo de `data_inicio` a `data_fim` (inclusive; None = sem limite). Retorna as linhas gravadas."""
+    params = {"inicio": data_inicio, "fim": data_fim}
+    cursor.execute(
+        "DELETE FROM registros_diarios r WHERE " + _FILTRO_PERIODO,
+        params,
+    )
+    cursor.execute(_SQL_AGREGAR.format(filtro=_FILTRO_PERIODO), params)
+    return cursor.rowcount
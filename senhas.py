@@ -0,0 +1,143 @@
+"""Hash de senhas (Código Forte) com KDF lenta e salgada.
+
+O valor gravado em `funcionarios.senha` carrega o algoritmo e os
+parâmetros: `scrypt$n$r$p$sal$hash` ou `pbkdf2_sha256$iteracoes$sal$hash`
+(sal e hash em base64). Hashes antigos, SHA-256 hexadecimal sem sal, ainda
+são aceitos em `verificar_senha` e aparecem em `precisa_atualizar` para
+serem regravados no próximo login.
+"""
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from config import (
+    SENHA_ALGORITMO, SENHA_SCRYPT_N, SENHA_SCRYPT_R, SENHA_SCRYPT_P,
+    SENHA_PBKDF2_ITERACOES, SENHA_PROCESSOS_HASH,
+)
+
+_TAMANHO_SAL = 16
+
+# Abaixo disso, subir processos custa mais do que calcular em série.
+_LOTE_MINIMO_POR_PROCESSO = 8
+
+
+def _b64(dados):
+    return base64.b64encode(dados).decode('ascii')
+
+
+def _de_b64(texto):
+    return base64.b64decode(texto.encode('ascii'))
+
+
+class HasherScrypt:
+    algoritmo = "scrypt"
+
+    def __init__(self, n=2**14, r=8, p=1):
+        self.n, self.r, self.p = n, r, p
+
+    def _derivar(self, senha, sal, n, r, p):
+        return hashlib.scrypt(senha.encode('utf-8'), salt=sal, n=n, r=r, p=p,
+                              maxmem=256 * n * r + 1024 * 1024)
+
+    def gerar(self, senha):
+        sal = os.urandom(_TAMANHO_SAL)
+        chave = self._derivar(senha, sal, self.n, self.r, self.p)
+        return f"{self.algoritmo}${self.n}${self.r}${self.p}${_b64(sal)}${_b64(chave)}"
+
+    def verificar(self, senha, codificado):
+        _, n, r, p, sal, chave = codificado.split('$')
+        calculada = self._derivar(senha, _de_b64(sal), int(n), int(r), int(p))
+        return hmac.compare_digest(calculada, _de_b64(chave))
+
+    def precisa_atualizar(self, codificado):
+        _, n, r, p, _, _ = codificado.split('$')
+        return (int(n), int(r), int(p)) != (self.n, self.r, self.p)
+
+
+class HasherPBKDF2:
+    algoritmo = "pbkdf2_sha256"
+
+    def __init__(self, iteracoes=600_000):
+        self.iteracoes = iteracoes
+
+    def gerar(self, senha):
+        sal = os.urandom(_TAMANHO_SAL)
+        chave = hashlib.pbkdf2_hmac('sha256', senha.encode('utf-8'), sal, self.iteracoes)
+        return f"{self.algoritmo}${self.iteracoes}${_b64(sal)}${_b64(chave)}"
+
+    def verificar(self, senha, codificado):
+        _, iteracoes, sal, chave = codificado.split('$')
+        calculada = hashlib.pbkdf2_hmac('sha256', senha.encode('utf-8'), _de_b64(sal), int(iteracoes))
+        return hmac.compare_digest(calculada, _de_b64(chave))
+
+    def precisa_atualizar(self, codificado):
+        return int(codificado.split('$')[1]) != self.iteracoes
+
+
+class HasherSHA256Legado:
+    """SHA-256 sem sal das versões antigas; só verifica, nunca gera."""
+    algoritmo = "sha256"
+
+    def gerar(self, senha):
+        raise ValueError("SHA-256 sem sal não deve mais ser usado para gravar senhas.")
+
+    def verificar(self, senha, codificado):
+        calculada = hashlib.sha256(senha.encode('utf-8')).hexdigest()
+        return hmac.compare_digest(calculada, codificado)
+
+    def precisa_atualizar(self, codificado):
+        return True
+
+
+HASHERS = {
+    HasherScrypt.algoritmo: HasherScrypt(SENHA_SCRYPT_N, SENHA_SCRYPT_R, SENHA_SCRYPT_P),
+    HasherPBKDF2.algoritmo: HasherPBKDF2(SENHA_PBKDF2_ITERACOES),
+    HasherSHA256Legado.algoritmo: HasherSHA256Legado(),
+}
+
+if SENHA_ALGORITMO not in HASHERS or SENHA_ALGORITMO == HasherSHA256Legado.algoritmo:
+    raise ValueError(f"Algoritmo de senha inválido: {SENHA_ALGORITMO!r}")
+
+
+def _hasher_de(codificado):
+    algoritmo = codificado.split('$', 1)[0] if '$' in codificado else HasherSHA256Legado.algoritmo
+    hasher = HASHERS.get(algoritmo)
+    if hasher is None:
+        raise ValueError(f"Formato de hash de senha desconhecido: {algoritmo!r}")
+    return hasher
+
+
+def gerar_hash(senha):
+    return HASHERS[SENHA_ALGORITMO].gerar(senha)
+
+
+def verificar_senha(senha, codificado):
+    if not codificado:
+        return False
+    return _hasher_de(codificado).verificar(senha, codificado)
+
+
+def precisa_atualizar(codificado):
+    """True se o hash foi gerado com outro algoritmo ou parâmetros que os atuais."""
+    hasher = _hasher_de(codificado)
+    return hasher.algoritmo != SENHA_ALGORITMO or hasher.precisa_atualizar(codificado)
+
+
+def gerar_hashes_em_lote(senhas, processos=None):
+    """`gerar_hash` para uma lista de senhas, distribuído entre processos.
+
+    `processos` padrão vem de `SENHA_PROCESSOS_HASH` (0 = um por CPU). Os
+    workers são criados com spawn, já que o chamador (Streamlit) tem threads
+    e conexões abertas que não devem ser herdadas por fork.
+    """
+    senhas = list(senhas)
+    processos = processos or SENHA_PROCESSOS_HASH or os.cpu_count() or 1
+    processos = min(processos, len(senhas) // _LOTE_MINIMO_POR_PROCESSO)
+    if processos <= 1:
+        return [gerar_hash(senha) for senha in senhas]
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processos, mp_context=contexto) as executor:
+        return list(executor.map(gerar_hash, senhas, chunksize=max(1, len(senhas) // (processos * 4))))
@@ -1,77 +1,81 @@
-import psycopg2
-import psycopg2.extras
 import pandas as pd
-from datetime import datetime, time
-from config import FUSO_HORARIO, HORARIOS_PADRAO, TOLERANCIA_MINUTOS
-import hashlib
-from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from config import (
+    FUSO_HORARIO, HORARIOS_PADRAO, TOLERANCIA_MINUTOS,
+    CACHE_TTL_SEGUNDOS, CACHE_MAX_ITENS,
+    RELATORIO_AO_VIVO_MAX_LINHAS, RELATORIO_AO_VIVO_MAX_FILTROS,
+    PARTICOES_FUTURAS_MESES, RETENCAO_REGISTROS_MESES, DIRETORIO_ARQUIVO_REGISTROS,
+)
+from time import monotonic, perf_counter
 import numpy as np
+import functools
+import hashlib
 import io
+import itertools
 import os
-from urllib.parse import urlparse
+import threading
+from collections import OrderedDict
+import armazenamento
+from cache import CacheConsultas
+from senhas import gerar_hash, gerar_hashes_em_lote, precisa_atualizar, verificar_senha
+import afd
+import exportacoes
+import metricas
+import particoes
+import banco_horas
+from horarios import TabelaHorarios
+from status_ponto import ALIASES_EVENTOS, calcular_status, calcular_status_ponto
 
-url = urlparse(os.getenv("DATABASE_URL"))
+# PostgreSQL ou SQLite, pelo esquema da URL (ver armazenamento/).
+_banco = armazenamento.abrir(os.getenv("DATABASE_URL"))
 
-DB_HOST = url.hostname
-DB_PORT = url.port
-DB_NAME = url.path[1:]
-DB_USER = url.username
-DB_PASS = url.password
-
-@contextmanager
 def get_db_connection():
-    conn_string = f"dbname={DB_NAME} user={DB_USER} password={DB_PASS} host={DB_HOST} port={DB_PORT}"
-    conn = psycopg2.connect(conn_string)
-    try:
-        yield conn
-    finally:
-        conn.close()
-        
-def get_horario_padrao(filial: int, proximo_evento: str) -> time:
-    if filial in (3, 4):
-        return time(7, 30) if proximo_evento == "Entrada" else time(17, 30)
-    return time(8, 0) if proximo_evento == "Entrada" else time(18, 0)        
+    return _banco.conexao()
 
+def obter_estatisticas_pool():
+    return _banco.estatisticas()
 
-def _hash_senha(senha: str) -> str:
-    return hashlib.sha256(senha.encode('utf-8')).hexdigest()
+_cache = CacheConsultas(ttl=CACHE_TTL_SEGUNDOS, max_itens=CACHE_MAX_ITENS)
 
-def init_db():
+def obter_estatisticas_cache():
+    return _cache.estatisticas()
+
+@_cache.cacheado("horarios", "funcionarios", "empresas")
+def obter_horarios():
+    """Tabela `horarios` compilada (ver horarios.py); recarregada quando muda ou quando o TTL vence."""
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
-            cursor.execute('CREATE TABLE IF NOT EXISTS empresas (id SERIAL PRIMARY KEY, nome_empresa TEXT NOT NULL UNIQUE, cnpj TEXT)')
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS funcionarios (
-                    cpf TEXT PRIMARY KEY,
-                    codigo TEXT NOT NULL,
-                    nome TEXT NOT NULL,
-                    senha TEXT NOT NULL,
-                    role TEXT NOT NULL,
-                    empresa_id INTEGER,
-                    cod_tipo TEXT,
-                    tipo TEXT,
-                    filial TEXT,
-                    FOREIGN KEY (empresa_id) REFERENCES empresas (id)
-                )
+                SELECT h.cpf_funcionario, e.nome_empresa, h.filial, h.setor, h.dia_semana, h.evento, h.hora, h.vigente_de, h.vigente_ate
+                  FROM horarios h LEFT JOIN empresas e ON e.id = h.empresa_id
             ''')
+            regras = cursor.fetchall()
+            # Para achar, pelo código e empresa, quem tem horário próprio nos DataFrames sem CPF.
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS registros (
-                    id TEXT PRIMARY KEY,
-                    cpf_funcionario TEXT NOT NULL,
-                    nome TEXT NOT NULL,
-                    data TEXT NOT NULL,
-                    hora TEXT NOT NULL,
-                    descricao TEXT NOT NULL,
-                    diferenca_min INTEGER NOT NULL,
-                    observacao TEXT,
-                    FOREIGN KEY (cpf_funcionario) REFERENCES funcionarios (cpf)
-                )
+                SELECT e.nome_empresa, f.codigo, f.cpf
+                  FROM funcionarios f LEFT JOIN empresas e ON e.id = f.empresa_id
+                 WHERE f.cpf IN (SELECT cpf_funcionario FROM horarios)
             ''')
-            
+            codigos = cursor.fetchall()
+    return TabelaHorarios(regras, codigos)
+
+
+@functools.lru_cache(maxsize=1)
+def _hash_ficticio():
+    # Calculado no primeiro login com CPF inexistente, não na importação do módulo.
+    return gerar_hash("")
+
+def init_db():
+    _banco.preparar()
+    with get_db_connection() as conn:
+        _banco.migrar(conn)
+        with conn.cursor() as cursor:
             cursor.execute("SELECT COUNT(*) FROM funcionarios")
             if cursor.fetchone()[0] == 0:
-                initial_users = [('admin', 'admin', 'Administrador', _hash_senha('admin123'), 'admin', None, None, None, None)]
+                initial_users = [('admin', 'admin', 'Administrador', gerar_hash('admin123'), 'admin', None, None, None, None)]
                 cursor.executemany("INSERT INTO funcionarios (cpf, codigo, nome, senha, role, empresa_id, cod_tipo, tipo, filial) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)", initial_users)
+            hoje = datetime.now(FUSO_HORARIO).date()
+            _banco.garantir_particoes(cursor, hoje, particoes.somar_meses(hoje, PARTICOES_FUTURAS_MESES))
         conn.commit()
 
 def _obter_ou_criar_empresa_id(nome_empresa, cnpj, cursor):
@@ -84,93 +88,125 @@ def _obter_ou_criar_empresa_id(nome_empresa, cnpj, cursor):
         cursor.execute("INSERT INTO empresas (nome_empresa, cnpj) VALUES (%s, %s) RETURNING id", (nome_empresa, cnpj))
         return cursor.fetchone()[0]
 
+@_cache.cacheado("empresas")
 def ler_empresas():
     with get_db_connection() as conn:
         return pd.read_sql_query("SELECT id, nome_empresa, cnpj FROM empresas ORDER BY nome_empresa", conn)
 
+@_cache.cacheado("funcionarios", "empresas")
+def ler_hierarquia_filtros():
+    """Opções dos filtros empresa → filial → setor do relatório, prontas para os selectboxes.
+
+    Retorna `{"empresas": {id: (nome, cnpj)}, "filiais": {empresa_id: [filiais]},
+    "setores": {(empresa_id, filial): [setores]}}`, listas já ordenadas;
+    empresa_id 0 e filial None querem dizer "todas". Sai de um SELECT
+    DISTINCT (poucas linhas, qualquer que seja o número de funcionários) e
+    fica em cache até funcionários ou empresas mudarem. Não altere o
+    resultado: o mesmo objeto é devolvido a todas as sessões.
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT id, nome_empresa, cnpj FROM empresas ORDER BY nome_empresa")
+            empresas = {empresa_id: (nome, cnpj) for empresa_id, nome, cnpj in cursor.fetchall()}
+            cursor.execute("SELECT DISTINCT empresa_id, filial, tipo FROM funcionarios WHERE role = 'employee'")
+            combinacoes = cursor.fetchall()
+    filiais, setores = {}, {}
+    for empresa_id, filial, setor in combinacoes:
+        for empresa in {0, empresa_id or 0}:
+            if filial is not None:
+                filiais.setdefault(empresa, set()).add(filial)
+            if setor is not None:
+                for chave_filial in {None, filial}:
+                    setores.setdefault((empresa, chave_filial), set()).add(setor)
+    return {
+        "empresas": empresas,
+        "filiais": {chave: sorted(valores) for chave, valores in filiais.items()},
+        "setores": {chave: sorted(valores) for chave, valores in setores.items()},
+    }
+
+@_cache.cacheado("funcionarios", "empresas")
 def ler_funcionarios_df():
     with get_db_connection() as conn:
         query = "SELECT f.codigo, f.nome, f.cpf, f.cod_tipo, f.tipo, f.filial, f.role, f.empresa_id, e.nome_empresa, e.cnpj FROM funcionarios f LEFT JOIN empresas e ON f.empresa_id = e.id"
         return pd.read_sql_query(query, conn)
 
 def verificar_login(cpf, senha_cod_forte):
-    senha_hash = _hash_senha(senha_cod_forte)
-    user = None
+    """Confere a senha e, se o hash gravado for de um formato antigo, regrava-o."""
     with get_db_connection() as conn:
-        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-            cursor.execute("SELECT * FROM funcionarios WHERE cpf = %s AND senha = %s", (cpf, senha_hash))
-            user = cursor.fetchone()
-    return (dict(user), None) if user else (None, "CPF ou Senha (Código Forte) inválidos.")
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT * FROM funcionarios WHERE cpf = %s", (cpf,))
+            linha = cursor.fetchone()
+            if linha is None:
+                # Mesmo custo de um CPF existente, para não revelar quais existem.
+                verificar_senha(senha_cod_forte, _hash_ficticio())
+                return None, "CPF ou Senha (Código Forte) inválidos."
+            user = dict(zip([coluna[0] for coluna in cursor.description], linha))
+            if not verificar_senha(senha_cod_forte, user['senha']):
+                return None, "CPF ou Senha (Código Forte) inválidos."
+            if precisa_atualizar(user['senha']):
+                novo_hash = gerar_hash(senha_cod_forte)
+                cursor.execute("UPDATE funcionarios SET senha = %s WHERE cpf = %s AND senha = %s", (novo_hash, cpf, user['senha']))
+                conn.commit()
+                user['senha'] = novo_hash
+    return user, None
 
 def obter_proximo_evento(cpf):
-    hoje_str = datetime.now(FUSO_HORARIO).strftime("%Y-%m-%d")
+    hoje = datetime.now(FUSO_HORARIO).date()
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
-            cursor.execute("SELECT COUNT(*) FROM registros WHERE cpf_funcionario = %s AND data = %s", (cpf, hoje_str))
-            num_pontos = cursor.fetchone()[0]
+            cursor.execute("SELECT eventos FROM pontos_dia WHERE cpf_funcionario = %s AND data = %s", (cpf, hoje))
+            resultado = cursor.fetchone()
+    num_pontos = resultado[0] if resultado else 0
     eventos = list(HORARIOS_PADRAO.keys())
     return eventos[num_pontos] if num_pontos < len(eventos) else "Jornada Finalizada"
 
-def bater_ponto(cpf, nome):
-    agora = datetime.now(FUSO_HORARIO)
-    proximo_evento = obter_proximo_evento(cpf)
-    if proximo_evento == "Jornada Finalizada":
-        return "Sua jornada de hoje já foi completamente registada.", "warning"
+def bater_ponto(cpf, nome, evento_esperado=None):
+    """Registra o próximo evento do dia numa única transação.
+
+    A linha de `pontos_dia` do (cpf, data) é reservada com um upsert que a
+    trava até o commit (`reservar_evento` do backend), então cliques
+    simultâneos são serializados e cada um recebe um evento diferente. Com `evento_esperado` (o evento que a
+    tela mostrava), um clique repetido é recusado em vez de virar "Saída".
+    """
+    agora = datetime.now(FUSO_HORARIO).replace(microsecond=0)
+    eventos = list(HORARIOS_PADRAO.keys())
+    horarios = obter_horarios()
 
-    # --- busca a filial do funcionário ---
     with get_db_connection() as conn:
+        _banco.garantir_particao_do_mes(conn, agora.date())
         with conn.cursor() as cursor:
-            cursor.execute(
-                "SELECT filial FROM funcionarios WHERE cpf = %s",
-                (cpf,)
-            )
-            resultado = cursor.fetchone()
-    filial = resultado[0] if resultado else None
-
-    # --- define o horário conforme a filial ---
-    if filial in ("Filial 03", "Filial 3", "Filial 04", "Filial 4"):
-        horarios = {
-            "Entrada": time(7, 30),
-            "Saída":   time(17, 30)
-        }
-    else:
-        horarios = HORARIOS_PADRAO  # { "Entrada": 08:00, "Saída": 18:00 }
-
-    hora_prevista     = horarios[proximo_evento]
-    datetime_previsto = agora.replace(
-        hour=hora_prevista.hour,
-        minute=hora_prevista.minute,
-        second=0,
-        microsecond=0
-    )
-
-    diff_bruta = round((agora - datetime_previsto).total_seconds() / 60)
-    diff_final = (
-        0 if abs(diff_bruta) <= TOLERANCIA_MINUTOS
-        else diff_bruta - TOLERANCIA_MINUTOS
-        if diff_bruta > 0
-        else diff_bruta + TOLERANCIA_MINUTOS
-    )
+            resultado = _banco.reservar_evento(cursor, cpf, agora.date(), len(eventos))
+            if resultado is None:
+                conn.rollback()
+                return "Sua jornada de hoje já foi completamente registada.", "warning"
+            num_pontos, filial, setor, empresa = resultado
+            proximo_evento = eventos[num_pontos - 1]
+            if evento_esperado is not None and proximo_evento != evento_esperado:
+                conn.rollback()
+                return f"'{evento_esperado}' já foi registado hoje.", "warning"
 
-    novo_reg = (
-        f"{cpf}-{agora.isoformat()}",
-        cpf,
-        nome,
-        agora.strftime("%Y-%m-%d"),
-        agora.strftime("%H:%M:%S"),
-        proximo_evento,
-        diff_final,
-        ""
-    )
+            hora_prevista = horarios.previsto(proximo_evento, agora.date(), cpf, empresa, filial, setor)
+            # Evento sem horário previsto entra sem diferença, como na importação de AFD.
+            diff_bruta, diff_final = calcular_status_ponto(hora_prevista, agora)[1:3] if hora_prevista else (0, 0)
 
-    with get_db_connection() as conn:
-        with conn.cursor() as cursor:
+            novo_reg = (
+                cpf,
+                nome,
+                agora.date(),
+                agora.time(),
+                proximo_evento,
+                diff_final,
+                ""
+            )
             cursor.execute(
-                "INSERT INTO registros (id, cpf_funcionario, nome, data, hora, descricao, diferenca_min, observacao) "
-                "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+                "INSERT INTO registros (cpf_funcionario, nome, data, hora, descricao, diferenca_min, observacao) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s)",
                 novo_reg
             )
+            _banco.recalcular_dias(cursor, [(cpf, agora.date())])
+            _banco.avisar_registros(cursor, "ponto")
         conn.commit()
+    _cache.invalidar("registros")
 
     msg_extra = ""
     if diff_final != 0:
@@ -192,35 +228,552 @@ def bater_ponto(cpf, nome):
         "success"
     )
 
+def _chave_documento(serie):
+    # PIS/CPF só com dígitos e sem zeros à esquerda: o AFD usa 12 posições.
+    return serie.astype(str).str.replace(r'\D', '', regex=True).str.lstrip('0')
+
+def _gravar_lote_afd(conn, lote, funcionarios, horarios, resumo):
+    eventos = list(HORARIOS_PADRAO.keys())
+
+    chave = _chave_documento(lote['identificador'])
+    por_pis = lote['tipo_id'] == 'pis'
+    lote['cpf'] = chave.map(funcionarios['por_cpf']).where(~por_pis, chave.map(funcionarios['por_pis']))
+    sem_cadastro = lote['cpf'].isna()
+    for linha, tipo_id, identificador, data, hora in lote.loc[sem_cadastro, ['linha', 'tipo_id', 'identificador', 'data', 'hora']].itertuples(index=False):
+        afd.rejeitar(resumo, linha, f"{tipo_id.upper()} {identificador} sem funcionário cadastrado", f"{data} {hora}")
+    lote = lote[~sem_cadastro]
+
+    repetidas = lote.duplicated(subset=['cpf', 'data', 'hora'])
+    resumo["duplicadas"] += int(repetidas.sum())
+    lote = lote[~repetidas]
+    if lote.empty:
+        return
+
+    with conn.cursor() as cursor:
+        _banco.criar_temporaria(cursor, "afd_marcacoes", "linha INTEGER, nsr BIGINT, cpf TEXT, data DATE, hora TIME")
+        _banco.copiar(cursor, "afd_marcacoes", ['linha', 'nsr', 'cpf', 'data', 'hora'], lote[['linha', 'nsr', 'cpf', 'data', 'hora']])
+        # Já registradas são descartadas; as demais seguem a contagem do dia em
+        # pontos_dia, travada até o commit como em bater_ponto.
+        duplicadas, linhas = _banco.ordenar_marcacoes(cursor)
+        resumo["duplicadas"] += duplicadas
+        marcacoes = pd.DataFrame(linhas, columns=['linha', 'cpf', 'data', 'Hora', 'ordem'])
+        if marcacoes.empty:
+            return
+
+        excedentes = marcacoes['ordem'] > len(eventos)
+        for linha, cpf, data, hora in marcacoes.loc[excedentes, ['linha', 'cpf', 'data', 'Hora']].itertuples(index=False):
+            afd.rejeitar(resumo, linha, "jornada do dia já completa", f"{cpf} {data} {hora}")
+        marcacoes = marcacoes[~excedentes].copy()
+        if marcacoes.empty:
+            return
+
+        marcacoes['Descrição'] = np.array(eventos, dtype=object)[marcacoes['ordem'].to_numpy(dtype=int) - 1]
+        marcacoes['CPF'] = marcacoes['cpf']
+        marcacoes['Data'] = marcacoes['data']
+        for coluna in ['Filial', 'Setor', 'Empresa']:
+            marcacoes[coluna] = marcacoes['cpf'].map(funcionarios[coluna.lower()])
+        marcacoes['nome'] = marcacoes['cpf'].map(funcionarios['nome'])
+        marcacoes['diferenca'] = calcular_status(marcacoes, horarios)['Diferença Tolerada (min)'].fillna(0).astype(int)
+        marcacoes['observacao'] = ''
+
+        _banco.garantir_particoes(cursor, marcacoes['data'].min(), marcacoes['data'].max())
+        _banco.copiar_registros(cursor, ['cpf_funcionario', 'nome', 'data', 'hora', 'descricao', 'diferenca_min', 'observacao'],
+                                marcacoes[['cpf', 'nome', 'data', 'Hora', 'Descrição', 'diferenca', 'observacao']])
+
+        por_dia = marcacoes.groupby(['cpf', 'data']).size()
+        _banco.somar_eventos_dia(cursor, por_dia.index.get_level_values(0).tolist(),
+                                 por_dia.index.get_level_values(1).tolist(), por_dia.tolist())
+        _banco.recalcular_dias(cursor, por_dia.index.tolist())
+        _recalcular_banco_horas(cursor, por_dia.index.tolist(), horarios)
+        _banco.avisar_registros(cursor, "importacao")
+        resumo["importadas"] += len(marcacoes)
+
+def importar_afd(arquivo, tamanho_lote=50_000):
+    """Importa as marcações (registro tipo 3) de um arquivo AFD de relógio REP.
+
+    O arquivo é lido em lotes de `tamanho_lote` marcações; cada lote é
+    casado com os funcionários pelo PIS (leiaute 1510) ou CPF (leiaute 671),
+    recebe Entrada/Saída pela ordem do dia como em `bater_ponto`, tem a
+    diferença calculada de forma vetorizada e entra em massa (COPY no
+    PostgreSQL), com um commit
+    por lote. Marcações já existentes (mesmo CPF, data e hora) são puladas.
+    Retorna o resumo de `afd.novo_resumo()` com o tempo gasto em "segundos".
+    """
+    inicio = perf_counter()
+    resumo = afd.novo_resumo()
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                SELECT f.cpf, f.pis, f.nome, f.filial, f.tipo, e.nome_empresa
+                  FROM funcionarios f LEFT JOIN empresas e ON e.id = f.empresa_id
+                 WHERE f.role = 'employee'
+            ''')
+            cadastro = pd.DataFrame(cursor.fetchall(), columns=['cpf', 'pis', 'nome', 'filial', 'setor', 'empresa'])
+        funcionarios = {
+            'por_cpf': dict(zip(_chave_documento(cadastro['cpf']), cadastro['cpf'])),
+            'por_pis': dict(zip(_chave_documento(cadastro['pis'].dropna()), cadastro.loc[cadastro['pis'].notna(), 'cpf'])),
+            **{coluna: dict(zip(cadastro['cpf'], cadastro[coluna])) for coluna in ['nome', 'filial', 'setor', 'empresa']},
+        }
+        horarios = obter_horarios()
+        try:
+            for lote in afd.ler_lotes(arquivo, tamanho_lote, resumo):
+                _gravar_lote_afd(conn, lote, funcionarios, horarios, resumo)
+                conn.commit()
+        finally:
+            if resumo["importadas"]:
+                _cache.invalidar("registros", "banco_horas")
+    resumo["segundos"] = perf_counter() - inicio
+    return resumo
+
+_COLUNAS_REGISTROS = {'id': 'ID', 'codigo': 'Código Forte', 'nome': 'Nome', 'data': 'Data', 'hora': 'Hora', 'descricao': 'Descrição', 'diferenca_min': 'Diferença (min)', 'observacao': 'Observação', 'nome_empresa': 'Empresa', 'cnpj': 'CNPJ', 'setor': 'Setor', 'filial': 'Filial'}
+
+@_cache.cacheado("registros", "funcionarios", "empresas")
 def ler_registros_df():
     with get_db_connection() as conn:
-        query = "SELECT r.id, f.codigo, r.nome, r.data, r.hora, r.descricao, r.diferenca_min, r.observacao, e.nome_empresa, e.cnpj, f.tipo as setor, f.filial FROM registros r JOIN funcionarios f ON r.cpf_funcionario = f.cpf LEFT JOIN empresas e ON f.empresa_id = e.id"
-        df = pd.read_sql_query(query, conn)
-    return df.rename(columns={'id': 'ID', 'codigo': 'Código Forte', 'nome': 'Nome', 'data': 'Data', 'hora': 'Hora', 'descricao': 'Descrição', 'diferenca_min': 'Diferença (min)', 'observacao': 'Observação', 'nome_empresa': 'Empresa', 'cnpj': 'CNPJ', 'setor': 'Setor', 'filial': 'Filial'})
+        df = pd.read_sql_query(_banco.SELECT_REGISTROS, conn)
+    return df.rename(columns=_COLUNAS_REGISTROS)
 
-def atualizar_registro(id_registro, novo_horario=None, nova_observacao=None):
+def _filtros_registros_sql(empresa_id=None, filial=None, setor=None, data_inicio=None, data_fim=None):
+    condicoes, params = [], []
+    if empresa_id:
+        condicoes.append("f.empresa_id = %s")
+        params.append(int(empresa_id))
+    if filial:
+        condicoes.append("f.filial = %s")
+        params.append(filial)
+    if setor:
+        condicoes.append("f.tipo = %s")
+        params.append(setor)
+    if data_inicio:
+        condicoes.append("r.data >= %s")
+        params.append(data_inicio)
+    if data_fim:
+        condicoes.append("r.data <= %s")
+        params.append(data_fim)
+    where = f" WHERE {' AND '.join(condicoes)}" if condicoes else ""
+    return where, params
+
+@_cache.cacheado("registros", "funcionarios", "empresas")
+def ler_registros_filtrados_df(empresa_id=None, filial=None, setor=None, data_inicio=None, data_fim=None, limite=None, deslocamento=None, decrescente=False):
+    """Registros já filtrados no banco, no mesmo formato de `ler_registros_df`.
+
+    Filtros vazios (None, 0, "") são ignorados; `data_inicio`/`data_fim` são
+    objetos `date` e o intervalo é inclusivo. `limite`/`deslocamento` leem
+    só uma página; `decrescente` traz os eventos mais recentes primeiro.
+    """
+    where, params = _filtros_registros_sql(empresa_id, filial, setor, data_inicio, data_fim)
+    ordem = "DESC" if decrescente else "ASC"
+    query = f"{_banco.SELECT_REGISTROS}{where} ORDER BY r.data {ordem}, r.hora {ordem}, r.id {ordem}"
+    if limite:
+        query += " LIMIT %s"
+        params.append(int(limite))
+    if deslocamento:
+        query += " OFFSET %s"
+        params.append(int(deslocamento))
+    with get_db_connection() as conn:
+        df = pd.read_sql_query(query, conn, params=params)
+    return df.rename(columns=_COLUNAS_REGISTROS)
+
+@_cache.cacheado("registros", "funcionarios", "empresas")
+def contar_registros_filtrados(empresa_id=None, filial=None, setor=None, data_inicio=None, data_fim=None):
+    where, params = _filtros_registros_sql(empresa_id, filial, setor, data_inicio, data_fim)
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM registros r JOIN funcionarios f ON r.cpf_funcionario = f.cpf{where}", params)
+            return cursor.fetchone()[0]
+
+def iterar_registros_filtrados(empresa_id=None, filial=None, setor=None, data_inicio=None, data_fim=None, tamanho_bloco=50_000):
+    """Gera os registros filtrados em DataFrames de até `tamanho_bloco` linhas.
+
+    Lê sob demanda (cursor nomeado, server-side, no PostgreSQL), então só
+    um bloco fica em memória por vez, qualquer que seja o total de linhas.
+    A conexão fica reservada até o gerador terminar ou ser fechado.
+    """
+    where, params = _filtros_registros_sql(empresa_id, filial, setor, data_inicio, data_fim)
+    query = f"{_banco.SELECT_REGISTROS}{where} ORDER BY r.data, r.hora, r.id"
+    with get_db_connection() as conn:
+        for colunas, linhas in _banco.iterar(conn, query, params, tamanho_bloco):
+            yield pd.DataFrame.from_records(linhas, columns=[_COLUNAS_REGISTROS[coluna] for coluna in colunas])
+
+def _registrar_exclusao(cursor):
+    # Linhas apagadas não aparecem nas leituras incrementais; a nova geração
+    # faz quem acompanha registros reler tudo.
+    cursor.execute("UPDATE registros_geracao SET valor = valor + 1")
+    _banco.avisar_registros(cursor, "exclusao")
+
+# Relatório ao vivo: filtros -> {"lock", "df", "marca", "avisos", "lido_em"}, do processo todo (LRU).
+_ao_vivo = OrderedDict()
+_ao_vivo_lock = threading.Lock()
+# Avisos (NOTIFY) recebidos por este processo e a escuta que os recebe:
+# None antes da primeira leitura, False no SQLite, senão o Event do backend.
+_avisos_registros = 0
+_escuta = None
+_escuta_lock = threading.Lock()
+
+_ORDEM_REGISTROS = ['Data', 'Hora', 'ID']
+
+def _ao_receber_aviso(motivo):
+    global _avisos_registros
+    _avisos_registros += 1
+    _cache.invalidar("registros")
+
+def _escuta_registros():
+    global _escuta
+    if _escuta is None:
+        with _escuta_lock:
+            if _escuta is None:
+                _escuta = _banco.escutar_registros(_ao_receber_aviso) or False
+    return _escuta or None
+
+def _mesclar_registros(df, delta):
+    """`df` com as linhas de `delta` no lugar das de mesmo ID, na ordem de `_ORDEM_REGISTROS`."""
+    if delta.empty:
+        return df
+    base = df[~df['ID'].isin(delta['ID'])]
+    if base.empty:
+        return delta
+    juntos = pd.concat([base, delta], ignore_index=True)
+    # O caso comum (batidas novas, depois de tudo o que já estava) dispensa a ordenação.
+    if tuple(delta.iloc[0][_ORDEM_REGISTROS]) > tuple(base.iloc[-1][_ORDEM_REGISTROS]):
+        return juntos
+    return juntos.sort_values(_ORDEM_REGISTROS, kind='stable', ignore_index=True)
+
+def ler_registros_ao_vivo(empresa_id=None, filial=None, setor=None, data_inicio=None, data_fim=None):
+    """Registros filtrados, como em `ler_registros_filtrados_df` (ordem crescente), mantidos entre reruns.
+
+    A primeira leitura de um filtro traz tudo; as seguintes só as linhas
+    gravadas ou alteradas desde a anterior (coluna `versao`), que são
+    mescladas ao DataFrame guardado. No PostgreSQL as escritas avisam por
+    NOTIFY e, sem aviso novo, o DataFrame volta sem ir ao banco (até
+    `CACHE_TTL_SEGUNDOS`, por causa de escritas feitas por fora do sistema).
+    Exclusões mudam a geração de `registros_geracao` e forçam uma releitura
+    completa.
+    Retorna None quando o filtro passa de `RELATORIO_AO_VIVO_MAX_LINHAS`:
+    aí a tela volta a ler página a página.
+    """
+    escuta = _escuta_registros()
+    filtros = dict(empresa_id=empresa_id or None, filial=filial or None, setor=setor or None,
+                   data_inicio=data_inicio or None, data_fim=data_fim or None)
+    chave = tuple(filtros.values())
+    with _ao_vivo_lock:
+        entrada = _ao_vivo.get(chave)
+        if entrada is None:
+            entrada = _ao_vivo[chave] = {"lock": threading.Lock(), "df": None, "marca": None, "avisos": None, "lido_em": 0.0}
+        _ao_vivo.move_to_end(chave)
+        while len(_ao_vivo) > RELATORIO_AO_VIVO_MAX_FILTROS:
+            _ao_vivo.popitem(last=False)
+
+    with entrada["lock"]:
+        # Lido antes da consulta: um aviso que chegue durante ela provoca outra na próxima vez.
+        avisos = _avisos_registros
+        recente = entrada["df"] is not None and monotonic() - entrada["lido_em"] < CACHE_TTL_SEGUNDOS
+        if recente and escuta is not None and escuta.is_set() and entrada["avisos"] == avisos:
+            return entrada["df"].copy(deep=False)
+
+        where, params = _filtros_registros_sql(*chave)
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                marca = _banco.marca_registros(cursor)
+            if entrada["df"] is not None and entrada["marca"][0] == marca[0]:
+                query = f"{_banco.SELECT_REGISTROS}{where}{' AND' if where else ' WHERE'} r.versao >= %s ORDER BY r.data, r.hora, r.id"
+                delta = pd.read_sql_query(query, conn, params=[*params, entrada["marca"][1]]).rename(columns=_COLUNAS_REGISTROS)
+                df = _mesclar_registros(entrada["df"], delta)
+            elif contar_registros_filtrados(**filtros) > RELATORIO_AO_VIVO_MAX_LINHAS:
+                entrada["df"] = None
+                return None
+            else:
+                query = f"{_banco.SELECT_REGISTROS}{where} ORDER BY r.data, r.hora, r.id"
+                df = pd.read_sql_query(query, conn, params=params).rename(columns=_COLUNAS_REGISTROS)
+        entrada.update(df=df, marca=marca, avisos=avisos, lido_em=monotonic())
+        return df.copy(deep=False)
+
+def _schema_parquet_registros():
+    import pyarrow as pa
+    inteiros = {'ID': pa.int64(), 'Diferença (min)': pa.int64()}
+    return pa.schema([(coluna, inteiros.get(coluna, pa.string())) for coluna in _COLUNAS_REGISTROS.values()])
+
+def exportar_registros(destino, formato="csv", empresa_id=None, filial=None, setor=None, data_inicio=None, data_fim=None, tamanho_bloco=50_000, progresso=None):
+    """Exporta os registros filtrados para CSV (';', UTF-8) ou Parquet, bloco a bloco.
+
+    `destino` é um caminho ou um arquivo binário aberto. Aceita os mesmos
+    filtros do relatório do administrador e retorna o número de linhas.
+    `progresso`, se dado, é chamado com o total de linhas gravadas a cada bloco.
+    """
+    if formato not in ("csv", "parquet"):
+        raise ValueError(f"Formato de exportação desconhecido: {formato!r}")
+    blocos = iterar_registros_filtrados(empresa_id, filial, setor, data_inicio, data_fim, tamanho_bloco)
+    total = 0
+    arquivo = open(destino, "wb") if isinstance(destino, (str, os.PathLike)) else destino
+    try:
+        if formato == "csv":
+            cabecalho = True
+            for bloco in blocos:
+                arquivo.write(bloco.to_csv(sep=';', index=False, header=cabecalho).encode('utf-8'))
+                cabecalho = False
+                total += len(bloco)
+                if progresso: progresso(total)
+            if cabecalho:
+                arquivo.write((';'.join(_COLUNAS_REGISTROS.values()) + '\n').encode('utf-8'))
+        else:
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise RuntimeError("A exportação em Parquet requer o pacote 'pyarrow'.")
+            schema = _schema_parquet_registros()
+            with pq.ParquetWriter(arquivo, schema, compression="snappy") as writer:
+                for bloco in blocos:
+                    writer.write_table(pa.Table.from_pandas(bloco, schema=schema, preserve_index=False))
+                    total += len(bloco)
+                    if progresso: progresso(total)
+    finally:
+        blocos.close()
+        if arquivo is not destino:
+            arquivo.close()
+    return total
+
+def versao_registros_filtrados(empresa_id=None, filial=None, setor=None, data_inicio=None, data_fim=None):
+    """Impressão digital dos registros filtrados: muda a cada inserção, alteração ou exclusão que os afete.
+
+    Não passa pelo cache: escritas de outras réplicas também contam.
+    """
+    where, params = _filtros_registros_sql(empresa_id, filial, setor, data_inicio, data_fim)
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT (SELECT valor FROM registros_geracao), COUNT(*), COALESCE(MAX(r.versao), 0), COALESCE(SUM(r.versao), 0) "
+                f"FROM registros r JOIN funcionarios f ON r.cpf_funcionario = f.cpf{where}",
+                params,
+            )
+            return tuple(int(valor) for valor in cursor.fetchone())
+
+# Texto de cada coluna do log bruto para medir a largura no banco; Data e
+# Hora têm tamanho fixo ('DD/MM/AAAA', 'HH:MM:SS').
+_TEXTO_COLUNAS_REGISTROS = {
+    'ID': "CAST(r.id AS TEXT)", 'Código Forte': "f.codigo", 'Nome': "r.nome", 'Descrição': "r.descricao",
+    'Diferença (min)': "CAST(r.diferenca_min AS TEXT)", 'Observação': "r.observacao",
+    'Empresa': "e.nome_empresa", 'CNPJ': "e.cnpj", 'Setor': "f.tipo", 'Filial': "f.filial",
+}
+
+def _comprimentos_registros_filtrados(empresa_id=None, filial=None, setor=None, data_inicio=None, data_fim=None):
+    """Maior texto de cada coluna do log bruto no período inteiro, numa única agregação."""
+    where, params = _filtros_registros_sql(empresa_id, filial, setor, data_inicio, data_fim)
+    maximos = ", ".join(f"COALESCE(MAX(LENGTH({expressao})), 0)" for expressao in _TEXTO_COLUNAS_REGISTROS.values())
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT {maximos} FROM registros r JOIN funcionarios f ON r.cpf_funcionario = f.cpf "
+                f"LEFT JOIN empresas e ON f.empresa_id = e.id{where}",
+                params,
+            )
+            comprimentos = dict(zip(_TEXTO_COLUNAS_REGISTROS, (int(valor) for valor in cursor.fetchone())))
+    return {**comprimentos, 'Data': 10, 'Hora': 8}
+
+def _gerar_excel_exportacao(destino, progresso, nome_empresa, cnpj, filtros):
+    df_organizado = gerar_relatorio_diario_df(**filtros)
+    larguras_bruto = _comprimentos_registros_filtrados(**filtros)
+    progresso(0.1)
+
+    # O progresso acompanha as linhas entregues ao openpyxl, que é o que demora.
+    total = max(len(df_organizado) + contar_registros_filtrados(**filtros), 1)
+    gravadas = 0
+    def avancar(linhas):
+        nonlocal gravadas
+        gravadas += linhas
+        progresso(0.1 + 0.9 * min(gravadas / total, 1.0))
+
+    def organizado_em_blocos():
+        for inicio in range(0, max(len(df_organizado), 1), _LINHAS_POR_LOTE_EXCEL):
+            bloco = df_organizado.iloc[inicio:inicio + _LINHAS_POR_LOTE_EXCEL]
+            yield bloco
+            avancar(len(bloco))
+
+    def bruto_em_blocos():
+        # Já vêm do banco em ordem de data, hora e id; só a data muda de formato, bloco a bloco.
+        for bloco in iterar_registros_filtrados(**filtros, tamanho_bloco=_LINHAS_POR_LOTE_EXCEL):
+            bloco['Data'] = pd.to_datetime(bloco['Data'], format='%Y-%m-%d').dt.strftime('%d/%m/%Y')
+            yield bloco
+            avancar(len(bloco))
+
+    gerar_arquivo_excel(organizado_em_blocos(), bruto_em_blocos(), nome_empresa, cnpj,
+                        filtros['data_inicio'], filtros['data_fim'], destino=destino,
+                        larguras_organizado=_comprimentos_colunas(df_organizado), larguras_bruto=larguras_bruto)
+
+_EXTENSOES_EXPORTACAO = ("xlsx", "csv", "parquet")
+
+def solicitar_exportacao(formato, empresa_id=None, filial=None, setor=None, data_inicio=None, data_fim=None):
+    """Pede, em segundo plano, a exportação dos registros filtrados; devolve o `exportacoes.Trabalho`.
+
+    `formato` é "xlsx" (relatório diário e log de eventos, como no painel;
+    pede `data_inicio` e `data_fim`), "csv" ou "parquet" (`exportar_registros`).
+    A chave do arquivo junta formato, filtros, `versao_registros_filtrados` e
+    o cadastro de empresas (nome e CNPJ saem no arquivo): enquanto nada
+    mudar, pedidos repetidos, de qualquer sessão, reaproveitam o mesmo arquivo.
+    """
+    if formato not in _EXTENSOES_EXPORTACAO:
+        raise ValueError(f"Formato de exportação desconhecido: {formato!r}")
+    filtros = dict(empresa_id=int(empresa_id or 0) or None, filial=filial or None, setor=setor or None,
+                   data_inicio=data_inicio, data_fim=data_fim)
+    empresas = ler_hierarquia_filtros()["empresas"]
+    versao = versao_registros_filtrados(**filtros)
+    chave = hashlib.sha256(repr((formato, sorted(filtros.items()), sorted(empresas.items()), versao)).encode()).hexdigest()[:32]
+    if formato == "xlsx":
+        nome_empresa, cnpj = empresas.get(filtros['empresa_id'], ("Todas as Empresas", None))
+        gerar = functools.partial(_gerar_excel_exportacao, nome_empresa=nome_empresa, cnpj=cnpj, filtros=filtros)
+    else:
+        total = max(versao[1], 1)
+        gerar = lambda destino, progresso: exportar_registros(destino, formato, **filtros, progresso=lambda linhas: progresso(linhas / total))
+    return exportacoes.solicitar(chave, formato, gerar)
+
+@_cache.cacheado("registros", "funcionarios", "empresas")
+def ler_historico_funcionario_df(cpf, cursor=None, tamanho_pagina=20):
+    """Uma página do histórico de um funcionário, do mais recente ao mais antigo.
+
+    Paginação por keyset: `cursor` é o `proximo_cursor` devolvido pela página
+    anterior (None na primeira). Retorna `(df, proximo_cursor)`, com
+    `proximo_cursor` None quando não há mais páginas.
+    """
+    condicoes, params = ["r.cpf_funcionario = %s"], [cpf]
+    if cursor is not None:
+        condicoes.append("(r.data, r.hora, r.id) < (%s, %s, %s)")
+        params.extend(cursor)
+    query = (
+        f"{_banco.SELECT_REGISTROS} WHERE {' AND '.join(condicoes)} "
+        "ORDER BY r.data DESC, r.hora DESC, r.id DESC LIMIT %s"
+    )
+    params.append(int(tamanho_pagina) + 1)
+    with get_db_connection() as conn:
+        df = pd.read_sql_query(query, conn, params=params).rename(columns=_COLUNAS_REGISTROS)
+    proximo_cursor = None
+    if len(df) > tamanho_pagina:
+        df = df.iloc[:tamanho_pagina]
+        ultimo = df.iloc[-1]
+        proximo_cursor = (ultimo['Data'], ultimo['Hora'], int(ultimo['ID']))
+    return df, proximo_cursor
+
+# Correções de registros em lote (ver atualizar_registros_em_lote). A
+# diferença tolerada é refeita no UPDATE com a regra de
+# status_ponto.aplicar_tolerancia e o arredondamento de round() (metade
+# para o par), a partir dos segundos da hora nova e da prevista. A versão
+# das linhas é gravada pela própria instrução (`NOVA_VERSAO_REGISTROS`).
+_SQL_APLICAR_CORRECOES = """
+    UPDATE registros AS r SET
+        hora = COALESCE(c.hora, r.hora),
+        observacao = COALESCE(c.observacao, r.observacao),
+        versao = {nova_versao},
+        diferenca_min = CASE
+            WHEN c.hora IS NULL THEN r.diferenca_min
+            WHEN c.bruta IS NULL THEN 0
+            WHEN ABS(c.bruta) <= %(tolerancia)s THEN 0
+            WHEN c.bruta > 0 THEN c.bruta - %(tolerancia)s
+            ELSE c.bruta + %(tolerancia)s
+        END
+    FROM (
+        SELECT id, hora, observacao,
+               CASE WHEN diferenca_seg < 0 THEN -1 ELSE 1 END * (
+                   ABS(diferenca_seg) / 60 + CASE
+                       WHEN ABS(diferenca_seg) %% 60 > 30 THEN 1
+                       WHEN ABS(diferenca_seg) %% 60 = 30 THEN (ABS(diferenca_seg) / 60) %% 2
+                       ELSE 0
+                   END
+               ) AS bruta
+          FROM (SELECT id, hora, observacao, hora_seg - previsto_seg AS diferenca_seg FROM correcoes) d
+    ) c
+    WHERE r.id = c.id
+"""
+
+_LOTACAO_POR_ID = 500
+
+def _segundos_do_dia(hora):
+    return hora.hour * 3600 + hora.minute * 60 + hora.second
+
+def atualizar_registros_em_lote(alteracoes):
+    """Aplica várias correções de ponto numa única transação.
+
+    `alteracoes` são tuplas `(id, novo_horario, nova_observacao)`, com None
+    no que não muda e o horário em 'HH:MM:SS'. As correções válidas vão em
+    lote para uma tabela temporária e entram em `registros` com um único
+    UPDATE, que refaz `diferenca_min` das horas alteradas; o resumo diário e
+    o banco de horas dos dias tocados são recalculados na mesma transação.
+    Retorna, na ordem de entrada, uma tupla `(id, mensagem, tipo)` por
+    alteração. Um erro do banco desfaz o lote inteiro.
+    """
+    resultados, validas = [], {}
+    for id_registro, novo_horario, nova_observacao in alteracoes:
+        try:
+            id_registro = int(id_registro)
+        except (TypeError, ValueError):
+            resultados.append((id_registro, "ID de registro inválido.", "error"))
+            continue
+        try:
+            nova_hora = datetime.strptime(novo_horario, "%H:%M:%S").time() if novo_horario is not None else None
+        except ValueError:
+            resultados.append((id_registro, "Formato de hora inválido. Use HH:MM:SS.", "error"))
+            continue
+        if id_registro in validas:
+            resultados.append((id_registro, "Registro repetido no lote; vale a primeira alteração.", "warning"))
+            continue
+        validas[id_registro] = (nova_hora, nova_observacao)
+        resultados.append((id_registro, None, None))
+    if not validas:
+        return resultados
+
+    ids = list(validas)
+    horarios = obter_horarios()
     try:
         with get_db_connection() as conn:
-            with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-                if nova_observacao is not None:
-                    cursor.execute("UPDATE registros SET observacao = %s WHERE id = %s", (nova_observacao, id_registro))
-                if novo_horario is not None:
-                    novo_obj = datetime.strptime(novo_horario, "%H:%M:%S").time()
-                    cursor.execute("SELECT descricao, data FROM registros WHERE id = %s", (id_registro,))
-                    row = cursor.fetchone()
-                    if row:
-                        hora_prevista = HORARIOS_PADRAO.get(row['descricao'])
-                        if hora_prevista:
-                            dt_reg = datetime.strptime(row['data'], "%Y-%m-%d")
-                            dt_previsto = dt_reg.replace(hour=hora_prevista.hour, minute=hora_prevista.minute)
-                            dt_novo = dt_reg.replace(hour=novo_obj.hour, minute=novo_obj.minute, second=novo_obj.second)
-                            diff_bruta = round((dt_novo - dt_previsto).total_seconds() / 60)
-                            diff_final = 0 if abs(diff_bruta) <= TOLERANCIA_MINUTOS else diff_bruta - TOLERANCIA_MINUTOS if diff_bruta > 0 else diff_bruta + TOLERANCIA_MINUTOS
-                            cursor.execute("UPDATE registros SET hora = %s, diferenca_min = %s WHERE id = %s", (novo_horario, diff_final, id_registro))
+            with conn.cursor() as cursor:
+                lotacoes = []
+                for inicio in range(0, len(ids), _LOTACAO_POR_ID):
+                    bloco = ids[inicio:inicio + _LOTACAO_POR_ID]
+                    cursor.execute(
+                        "SELECT r.id, r.descricao, r.data, r.cpf_funcionario, e.nome_empresa, f.filial, f.tipo FROM registros r "
+                        "JOIN funcionarios f ON r.cpf_funcionario = f.cpf LEFT JOIN empresas e ON f.empresa_id = e.id "
+                        f"WHERE r.id IN ({', '.join(['%s'] * len(bloco))})",
+                        bloco
+                    )
+                    lotacoes.extend(cursor.fetchall())
+                lotacao = pd.DataFrame(lotacoes, columns=['ID', 'Descrição', 'Data', 'CPF', 'Empresa', 'Filial', 'Setor'])
+                previstos = horarios.segundos_previstos(lotacao).tolist() if lotacoes else []
+                encontrados = set(lotacao['ID'].tolist())
+
+                linhas = []
+                for id_registro, previsto in zip(lotacao['ID'].tolist(), previstos):
+                    nova_hora, nova_observacao = validas[id_registro]
+                    linhas.append((
+                        id_registro,
+                        nova_hora.strftime("%H:%M:%S") if nova_hora is not None else None,
+                        _segundos_do_dia(nova_hora) if nova_hora is not None else None,
+                        int(previsto) if pd.notna(previsto) else None,
+                        nova_observacao,
+                    ))
+                if linhas:
+                    _banco.criar_temporaria(cursor, "correcoes", "id BIGINT, hora TIME, hora_seg INTEGER, previsto_seg INTEGER, observacao TEXT")
+                    _banco.inserir_linhas(cursor, "correcoes", ['id', 'hora', 'hora_seg', 'previsto_seg', 'observacao'], linhas)
+                    cursor.execute(_SQL_APLICAR_CORRECOES.format(nova_versao=_banco.NOVA_VERSAO_REGISTROS), {"tolerancia": TOLERANCIA_MINUTOS})
+
+                    dias = list(dict.fromkeys(zip(lotacao['CPF'], lotacao['Data'])))
+                    _banco.recalcular_dias(cursor, dias)
+                    _recalcular_banco_horas(cursor, dias, horarios)
+                    _banco.avisar_registros(cursor, "alteracao")
             conn.commit()
-    except ValueError: return "Formato de hora inválido. Use HH:MM:SS.", "error"
-    except psycopg2.Error as e: return f"Erro no banco de dados: {e}", "error"
-    return "Registro atualizado com sucesso.", "success"
+        if linhas:
+            _cache.invalidar("registros", "banco_horas")
+    except _banco.Erro as e:
+        erro = (f"Erro no banco de dados: {e}", "error")
+        return [(id_registro, *erro) if tipo is None else (id_registro, msg, tipo)
+                for id_registro, msg, tipo in resultados]
+
+    for posicao, (id_registro, msg, tipo) in enumerate(resultados):
+        if tipo is None and id_registro in encontrados:
+            resultados[posicao] = (id_registro, "Registro atualizado com sucesso.", "success")
+        elif tipo is None:
+            resultados[posicao] = (id_registro, "Registro não encontrado.", "warning")
+    return resultados
+
+def atualizar_registro(id_registro, novo_horario=None, nova_observacao=None):
+    (_, msg, tipo), = atualizar_registros_em_lote([(id_registro, novo_horario, nova_observacao)])
+    return msg, tipo
 
 def adicionar_funcionario(codigo, nome, nome_empresa, cnpj, cpf, cod_tipo, tipo, filial):
     if not all([codigo, nome, nome_empresa, cpf]):
@@ -233,73 +786,93 @@ def adicionar_funcionario(codigo, nome, nome_empresa, cnpj, cpf, cod_tipo, tipo,
                     return f"O CPF '{cpf}' já está em uso.", "warning"
                 
                 empresa_id = _obter_ou_criar_empresa_id(nome_empresa, cnpj, cursor)
-                senha_hash = _hash_senha(codigo)
+                senha_hash = gerar_hash(codigo)
                 cursor.execute(
                     "INSERT INTO funcionarios (cpf, codigo, nome, senha, role, empresa_id, cod_tipo, tipo, filial) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
                     (cpf, codigo, nome, senha_hash, 'employee', empresa_id, cod_tipo, tipo, filial)
                 )
             conn.commit()
-    except psycopg2.Error as e: return f"Erro no banco de dados: {e}", "error"
+        _cache.invalidar("funcionarios", "empresas")
+    except _banco.Erro as e: return f"Erro no banco de dados: {e}", "error"
     return f"Funcionário '{nome}' adicionado com sucesso!", "success"
 
-def _extrair_filial_do_texto(texto_arquivo):
-    texto_lower = texto_arquivo.lower()
-    if "matriz" in texto_lower: return "Matriz"
-    if "filial 02" in texto_lower or "filial 2" in texto_lower: return "Filial 02"
-    if "filial 03" in texto_lower or "filial 3" in texto_lower: return "Filial 03"
-    if "filial 04" in texto_lower or "filial 4" in texto_lower: return "Filial 04"
-    return "Não Identificada"
+_PADROES_FILIAL = [
+    ("Matriz", "matriz"),
+    ("Filial 02", "filial 02|filial 2"),
+    ("Filial 03", "filial 03|filial 3"),
+    ("Filial 04", "filial 04|filial 4"),
+]
+
+def _extrair_filial(textos_arquivo: pd.Series) -> pd.Series:
+    """Filial a partir do nome do arquivo de origem; o primeiro padrão que casar vence."""
+    texto = textos_arquivo.str.lower()
+    condicoes = [texto.str.contains(padrao, regex=True).to_numpy(dtype=bool) for _, padrao in _PADROES_FILIAL]
+    return pd.Series(np.select(condicoes, [filial for filial, _ in _PADROES_FILIAL], "Não Identificada"), index=textos_arquivo.index)
+
+_COLUNAS_IMPORTACAO = {'CPF': 'cpf', 'CODFORTE': 'codigo', 'NOME': 'nome', 'EMPRESA': 'empresa', 'CNPJ': 'cnpj', 'CODTIPO': 'cod_tipo', 'TIPO': 'tipo'}
 
 def importar_funcionarios_em_massa(df_funcionarios):
-    novos_funcionarios, erros, sucesso_count, ignorados_count = [], [], 0, 0
-    cpfs_existentes = ler_funcionarios_df()['cpf'].tolist()
-    
+    """Importa funcionários a partir do DataFrame do arquivo de RH.
+
+    Linhas cujo CPF já existe (no banco ou numa linha anterior do arquivo)
+    são ignoradas; linhas sem CodForte, Nome, CPF ou Empresa viram erro com
+    o número da linha. As válidas vão em massa (COPY no PostgreSQL) para
+    uma tabela temporária e entram em funcionarios com um único INSERT.
+    """
     colunas_necessarias = ['ARQUIVO', 'EMPRESA', 'CNPJ', 'CODTIPO', 'TIPO', 'CODFORTE', 'NOME', 'CPF']
     if not all(col.upper() in df_funcionarios.columns for col in colunas_necessarias):
         return 0, 0, [f"Erro Crítico: Verifique se as colunas {colunas_necessarias} existem no arquivo."]
 
+    df = pd.DataFrame({
+        destino: df_funcionarios[origem].fillna('').astype(str).str.strip()
+        for origem, destino in _COLUNAS_IMPORTACAO.items()
+    })
+    df['filial'] = _extrair_filial(df_funcionarios['ARQUIVO'].fillna('').astype(str))
+    # PIS é opcional no arquivo; só serve para casar marcações de AFD.
+    df['pis'] = (df_funcionarios['PIS'].fillna('').astype(str).str.replace(r'\D', '', regex=True)
+                 if 'PIS' in df_funcionarios.columns else '')
+    df['linha'] = df_funcionarios.index.to_numpy() + 2
+    df = df.reset_index(drop=True)
+
+    erros, sucesso_count = [], 0
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
-            empresas_existentes_df = ler_empresas()
-            empresas_existentes = dict(zip(empresas_existentes_df['nome_empresa'].str.lower(), empresas_existentes_df['id']))
+            cursor.execute("SELECT cpf FROM funcionarios")
+            cpfs_existentes = {cpf for (cpf,) in cursor.fetchall()}
 
-            for index, row in df_funcionarios.iterrows():
-                try:
-                    filial = _extrair_filial_do_texto(str(row['ARQUIVO']))
-                    nome_empresa = str(row['EMPRESA']).strip()
-                    cnpj = str(row['CNPJ']).strip()
-                    cod_tipo = str(row['CODTIPO']).strip()
-                    tipo = str(row['TIPO']).strip()
-                    codigo = str(row['CODFORTE']).strip()
-                    nome = str(row['NOME']).strip()
-                    cpf_raw = str(row['CPF']).strip()
-                    
-                    if cpf_raw in cpfs_existentes:
-                        ignorados_count += 1
-                        continue
-                    if not all([codigo, nome, cpf_raw, nome_empresa]):
-                        erros.append(f"Linha {index+2}: Dados essenciais (CodForte, Nome, CPF, Empresa) incompletos.")
-                        continue
-                    
-                    empresa_id = empresas_existentes.get(nome_empresa.lower())
-                    if not empresa_id:
-                        empresa_id = _obter_ou_criar_empresa_id(nome_empresa, cnpj, cursor)
-                        empresas_existentes[nome_empresa.lower()] = empresa_id
-
-                    senha_hash = _hash_senha(codigo)
-                    novos_funcionarios.append((cpf_raw, codigo, nome, senha_hash, 'employee', empresa_id, cod_tipo, tipo, filial))
-                    cpfs_existentes.append(cpf_raw)
-                except Exception as e:
-                    erros.append(f"Linha {index+2}: Erro - {e}")
-            
-            if novos_funcionarios:
+            posicao = df.index.to_series()
+            completo = (df[['codigo', 'nome', 'cpf', 'empresa']] != '').all(axis=1)
+            no_banco = df['cpf'].isin(cpfs_existentes)
+            candidato = completo & ~no_banco
+            # Depois da primeira linha válida de um CPF, qualquer outra com o
+            # mesmo CPF conta como "já existe", esteja completa ou não.
+            primeira_valida = posicao[candidato].groupby(df.loc[candidato, 'cpf']).min()
+            repetido = df['cpf'].map(primeira_valida).lt(posicao)
+            ignorado = no_banco | repetido
+            aceito = candidato & ~repetido
+
+            erros = [f"Linha {linha}: Dados essenciais (CodForte, Nome, CPF, Empresa) incompletos." for linha in df.loc[~ignorado & ~completo, 'linha']]
+            ignorados_count = int(ignorado.sum())
+
+            novos = df[aceito].copy()
+            if not novos.empty:
+                novos['senha'] = gerar_hashes_em_lote(novos['codigo'])
+                colunas = ['linha', 'cpf', 'codigo', 'nome', 'senha', 'empresa', 'cnpj', 'cod_tipo', 'tipo', 'filial', 'pis']
                 try:
-                    cursor.executemany("INSERT INTO funcionarios (cpf, codigo, nome, senha, role, empresa_id, cod_tipo, tipo, filial) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)", novos_funcionarios)
-                    sucesso_count = len(novos_funcionarios)
-                except psycopg2.Error as e:
+                    _banco.criar_temporaria(cursor, "importacao_funcionarios", """
+                        linha INTEGER, cpf TEXT, codigo TEXT, nome TEXT, senha TEXT,
+                        empresa TEXT, cnpj TEXT, cod_tipo TEXT, tipo TEXT, filial TEXT, pis TEXT
+                    """)
+                    _banco.copiar(cursor, "importacao_funcionarios", colunas, novos[colunas])
+                    sucesso_count = _banco.inserir_funcionarios_importados(cursor)
+                    # CPFs cadastrados por outra sessão enquanto o arquivo era processado, ou PIS repetido.
+                    ignorados_count += len(novos) - sucesso_count
+                except _banco.Erro as e:
+                    conn.rollback()
                     erros.append(f"Erro geral no banco de dados: {e}")
         conn.commit()
-        
+    _cache.invalidar("funcionarios", "empresas")
+
     return sucesso_count, ignorados_count, erros
 
 def excluir_funcionario(cpf):
@@ -307,86 +880,428 @@ def excluir_funcionario(cpf):
         with get_db_connection() as conn:
             with conn.cursor() as cursor:
                 cursor.execute("DELETE FROM registros WHERE cpf_funcionario = %s", (cpf,))
+                cursor.execute("DELETE FROM pontos_dia WHERE cpf_funcionario = %s", (cpf,))
+                cursor.execute("DELETE FROM registros_diarios WHERE cpf_funcionario = %s", (cpf,))
+                cursor.execute("DELETE FROM horarios WHERE cpf_funcionario = %s", (cpf,))
+                cursor.execute("DELETE FROM banco_horas WHERE cpf_funcionario = %s", (cpf,))
                 cursor.execute("DELETE FROM funcionarios WHERE cpf = %s", (cpf,))
+                _registrar_exclusao(cursor)
             conn.commit()
+        _cache.invalidar("registros", "funcionarios", "horarios", "banco_horas")
         return f"Funcionário com CPF {cpf} e todos os seus registros foram excluídos.", "success"
-    except psycopg2.Error as e:
+    except _banco.Erro as e:
         return f"Erro no banco de dados ao excluir funcionário: {e}", "error"
 
-def _formatar_timedelta(td):
-    if pd.isnull(td): return "00:00"
-    total_seconds = int(td.total_seconds())
-    hours, remainder = divmod(total_seconds, 3600)
-    minutes, _ = divmod(remainder, 60)
-    return f"{hours:02d}:{minutes:02d}"
+_COLUNAS_HORARIOS = {'id': 'ID', 'nome_empresa': 'Empresa', 'filial': 'Filial', 'setor': 'Setor', 'cpf_funcionario': 'CPF', 'dia_semana': 'Dia da Semana', 'evento': 'Evento', 'hora': 'Hora', 'vigente_de': 'Vigente de', 'vigente_ate': 'Vigente até'}
+
+@_cache.cacheado("horarios", "empresas")
+def ler_horarios_df():
+    query = (
+        "SELECT h.id, e.nome_empresa, h.filial, h.setor, h.cpf_funcionario, h.dia_semana, h.evento, h.hora, h.vigente_de, h.vigente_ate "
+        "FROM horarios h LEFT JOIN empresas e ON h.empresa_id = e.id "
+        "ORDER BY h.cpf_funcionario NULLS FIRST, e.nome_empresa NULLS FIRST, h.filial NULLS FIRST, h.setor NULLS FIRST, h.evento, h.dia_semana NULLS FIRST, h.vigente_de NULLS FIRST"
+    )
+    with get_db_connection() as conn:
+        return pd.read_sql_query(query, conn).rename(columns=_COLUNAS_HORARIOS)
+
+def adicionar_horario(evento, hora, empresa_id=None, filial=None, setor=None, cpf=None, dia_semana=None, vigente_de=None, vigente_ate=None):
+    """Inclui uma regra em `horarios` (ver horarios.py para a precedência).
+
+    Escopos vazios valem para todos; com `cpf`, empresa/filial/setor são
+    ignorados. `hora` é `time` ou 'HH:MM[:SS]'; `dia_semana` vai de 1
+    (segunda) a 7 (domingo).
+    """
+    if evento not in HORARIOS_PADRAO:
+        return f"Evento inválido. Use um de: {', '.join(HORARIOS_PADRAO)}.", "error"
+    if not isinstance(hora, time):
+        try:
+            hora = time.fromisoformat(str(hora).strip())
+        except ValueError:
+            return "Formato de hora inválido. Use HH:MM:SS.", "error"
+    if dia_semana and not 1 <= int(dia_semana) <= 7:
+        return "Dia da semana deve ir de 1 (segunda) a 7 (domingo).", "error"
+    if vigente_de and vigente_ate and vigente_de > vigente_ate:
+        return "O fim da vigência não pode ser anterior ao início.", "error"
+    cpf = (cpf or '').strip() or None
+    if cpf:
+        empresa_id, filial, setor = None, None, None
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                if cpf:
+                    cursor.execute("SELECT 1 FROM funcionarios WHERE cpf = %s", (cpf,))
+                    if cursor.fetchone() is None:
+                        return f"Nenhum funcionário com o CPF '{cpf}'.", "warning"
+                cursor.execute(
+                    "INSERT INTO horarios (empresa_id, filial, setor, cpf_funcionario, dia_semana, evento, hora, vigente_de, vigente_ate) "
+                    "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                    (int(empresa_id) if empresa_id else None, (filial or '').strip() or None, (setor or '').strip() or None,
+                     cpf, int(dia_semana) if dia_semana else None, evento, hora.replace(microsecond=0), vigente_de or None, vigente_ate or None)
+                )
+            conn.commit()
+        _cache.invalidar("horarios")
+    except _banco.Erro as e: return f"Erro no banco de dados: {e}", "error"
+    return f"Horário de '{evento}' às {hora.strftime('%H:%M:%S')} adicionado.", "success"
+
+def excluir_horario(id_horario):
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM horarios WHERE id = %s", (int(id_horario),))
+            conn.commit()
+        _cache.invalidar("horarios")
+    except _banco.Erro as e: return f"Erro no banco de dados: {e}", "error"
+    return "Horário excluído.", "success"
+
+def _formatar_duracoes(segundos: pd.Series) -> pd.Series:
+    """Durações em segundos como "HH:MM"; nulos viram "00:00"."""
+    total = pd.Series(segundos).fillna(0).astype('int64')
+    horas, resto = np.divmod(total, 3600)
+    return horas.astype(str).str.zfill(2) + ':' + (resto // 60).astype(str).str.zfill(2)
+
+_COLUNAS_RELATORIO = ['Data', 'Código do Funcionário', 'Nome do Funcionário', 'Empresa', 'CNPJ', 'Entrada', 'Saída', 'Total Horas Trabalhadas', 'Observação']
 
 def gerar_relatorio_organizado_df(df_registros: pd.DataFrame) -> pd.DataFrame:
     if df_registros.empty: return pd.DataFrame()
     df = df_registros.copy()
-    df['Descrição'] = df['Descrição'].replace({"Início do Expediente": "Entrada", "Fim do Expediente": "Saída"})
+    df['Descrição'] = df['Descrição'].replace(ALIASES_EVENTOS)
     df_pivot = df.pivot_table(index=['Data', 'Código Forte', 'Nome', 'Empresa', 'CNPJ'], columns='Descrição', values='Hora', aggfunc='first').reset_index()
-    df_obs = df.dropna(subset=['Observação']).groupby(['Data', 'Código Forte'])['Observação'].apply(lambda x: ' | '.join(x.unique())).reset_index()
+    # Observações distintas do dia, na ordem em que aparecem, unidas por " | ".
+    obs = df.dropna(subset=['Observação']).drop_duplicates(subset=['Data', 'Código Forte', 'Observação'])
+    separador = np.where(obs.groupby(['Data', 'Código Forte']).cumcount() == 0, '', ' | ')
+    df_obs = (separador + obs['Observação']).groupby([obs['Data'], obs['Código Forte']]).sum().rename('Observação').reset_index()
     df_final = pd.merge(df_pivot, df_obs, on=['Data', 'Código Forte'], how='left').fillna({'Observação': ''})
+    segundos = {}
     for evento in ['Entrada', 'Saída']:
         if evento not in df_final.columns: df_final[evento] = np.nan
-        df_final[evento] = pd.to_datetime(df_final[evento], format='%H:%M:%S', errors='coerce').dt.time
-    dt_entrada = pd.to_datetime(df_final['Data'].astype(str) + ' ' + df_final['Entrada'].astype(str), errors='coerce')
-    dt_saida = pd.to_datetime(df_final['Data'].astype(str) + ' ' + df_final['Saída'].astype(str), errors='coerce')
-    df_final['Total Horas Trabalhadas'] = (dt_saida - dt_entrada).apply(_formatar_timedelta)
-    colunas = ['Data', 'Código Forte', 'Nome', 'Empresa', 'CNPJ', 'Entrada', 'Saída', 'Total Horas Trabalhadas', 'Observação']
-    for col in colunas:
+        horas = pd.to_datetime(df_final[evento], format='%H:%M:%S', errors='coerce')
+        segundos[evento] = horas.dt.hour * 3600 + horas.dt.minute * 60 + horas.dt.second
+        df_final[evento] = horas.dt.time
+    df_final['Total Horas Trabalhadas'] = _formatar_duracoes(segundos['Saída'] - segundos['Entrada'])
+    df_final = df_final.rename(columns={'Código Forte': 'Código do Funcionário', 'Nome': 'Nome do Funcionário'})
+    for col in _COLUNAS_RELATORIO:
         if col not in df_final.columns: df_final[col] = 'N/A'
-    df_final = df_final[colunas]
-    df_final.rename(columns={'Código Forte': 'Código do Funcionário', 'Nome': 'Nome do Funcionário'}, inplace=True)
+    df_final = df_final[_COLUNAS_RELATORIO]
     df_final['Data'] = pd.to_datetime(df_final['Data']).dt.strftime('%d/%m/%Y')
     return df_final
 
-def gerar_arquivo_excel(df_organizado, df_bruto, nome_empresa, cnpj, data_inicio, data_fim):
-    output_buffer = io.BytesIO()
+@_cache.cacheado("registros", "funcionarios", "empresas")
+def gerar_relatorio_diario_df(empresa_id=None, filial=None, setor=None, data_inicio=None, data_fim=None):
+    """Mesmo resultado de `gerar_relatorio_organizado_df(ler_registros_filtrados_df(...))`,
+    lido de `registros_diarios` (uma linha por funcionário/dia) em vez de
+    re-pivotar os eventos brutos.
+    """
+    where, params = _filtros_registros_sql(empresa_id, filial, setor, data_inicio, data_fim)
+    query = _banco.SELECT_RELATORIO_DIARIO.format(filtro=f"{where}{' AND' if where else ' WHERE'} e.cnpj IS NOT NULL")
+    with get_db_connection() as conn:
+        df = pd.read_sql_query(query, conn, params=params)
+    if df.empty: return pd.DataFrame()
+    for coluna in ['entrada', 'saida']:
+        df[coluna] = df[coluna].astype(object).where(df[coluna].notna(), pd.NaT)
+    df['segundos'] = _formatar_duracoes(df['segundos'])
+    df.columns = _COLUNAS_RELATORIO
+    return df
+
+def arquivar_registros_antigos(meses=RETENCAO_REGISTROS_MESES, diretorio=DIRETORIO_ARQUIVO_REGISTROS, simular=False):
+    """Arquiva em .csv.gz e remove os meses de registros (partições, no PostgreSQL) com mais de `meses` meses.
+
+    O mês corrente conta como o primeiro; com `simular`, só lista os arquivos
+    que seriam gerados.
+    """
+    if meses < 1:
+        raise ValueError("A retenção precisa ser de pelo menos 1 mês.")
+    corte = particoes.somar_meses(datetime.now(FUSO_HORARIO).date(), -(meses - 1))
+    with get_db_connection() as conn:
+        arquivos = _banco.arquivar_registros(conn, corte, diretorio, simular=simular)
+        if arquivos and not simular:
+            with conn.cursor() as cursor:
+                _registrar_exclusao(cursor)
+            conn.commit()
+    if arquivos and not simular:
+        _cache.invalidar("registros")
+    return arquivos
+
+def reconstruir_registros_diarios(data_inicio=None, data_fim=None):
+    """Refaz `registros_diarios` no período a partir de `registros`. Retorna o número de dias gravados."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            dias = _banco.reconstruir_dias(cursor, data_inicio, data_fim)
+        conn.commit()
+    _cache.invalidar("registros")
+    return dias
+
+# Banco de horas (ver banco_horas.py) ---------------------------------------
+_SELECT_DIAS_BANCO_HORAS = '''
+    SELECT d.cpf_funcionario, d.data, d.entrada, d.saida, e.nome_empresa, f.filial, f.tipo
+      FROM registros_diarios d JOIN funcionarios f ON f.cpf = d.cpf_funcionario LEFT JOIN empresas e ON e.id = f.empresa_id
+     WHERE d.data >= %s AND d.data < %s
+'''
+
+def _ler_dias_banco_horas(cursor, inicio, fim, condicoes="", params=()):
+    """Dias de `registros_diarios` em [inicio, fim), com a lotação, nas colunas de `banco_horas.COLUNAS_DIAS`."""
+    cursor.execute(_SELECT_DIAS_BANCO_HORAS + condicoes, (inicio, fim, *params))
+    return pd.DataFrame(cursor.fetchall(), columns=banco_horas.COLUNAS_DIAS)
+
+def _ultimos_fechamentos(cursor, condicoes="", params=()):
+    """Funcionários com o último mês fechado (ou None), o acumulado até ele e o primeiro dia com ponto."""
+    cursor.execute(f'''
+        SELECT f.cpf, f.codigo, f.nome, e.nome_empresa, f.filial, f.tipo, b.mes, COALESCE(b.acumulado_min, 0),
+               (SELECT MIN(d.data) FROM registros_diarios d WHERE d.cpf_funcionario = f.cpf)
+          FROM funcionarios f
+          LEFT JOIN empresas e ON e.id = f.empresa_id
+          LEFT JOIN banco_horas b ON b.cpf_funcionario = f.cpf
+               AND b.mes = (SELECT MAX(mes) FROM banco_horas WHERE cpf_funcionario = f.cpf)
+         WHERE f.role = 'employee'{condicoes}
+         ORDER BY f.nome, f.cpf
+    ''', params)
+    return pd.DataFrame(cursor.fetchall(), columns=['cpf', 'codigo', 'nome', 'empresa', 'filial', 'setor', 'mes', 'acumulado_min', 'primeiro_dia'])
+
+def _recalcular_banco_horas(cursor, dias, horarios):
+    """Recalcula os meses já fechados que contêm os (cpf, data) de `dias`; não faz commit.
+
+    Só os pares funcionário/mês afetados entram na conta, lidos numa única
+    consulta; o acumulado dos meses fechados seguintes anda pela diferença.
+    """
+    afetados = {(cpf, particoes.inicio_do_mes(data)) for cpf, data in dias}
+    if not afetados:
+        return
+    meses = [mes for _, mes in afetados]
+    cursor.execute("SELECT cpf_funcionario, mes, saldo_min FROM banco_horas WHERE mes >= %s AND mes <= %s", (min(meses), max(meses)))
+    fechados = [(cpf, mes, saldo) for cpf, mes, saldo in cursor.fetchall() if (cpf, mes) in afetados]
+    if not fechados:
+        return
+    cpfs = sorted({cpf for cpf, _, _ in fechados})
+    meses_fechados = [mes for _, mes, _ in fechados]
+    dias_fechados = _ler_dias_banco_horas(
+        cursor, min(meses_fechados), particoes.somar_meses(max(meses_fechados), 1),
+        f" AND d.cpf_funcionario IN ({', '.join(['%s'] * len(cpfs))})", cpfs
+    )
+    mensal = banco_horas.saldos_mensais(dias_fechados, horarios)
+    mensal = {(cpf, mes): (int(saldo), int(dias_mes)) for cpf, mes, saldo, dias_mes in mensal.itertuples(index=False)}
+    for cpf, mes, saldo_anterior in fechados:
+        saldo, dias_mes = mensal.get((cpf, mes), (0, 0))
+        cursor.execute("UPDATE banco_horas SET saldo_min = %s, dias = %s WHERE cpf_funcionario = %s AND mes = %s", (saldo, dias_mes, cpf, mes))
+        if saldo != saldo_anterior:
+            cursor.execute("UPDATE banco_horas SET acumulado_min = acumulado_min + %s WHERE cpf_funcionario = %s AND mes >= %s",
+                           (saldo - saldo_anterior, cpf, mes))
+
+def fechar_banco_horas(ate_mes=None):
+    """Fecha o banco de horas de todos os funcionários até o mês de `ate_mes` (padrão: o mês passado).
+
+    Cada funcionário segue do mês depois do seu último fechamento (ou do mês
+    do seu primeiro ponto); meses sem ponto entram com saldo 0. Os saldos
+    saem de uma única leitura de `registros_diarios` do período.
+    """
+    hoje = datetime.now(FUSO_HORARIO).date()
+    ate_mes = particoes.inicio_do_mes(ate_mes or particoes.somar_meses(hoje, -1))
+    if ate_mes >= particoes.inicio_do_mes(hoje):
+        return "Só é possível fechar meses já encerrados.", "error"
+    horarios = obter_horarios()
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                inicios, acumulados = {}, {}
+                fechamentos = _ultimos_fechamentos(cursor)
+                for cpf, ultimo, acumulado, primeiro_dia in fechamentos[['cpf', 'mes', 'acumulado_min', 'primeiro_dia']].itertuples(index=False):
+                    if pd.notna(ultimo):
+                        inicio = particoes.somar_meses(ultimo, 1)
+                    else:
+                        # MIN(data) volta como texto no SQLite.
+                        inicio = particoes.inicio_do_mes(pd.Timestamp(primeiro_dia).date()) if pd.notna(primeiro_dia) else None
+                    if inicio and inicio <= ate_mes:
+                        inicios[cpf], acumulados[cpf] = inicio, int(acumulado)
+                if not inicios:
+                    return f"Nada a fechar até {ate_mes:%m/%Y}.", "warning"
+
+                dias = _ler_dias_banco_horas(cursor, min(inicios.values()), particoes.somar_meses(ate_mes, 1))
+                grade = pd.DataFrame(
+                    [(cpf, mes) for cpf, inicio in inicios.items() for mes in banco_horas.meses_a_fechar(inicio, ate_mes)],
+                    columns=['cpf', 'mes'],
+                )
+                grade = grade.merge(banco_horas.saldos_mensais(dias, horarios), on=['cpf', 'mes'], how='left')
+                grade = grade.fillna({'saldo_min': 0, 'dias': 0}).astype({'saldo_min': 'int64', 'dias': 'int64'})
+                grade['acumulado_min'] = grade.groupby('cpf')['saldo_min'].cumsum() + grade['cpf'].map(acumulados)
+                _banco.copiar(cursor, "banco_horas", ['cpf_funcionario', 'mes', 'saldo_min', 'acumulado_min', 'dias'],
+                              grade[['cpf', 'mes', 'saldo_min', 'acumulado_min', 'dias']])
+            conn.commit()
+        _cache.invalidar("banco_horas")
+    except _banco.Erro as e: return f"Erro no banco de dados: {e}", "error"
+    return f"Banco de horas fechado até {ate_mes:%m/%Y} ({len(grade)} funcionário(s)/mês).", "success"
+
+def reabrir_banco_horas(a_partir_de, cpf=None):
+    """Desfaz os fechamentos do mês de `a_partir_de` em diante, de um funcionário ou de todos."""
+    mes = particoes.inicio_do_mes(a_partir_de)
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                if cpf:
+                    cursor.execute("DELETE FROM banco_horas WHERE mes >= %s AND cpf_funcionario = %s", (mes, cpf))
+                else:
+                    cursor.execute("DELETE FROM banco_horas WHERE mes >= %s", (mes,))
+                reabertos = cursor.rowcount
+            conn.commit()
+        _cache.invalidar("banco_horas")
+    except _banco.Erro as e: return f"Erro no banco de dados: {e}", "error"
+    if not reabertos:
+        return f"Nenhum mês fechado a partir de {mes:%m/%Y}.", "warning"
+    return f"{reabertos} fechamento(s) desfeito(s) a partir de {mes:%m/%Y}.", "success"
+
+_COLUNAS_BANCO_HORAS = ['Código Forte', 'Nome', 'Empresa', 'Filial', 'Setor', 'Fechado até', 'Saldo Fechado (min)', 'Saldo em Aberto (min)', 'Saldo (min)', 'Saldo']
+
+@_cache.cacheado("registros", "horarios", "funcionarios", "empresas", "banco_horas")
+def ler_banco_horas_df(empresa_id=None, filial=None, setor=None):
+    """Saldo atual de cada funcionário: acumulado do último mês fechado mais os meses abertos até hoje."""
+    where, params = _filtros_registros_sql(empresa_id, filial, setor)
+    condicoes = where.replace(" WHERE ", " AND ", 1)
+    amanha = datetime.now(FUSO_HORARIO).date() + timedelta(days=1)
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            df = _ultimos_fechamentos(cursor, condicoes, params)
+            if df.empty:
+                return pd.DataFrame(columns=_COLUNAS_BANCO_HORAS)
+            # Só a parte aberta é calculada aqui, a partir do mês mais antigo ainda aberto.
+            df['inicio'] = [particoes.somar_meses(mes, 1) if pd.notna(mes) else None for mes in df['mes']]
+            inicio = df['inicio'].min() if df['inicio'].notna().all() else date.min
+            dias = _ler_dias_banco_horas(cursor, inicio, amanha, condicoes, params)
+    inicio_por_cpf = pd.to_datetime(dias['cpf'].map(dict(zip(df['cpf'], df['inicio']))))
+    dias = dias[inicio_por_cpf.isna() | (pd.to_datetime(dias['data']) >= inicio_por_cpf)]
+    abertos = banco_horas.saldos_diarios(dias, obter_horarios()).groupby(dias['cpf']).sum()
+
+    df['Fechado até'] = [f"{mes:%m/%Y}" if pd.notna(mes) else "" for mes in df['mes']]
+    df['Saldo Fechado (min)'] = df['acumulado_min'].astype('int64')
+    df['Saldo em Aberto (min)'] = df['cpf'].map(abertos).fillna(0).astype('int64')
+    df['Saldo (min)'] = df['Saldo Fechado (min)'] + df['Saldo em Aberto (min)']
+    df['Saldo'] = banco_horas.formatar_minutos(df['Saldo (min)'])
+    df = df.rename(columns={'codigo': 'Código Forte', 'nome': 'Nome', 'empresa': 'Empresa', 'filial': 'Filial', 'setor': 'Setor'})
+    return df[_COLUNAS_BANCO_HORAS]
+
+_LINHAS_POR_LOTE_EXCEL = 10_000
+
+def _blocos(dados):
+    if isinstance(dados, pd.DataFrame):
+        yield dados
+    else:
+        yield from dados
+
+def _comprimentos_colunas(df: pd.DataFrame) -> dict:
+    # Maior texto de cada coluna, calculado por coluna e não célula a célula.
+    comprimentos = {}
+    for coluna in df.columns:
+        maior = df[coluna].dropna().astype(str).str.len().max()
+        comprimentos[coluna] = 0 if pd.isna(maior) else int(maior)
+    return comprimentos
+
+def _celula(worksheet, valor, **estilos):
+    from openpyxl.cell import WriteOnlyCell
+    celula = WriteOnlyCell(worksheet, value=valor)
+    for atributo, estilo in estilos.items():
+        setattr(celula, atributo, estilo)
+    return celula
+
+def _montar_linha(worksheet, linha):
+    # Itens dict ({"valor": ..., "font": ...}) viram células com estilo.
+    celulas = []
+    for item in linha:
+        if isinstance(item, dict):
+            estilos = dict(item)
+            item = _celula(worksheet, estilos.pop("valor"), **estilos)
+        celulas.append(item)
+    return celulas
+
+# Sem `larguras`, os blocos lidos até aqui ficam em memória para medir as colunas.
+_LINHAS_PARA_LARGURAS = 50_000
+
+def _escrever_planilha(workbook, titulo, dados, linhas_iniciais=(), mesclar=(), larguras=None):
+    """Grava `dados` (DataFrame ou iterável de DataFrames) numa aba write-only.
+
+    `linhas_iniciais` são listas de valores (ou dicts {"valor", estilos...})
+    gravadas antes do cabeçalho. As larguras das colunas precisam ser
+    definidas antes da primeira linha: valem o maior texto dos blocos lidos
+    até `_LINHAS_PARA_LARGURAS` linhas e, se dado, `larguras` ({coluna:
+    maior texto}, p.ex. medido no banco para o período inteiro).
+    """
+    from openpyxl.styles import Alignment, Border, Font, Side
+    from openpyxl.utils import get_column_letter
+
+    worksheet = workbook.create_sheet(titulo)
+    blocos = _blocos(dados)
+    # Com `larguras` basta o primeiro bloco não vazio (colunas e tipos).
+    minimo_linhas = 1 if larguras is not None else _LINHAS_PARA_LARGURAS
+    lidos, linhas_lidas = [], 0
+    for bloco in blocos:
+        lidos.append(bloco)
+        linhas_lidas += len(bloco)
+        if linhas_lidas >= minimo_linhas:
+            break
+    amostra = next((bloco for bloco in lidos if not bloco.empty), lidos[0] if lidos else pd.DataFrame())
+
+    comprimentos = {coluna: len(str(coluna)) for coluna in amostra.columns}
+    for medidas in [_comprimentos_colunas(bloco) for bloco in lidos] + [larguras or {}]:
+        for coluna, comprimento in medidas.items():
+            if coluna in comprimentos:
+                comprimentos[coluna] = max(comprimentos[coluna], comprimento)
+    for i, comprimento in enumerate(comprimentos.values(), 1):
+        worksheet.column_dimensions[get_column_letter(i)].width = comprimento + 2
+    for intervalo in mesclar:
+        worksheet.merged_cells.add(intervalo)
+    for linha in linhas_iniciais:
+        worksheet.append(_montar_linha(worksheet, linha))
+
+    borda = Side(style='thin')
+    worksheet.append([
+        _celula(worksheet, str(coluna), font=Font(bold=True),
+                border=Border(left=borda, right=borda, top=borda, bottom=borda),
+                alignment=Alignment(horizontal='center', vertical='top'))
+        for coluna in amostra.columns
+    ])
+
+    colunas_hora = [c for c in amostra.columns if pd.api.types.infer_dtype(amostra[c], skipna=True) == 'time']
+    for df in itertools.chain(lidos, blocos):
+        for inicio in range(0, len(df), _LINHAS_POR_LOTE_EXCEL):
+            lote = df.iloc[inicio:inicio + _LINHAS_POR_LOTE_EXCEL]
+            valores = lote.astype(object)
+            # Horas (datetime.time) saem como texto 'HH:MM:SS', como fazia o to_excel.
+            for coluna in colunas_hora:
+                valores[coluna] = valores[coluna].astype(str)
+            for linha in valores.where(lote.notna(), None).itertuples(index=False, name=None):
+                worksheet.append(linha)
+
+def gerar_arquivo_excel(df_organizado, df_bruto, nome_empresa, cnpj, data_inicio, data_fim, destino=None,
+                        larguras_organizado=None, larguras_bruto=None):
+    """Gera o .xlsx do relatório em modo write-only, com memória constante.
+
+    `df_organizado` e `df_bruto` podem ser DataFrames ou iteráveis de
+    DataFrames (blocos); `larguras_*` completam a medida das colunas (ver
+    `_escrever_planilha`). Com `destino` (caminho ou arquivo binário) o
+    arquivo é gravado nele; sem, é devolvido um `BytesIO`.
+    """
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, Alignment
+
     periodo_str = f"{data_inicio.strftime('%d/%m/%Y')} a {data_fim.strftime('%d/%m/%Y')}"
-    
-    with pd.ExcelWriter(output_buffer, engine='openpyxl') as writer:
-        df_organizado.to_excel(writer, sheet_name='Relatório Diário', index=False, startrow=4)
-        df_bruto.to_excel(writer, sheet_name='Log de Eventos (Bruto)', index=False)
-        workbook = writer.book
-        sheet_diario = writer.sheets['Relatório Diário']
-        from openpyxl.styles import Font, Alignment
-        from openpyxl.utils import get_column_letter
-        font_titulo = Font(name='Calibri', size=16, bold=True)
-        font_info = Font(name='Calibri', size=12, bold=True)
-        alignment_left = Alignment(horizontal='left', vertical='center')
-        sheet_diario.merge_cells('A1:D1')
-        titulo_cell = sheet_diario['A1']
-        titulo_cell.value = "Relatório de Ponto por Período"
-        titulo_cell.font = font_titulo
-        titulo_cell.alignment = alignment_left
-        sheet_diario['A2'] = "Empresa:"
-        sheet_diario['B2'] = nome_empresa
-        sheet_diario['A2'].font = font_info
-        if cnpj:
-            sheet_diario['C2'] = "CNPJ:"
-            sheet_diario['D2'] = cnpj
-            sheet_diario['C2'].font = font_info
-        sheet_diario['A3'] = "Período:"
-        sheet_diario['B3'] = periodo_str
-        sheet_diario['A3'].font = font_info
-        for sheet_name in writer.sheets:
-            worksheet = writer.sheets[sheet_name]
-            for i, column_cells in enumerate(worksheet.columns, 1):
-                max_length = 0
-                column_letter = get_column_letter(i)
-                start_row = 5 if sheet_name == 'Relatório Diário' else 1
-                header_cell = worksheet.cell(row=start_row, column=i)
-                if header_cell.value:
-                    max_length = len(str(header_cell.value))
-                for cell in column_cells:
-                    if cell.row > start_row:
-                        try:
-                            if len(str(cell.value)) > max_length:
-                                max_length = len(str(cell.value))
-                        except: pass
-                adjusted_width = max(max_length, len(str(header_cell.value)) if header_cell.value else 0) + 2
-                worksheet.column_dimensions[column_letter].width = adjusted_width
-    output_buffer.seek(0)
+    font_titulo = Font(name='Calibri', size=16, bold=True)
+    font_info = Font(name='Calibri', size=12, bold=True)
+    alignment_left = Alignment(horizontal='left', vertical='center')
+    linha_empresa = [{"valor": "Empresa:", "font": font_info}, nome_empresa]
+    if cnpj:
+        linha_empresa += [{"valor": "CNPJ:", "font": font_info}, cnpj]
+    linhas_iniciais = [
+        [{"valor": "Relatório de Ponto por Período", "font": font_titulo, "alignment": alignment_left}],
+        linha_empresa,
+        [{"valor": "Período:", "font": font_info}, periodo_str],
+        [],
+    ]
+
+    workbook = Workbook(write_only=True)
+    _escrever_planilha(workbook, 'Relatório Diário', df_organizado, linhas_iniciais, mesclar=['A1:D1'], larguras=larguras_organizado)
+    _escrever_planilha(workbook, 'Log de Eventos (Bruto)', df_bruto, larguras=larguras_bruto)
+
+    output_buffer = destino if destino is not None else io.BytesIO()
+    workbook.save(output_buffer)
+    if destino is None:
+        output_buffer.seek(0)
     return output_buffer
 
+# Com METRICS_ENABLED, mede as funções públicas acima; sem, não faz nada.
+metricas.instrumentar_modulo(globals(), __name__)
+metricas.iniciar_exportadores()
@@ -0,0 +1,93 @@
+"""Cálculo de diferença e status de batidas de ponto.
+
+`calcular_status` processa um DataFrame inteiro de uma vez (sem laço
+Python por linha) e `calcular_status_ponto` trata uma batida isolada; os
+dois recebem o horário previsto da mesma `horarios.TabelaHorarios` e usam
+a mesma regra de tolerância, então o que é gravado em `bater_ponto`
+confere com o que o painel exibe. As correções em lote
+(`services.atualizar_registros_em_lote`) repetem a regra em SQL.
+"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from config import TOLERANCIA_MINUTOS
+
+# Nomes antigos de eventos ainda presentes em registros históricos.
+ALIASES_EVENTOS = {"Início do Expediente": "Entrada", "Fim do Expediente": "Saída"}
+
+COLUNAS_STATUS = ['Horário Previsto', 'Diferença Bruta (min)', 'Diferença Tolerada (min)', 'Status']
+
+
+def aplicar_tolerancia(diff_bruta):
+    """Zera diferenças dentro da tolerância e desconta a tolerância das demais."""
+    diff_bruta = np.asarray(diff_bruta, dtype=float)
+    return np.where(np.abs(diff_bruta) <= TOLERANCIA_MINUTOS, 0,
+                    diff_bruta - np.sign(diff_bruta) * TOLERANCIA_MINUTOS)
+
+
+def _rotulo(diff_bruta, diff_tolerada):
+    if diff_tolerada == 0:
+        return "Em ponto" if diff_bruta == 0 else "Em ponto (dentro da tolerância)"
+    return f"{'+' if diff_tolerada > 0 else ''}{diff_tolerada} min ({'atrasado' if diff_tolerada > 0 else 'adiantado'})"
+
+
+def calcular_status_ponto(hora_prevista, momento: datetime):
+    """Status de uma batida: (hora_prevista, diff_bruta, diff_tolerada, status).
+
+    `hora_prevista` vem de `TabelaHorarios.previsto`; retorna diferenças None
+    quando ela é None (evento sem horário previsto).
+    """
+    if hora_prevista is None:
+        return None, None, None, ""
+    previsto = momento.replace(hour=hora_prevista.hour, minute=hora_prevista.minute,
+                               second=hora_prevista.second, microsecond=0)
+    diff_bruta = round((momento - previsto).total_seconds() / 60)
+    diff_tolerada = int(aplicar_tolerancia(diff_bruta))
+    return hora_prevista, diff_bruta, diff_tolerada, _rotulo(diff_bruta, diff_tolerada)
+
+
+def calcular_status(df: pd.DataFrame, horarios) -> pd.DataFrame:
+    """Status de todas as batidas de `df` numa única passada vetorizada.
+
+    Usa a coluna 'Hora' ('HH:MM:SS') e as que `horarios.segundos_previstos`
+    pede ('Descrição', 'Data', 'Filial', ...) e devolve um DataFrame
+    alinhado ao índice de `df` com as colunas de `COLUNAS_STATUS`.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=COLUNAS_STATUS, index=df.index)
+
+    previsto_seg = horarios.segundos_previstos(df)
+
+    hora_seg = pd.to_timedelta(df['Hora'].astype('string'), errors='coerce').dt.total_seconds()
+    diff_bruta = np.round((hora_seg - previsto_seg).to_numpy(dtype=float) / 60)
+    diff_tolerada = aplicar_tolerancia(diff_bruta)
+
+    bruta = pd.Series(diff_bruta, index=df.index).astype('Int64')
+    tolerada = pd.Series(diff_tolerada, index=df.index).astype('Int64')
+
+    previsto_txt = (
+        (previsto_seg // 3600).astype('Int64').astype('string').str.zfill(2) + ':'
+        + (previsto_seg % 3600 // 60).astype('Int64').astype('string').str.zfill(2) + ':'
+        + (previsto_seg % 60).astype('Int64').astype('string').str.zfill(2)
+    )
+
+    tolerada_txt = tolerada.abs().astype('string')
+    status = pd.Series(
+        np.select(
+            [tolerada.isna().to_numpy(), (tolerada > 0).fillna(False).to_numpy(),
+             (tolerada < 0).fillna(False).to_numpy(), (bruta == 0).fillna(False).to_numpy()],
+            ["", ("+" + tolerada_txt + " min (atrasado)").to_numpy(dtype=object),
+             ("-" + tolerada_txt + " min (adiantado)").to_numpy(dtype=object), "Em ponto"],
+            default="Em ponto (dentro da tolerância)",
+        ),
+        index=df.index,
+    )
+
+    return pd.DataFrame({
+        'Horário Previsto': previsto_txt,
+        'Diferença Bruta (min)': bruta,
+        'Diferença Tolerada (min)': tolerada,
+        'Status': status,
+    }, index=df.index)
@@ -0,0 +1,53 @@
+"""Configuração dos testes: os mesmos testes rodam nos dois backends.
+
+Sem DATABASE_URL, usam um SQLite num diretório temporário (nenhum servidor
+necessário). Com DATABASE_URL=postgresql://..., rodam nesse banco, que tem
+as tabelas esvaziadas a cada teste: aponte para um banco só de testes.
+"""
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp(prefix='ponto_testes_')}/ponto.db")
+# Hash barato: os testes não medem o custo do scrypt.
+os.environ.setdefault("PASSWORD_SCRYPT_N", str(2**10))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import horarios
+import services
+
+# Em ordem de dependência (chaves estrangeiras).
+_TABELAS = ["banco_horas", "registros", "pontos_dia", "registros_diarios", "horarios", "funcionarios", "empresas"]
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _esquema():
+    services.init_db()
+
+
+@pytest.fixture(autouse=True)
+def banco(_esquema):
+    """Banco vazio (só o admin e os horários iniciais) e caches zerados a cada teste."""
+    with services.get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            if services._banco.nome == "postgresql":
+                cursor.execute(f"TRUNCATE {', '.join(_TABELAS)} RESTART IDENTITY CASCADE")
+            else:
+                for tabela in _TABELAS:
+                    cursor.execute(f"DELETE FROM {tabela}")
+            cursor.executemany("INSERT INTO horarios (filial, evento, hora) VALUES (%s, %s, %s)", horarios.regras_iniciais())
+        conn.commit()
+    services.init_db()
+    services._cache.limpar()
+    services._ao_vivo.clear()
+    return services._banco
+
+
+@pytest.fixture
+def funcionario():
+    """(cpf, nome) de um funcionário da empresa "Omega" (CNPJ 123), Matriz, setor Adm."""
+    msg, tipo = services.adicionar_funcionario("111", "Ana", "Omega", "123", "11111111111", "1", "Adm", "Matriz")
+    assert tipo == "success", msg
+    return "11111111111", "Ana"
@@ -0,0 +1,87 @@
+from datetime import datetime, time
+
+import pytest
+
+import services
+from status_ponto import calcular_status_ponto
+
+
+@pytest.fixture
+def jornada(funcionario):
+    """IDs (entrada, saída) de uma jornada de hoje, com Entrada prevista às 08:00 para o funcionário."""
+    cpf, nome = funcionario
+    assert services.adicionar_horario("Entrada", "08:00:00", cpf=cpf)[1] == "success"
+    services.bater_ponto(cpf, nome)
+    services.bater_ponto(cpf, nome)
+    with services.get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT id FROM registros WHERE cpf_funcionario = %s ORDER BY hora, id", (cpf,))
+            return tuple(id_registro for (id_registro,) in cursor.fetchall())
+
+
+def _registro(id_registro):
+    with services.get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT data, hora, diferenca_min, observacao FROM registros WHERE id = %s", (id_registro,))
+            data, hora, diferenca, observacao = cursor.fetchone()
+    hora = hora if isinstance(hora, time) else time.fromisoformat(str(hora))
+    return data, hora, diferenca, observacao
+
+
+@pytest.mark.parametrize("nova_hora", ["08:00:00", "08:04:30", "08:06:30", "08:07:30", "07:40:00"])
+def test_correcao_refaz_a_diferenca_como_na_batida(jornada, nova_hora):
+    entrada, _ = jornada
+    assert services.atualizar_registro(entrada, nova_hora) == ("Registro atualizado com sucesso.", "success")
+
+    data, hora, diferenca, _ = _registro(entrada)
+    assert hora == time.fromisoformat(nova_hora)
+    # Meio minuto arredonda como `round` em calcular_status_ponto (para o par).
+    esperado = calcular_status_ponto(time(8, 0), datetime.combine(data, hora))[2]
+    assert diferenca == esperado
+
+
+def test_lote_com_linhas_invalidas_inexistentes_e_repetidas(jornada):
+    entrada, saida = jornada
+    _, hora_saida, diferenca_saida, _ = _registro(saida)
+    resultados = services.atualizar_registros_em_lote([
+        (entrada, "08:10:00", "Trânsito"),
+        ("abc", "08:00:00", None),
+        (saida, "18h", None),
+        (999_999, "08:00:00", None),
+        (entrada, "09:00:00", None),
+        (saida, None, "Saiu para o médico"),
+    ])
+    assert resultados == [
+        (entrada, "Registro atualizado com sucesso.", "success"),
+        ("abc", "ID de registro inválido.", "error"),
+        (saida, "Formato de hora inválido. Use HH:MM:SS.", "error"),
+        (999_999, "Registro não encontrado.", "warning"),
+        (entrada, "Registro repetido no lote; vale a primeira alteração.", "warning"),
+        (saida, "Registro atualizado com sucesso.", "success"),
+    ]
+
+    data, hora, diferenca, observacao = _registro(entrada)
+    assert (hora, observacao) == (time(8, 10), "Trânsito")
+    assert diferenca == calcular_status_ponto(time(8, 0), datetime.combine(data, hora))[2] != 0
+    # Só a observação mudou: hora e diferença da saída ficam como estavam.
+    assert _registro(saida)[1:] == (hora_saida, diferenca_saida, "Saiu para o médico")
+
+
+def test_lote_sem_linhas_validas_nao_abre_transacao(jornada):
+    entrada, _ = jornada
+    antes = _registro(entrada)
+    resultados = services.atualizar_registros_em_lote([(None, "08:00:00", None), (entrada, "25:00:00", None)])
+    assert [tipo for _, _, tipo in resultados] == ["error", "error"]
+    assert _registro(entrada) == antes
+
+
+def test_correcao_atualiza_o_resumo_diario(funcionario, jornada):
+    cpf, _ = funcionario
+    entrada, _ = jornada
+    services.atualizar_registro(entrada, "07:55:00", "Chegou cedo")
+    with services.get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT entrada, observacoes FROM registros_diarios WHERE cpf_funcionario = %s", (cpf,))
+            hora, observacoes = cursor.fetchone()
+    assert str(hora)[:8] == "07:55:00"
+    assert "Chegou cedo" in observacoes
@@ -0,0 +1,52 @@
+from datetime import date, time
+
+import pytest
+
+import services
+from config import HORARIOS_PADRAO
+
+
+def _hora(valor):
+    return valor if isinstance(valor, time) else time.fromisoformat(str(valor))
+
+
+def test_crud_de_horarios(funcionario):
+    cpf, _ = funcionario
+    iniciais = len(services.ler_horarios_df())
+
+    assert services.adicionar_horario("Entrada", "07:30", cpf=cpf) == ("Horário de 'Entrada' às 07:30:00 adicionado.", "success")
+    df = services.ler_horarios_df()
+    assert len(df) == iniciais + 1
+    nova = df[df['CPF'] == cpf].iloc[0]
+    assert (nova['Evento'], _hora(nova['Hora'])) == ("Entrada", time(7, 30))
+
+    assert services.excluir_horario(nova['ID']) == ("Horário excluído.", "success")
+    assert cpf not in services.ler_horarios_df()['CPF'].tolist()
+
+
+def test_previsto_segue_a_regra_mais_especifica(funcionario):
+    cpf, _ = funcionario
+    segunda = date(2024, 1, 1)
+    assert services.obter_horarios().previsto("Entrada", segunda, cpf, "Omega", "Matriz", "Adm") == _hora(HORARIOS_PADRAO["Entrada"])
+
+    services.adicionar_horario("Entrada", "09:00:00", setor="Adm")
+    services.adicionar_horario("Entrada", "07:00:00", cpf=cpf, dia_semana=1)
+    horarios = services.obter_horarios()
+    assert horarios.previsto("Entrada", segunda, cpf, "Omega", "Matriz", "Adm") == time(7, 0)
+    assert horarios.previsto("Entrada", date(2024, 1, 2), cpf, "Omega", "Matriz", "Adm") == time(9, 0)
+
+
+@pytest.mark.parametrize("argumentos, mensagem", [
+    (("Almoço", "12:00:00"), "Evento inválido. Use um de: " + ", ".join(HORARIOS_PADRAO) + "."),
+    (("Entrada", "8h"), "Formato de hora inválido. Use HH:MM:SS."),
+    (("Entrada", "08:00:00", None, None, None, None, 8), "Dia da semana deve ir de 1 (segunda) a 7 (domingo)."),
+    (("Entrada", "08:00:00", None, None, None, None, None, date(2024, 2, 1), date(2024, 1, 1)), "O fim da vigência não pode ser anterior ao início."),
+])
+def test_adicionar_horario_recusa_dados_invalidos(argumentos, mensagem):
+    iniciais = len(services.ler_horarios_df())
+    assert services.adicionar_horario(*argumentos) == (mensagem, "error")
+    assert len(services.ler_horarios_df()) == iniciais
+
+
+def test_adicionar_horario_para_cpf_desconhecido():
+    assert services.adicionar_horario("Saída", "17:00:00", cpf="000") == ("Nenhum funcionário com o CPF '000'.", "warning")
@@ -0,0 +1,47 @@
+import pandas as pd
+
+import services
+
+
+def _planilha(*linhas):
+    colunas = ['ARQUIVO', 'EMPRESA', 'CNPJ', 'CODTIPO', 'TIPO', 'CODFORTE', 'NOME', 'CPF']
+    return pd.DataFrame(linhas, columns=colunas)
+
+
+def test_importa_validas_e_separa_repetidas_e_incompletas(funcionario):
+    cpf_existente, _ = funcionario
+    df = _planilha(
+        ("RH Matriz.xlsx", "Omega", "123", "1", "Adm", "201", "Bruno", "22222222222"),
+        ("rh filial 2.xlsx", "Beta", "456", "2", "Obra", "202", "Carla", "33333333333"),
+        ("rh filial 03.xlsx", "Beta", "456", "2", "Obra", "203", "Davi", "33333333333"),
+        ("outro.xlsx", "Omega", "123", "1", "Adm", "204", "Eva", cpf_existente),
+        ("outro.xlsx", "Omega", "123", "1", "Adm", "", "Sem código", "44444444444"),
+        ("outro.xlsx", None, None, None, None, "206", "Fábio", "55555555555"),
+    )
+    sucesso, ignorados, erros = services.importar_funcionarios_em_massa(df)
+
+    assert (sucesso, ignorados) == (2, 2)
+    # Número da linha no arquivo: índice + 2 (cabeçalho na linha 1).
+    assert erros == [
+        "Linha 6: Dados essenciais (CodForte, Nome, CPF, Empresa) incompletos.",
+        "Linha 7: Dados essenciais (CodForte, Nome, CPF, Empresa) incompletos.",
+    ]
+    funcionarios = services.ler_funcionarios_df().set_index('cpf')
+    assert funcionarios.loc['22222222222', 'nome'] == "Bruno"
+    assert funcionarios.loc['33333333333', 'nome'] == "Carla"
+    assert funcionarios.loc['22222222222', 'filial'] == "Matriz"
+    assert funcionarios.loc['33333333333', 'filial'] == "Filial 02"
+    assert '44444444444' not in funcionarios.index
+    assert services.verificar_login('22222222222', '201')[0] is not None
+
+
+def test_arquivo_sem_colunas_obrigatorias():
+    sucesso, ignorados, erros = services.importar_funcionarios_em_massa(pd.DataFrame({'NOME': ["Ana"], 'CPF': ["1"]}))
+    assert (sucesso, ignorados) == (0, 0)
+    assert erros[0].startswith("Erro Crítico")
+
+
+def test_importar_de_novo_ignora_todos():
+    df = _planilha(("Matriz.xlsx", "Omega", "123", "1", "Adm", "201", "Bruno", "22222222222"))
+    assert services.importar_funcionarios_em_massa(df) == (1, 0, [])
+    assert services.importar_funcionarios_em_massa(df) == (0, 1, [])
@@ -0,0 +1,49 @@
+import services
+
+
+def _registros(cpf):
+    with services.get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT descricao FROM registros WHERE cpf_funcionario = %s ORDER BY hora, id", (cpf,))
+            return [descricao for (descricao,) in cursor.fetchall()]
+
+
+def test_bater_ponto_segue_entrada_saida_e_fecha_a_jornada(funcionario):
+    cpf, nome = funcionario
+    assert services.obter_proximo_evento(cpf) == "Entrada"
+
+    msg, tipo = services.bater_ponto(cpf, nome)
+    assert tipo == "success" and "'Entrada'" in msg
+    assert services.obter_proximo_evento(cpf) == "Saída"
+
+    msg, tipo = services.bater_ponto(cpf, nome)
+    assert tipo == "success" and "'Saída'" in msg
+    assert services.obter_proximo_evento(cpf) == "Jornada Finalizada"
+
+    msg, tipo = services.bater_ponto(cpf, nome)
+    assert tipo == "warning"
+    assert _registros(cpf) == ["Entrada", "Saída"]
+
+
+def test_bater_ponto_atualiza_o_resumo_diario(funcionario):
+    cpf, nome = funcionario
+    services.bater_ponto(cpf, nome)
+    services.bater_ponto(cpf, nome)
+    with services.get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT eventos, entrada IS NOT NULL, saida IS NOT NULL FROM registros_diarios WHERE cpf_funcionario = %s", (cpf,))
+            assert [tuple(linha) for linha in cursor.fetchall()] == [(2, True, True)]
+
+
+def test_evento_esperado_recusa_clique_repetido(funcionario):
+    cpf, nome = funcionario
+    assert services.bater_ponto(cpf, nome, evento_esperado="Entrada")[1] == "success"
+
+    # A tela ainda mostrava "Entrada": o segundo clique não pode virar Saída.
+    msg, tipo = services.bater_ponto(cpf, nome, evento_esperado="Entrada")
+    assert tipo == "warning" and "Entrada" in msg
+    assert _registros(cpf) == ["Entrada"]
+    assert services.obter_proximo_evento(cpf) == "Saída"
+
+    assert services.bater_ponto(cpf, nome, evento_esperado="Saída")[1] == "success"
+    assert _registros(cpf) == ["Entrada", "Saída"]
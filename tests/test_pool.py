@@ -0,0 +1,58 @@
+import gc
+import os
+import weakref
+
+import pytest
+
+import services
+from pool import ConnectionPool
+
+pytestmark = pytest.mark.skipif(services._banco.nome != "postgresql", reason="o pool só existe no PostgreSQL")
+
+
+def _responde(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT 1")
+        resposta = cursor.fetchone()[0]
+    conn.rollback()
+    return resposta == 1
+
+
+def _usar_no_filho(pool, conexoes):
+    """Usa o pool no processo filho e devolve a conexão herdada em uso.
+
+    O teste larga as próprias referências às conexões herdadas; o pool tem de
+    mantê-las vivas, ou o psycopg2 poderia fechá-las ao destruir o objeto.
+    """
+    herdadas = [weakref.ref(conn) for conn in conexoes]
+    em_uso = conexoes.pop()
+    conexoes.clear()
+    conn = pool.obter()
+    ok = _responde(conn) and conn not in [ref() for ref in herdadas]
+    pool.devolver(conn)
+    pool.devolver(em_uso)
+    del em_uso
+    pool.fechar()
+    gc.collect()
+    return ok and all(ref() is not None and not ref().closed for ref in herdadas)
+
+
+def test_fork_nao_derruba_as_conexoes_do_pai():
+    pool = ConnectionPool(os.environ["DATABASE_URL"], minimo=0, maximo=3)
+    # Só a lista guarda as conexões, para o filho poder largá-las de verdade.
+    conexoes = [pool.obter(), pool.obter()]
+    pool.devolver(conexoes[0])  # fica ociosa no pool; a outra segue em uso
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os._exit(0 if _usar_no_filho(pool, conexoes) else 1)
+        except BaseException:
+            os._exit(2)
+    _, status = os.waitpid(pid, 0)
+
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert all(_responde(conn) for conn in conexoes)
+    pool.devolver(conexoes[1])
+    assert pool.obter() in conexoes
+    pool.fechar()
@@ -0,0 +1,120 @@
+"""O relatório diário de hoje contra o `gerar_relatorio_organizado_df` original.
+
+`_relatorio_original` é uma cópia congelada da versão que re-pivotava os
+eventos em pandas; as duas implementações atuais (o pivot vetorizado e a
+leitura de `registros_diarios`) têm de reproduzi-la exatamente.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import services
+
+
+def _formatar_timedelta(td):
+    if pd.isnull(td): return "00:00"
+    total_seconds = int(td.total_seconds())
+    hours, remainder = divmod(total_seconds, 3600)
+    minutes, _ = divmod(remainder, 60)
+    return f"{hours:02d}:{minutes:02d}"
+
+def _relatorio_original(df_registros):
+    if df_registros.empty: return pd.DataFrame()
+    df = df_registros.copy()
+    df['Descrição'] = df['Descrição'].replace({"Início do Expediente": "Entrada", "Fim do Expediente": "Saída"})
+    df_pivot = df.pivot_table(index=['Data', 'Código Forte', 'Nome', 'Empresa', 'CNPJ'], columns='Descrição', values='Hora', aggfunc='first').reset_index()
+    df_obs = df.dropna(subset=['Observação']).groupby(['Data', 'Código Forte'])['Observação'].apply(lambda x: ' | '.join(x.unique())).reset_index()
+    df_final = pd.merge(df_pivot, df_obs, on=['Data', 'Código Forte'], how='left').fillna({'Observação': ''})
+    for evento in ['Entrada', 'Saída']:
+        if evento not in df_final.columns: df_final[evento] = np.nan
+        df_final[evento] = pd.to_datetime(df_final[evento], format='%H:%M:%S', errors='coerce').dt.time
+    dt_entrada = pd.to_datetime(df_final['Data'].astype(str) + ' ' + df_final['Entrada'].astype(str), errors='coerce')
+    dt_saida = pd.to_datetime(df_final['Data'].astype(str) + ' ' + df_final['Saída'].astype(str), errors='coerce')
+    df_final['Total Horas Trabalhadas'] = (dt_saida - dt_entrada).apply(_formatar_timedelta)
+    colunas = ['Data', 'Código Forte', 'Nome', 'Empresa', 'CNPJ', 'Entrada', 'Saída', 'Total Horas Trabalhadas', 'Observação']
+    for col in colunas:
+        if col not in df_final.columns: df_final[col] = 'N/A'
+    df_final = df_final[colunas]
+    df_final.rename(columns={'Código Forte': 'Código do Funcionário', 'Nome': 'Nome do Funcionário'}, inplace=True)
+    df_final['Data'] = pd.to_datetime(df_final['Data']).dt.strftime('%d/%m/%Y')
+    return df_final
+
+
+# (cpf, código, nome, empresa, cnpj, filial, setor)
+FUNCIONARIOS = [
+    ("10000000001", "101", "Ana", "Omega", "123", "Matriz", "Adm"),
+    ("10000000002", "102", "Bruno", "Omega", "123", "Matriz", "Obra"),
+    ("10000000003", "103", "Carla", "Beta", "456", "Filial 02", "Obra"),
+    ("10000000004", "104", "Davi", "Sem CNPJ", None, "Matriz", "Adm"),
+]
+
+# Eventos de cada funcionário/dia em ordem de hora, como `ler_registros_filtrados_df`
+# os devolve: (cpf, data, hora, descrição, diferença, observação)
+EVENTOS = [
+    # Jornada comum; a mesma observação nos dois eventos aparece uma vez só.
+    ("10000000001", "2024-03-04", "08:03:10", "Entrada", 0, "Trânsito"),
+    ("10000000001", "2024-03-04", "12:00:00", "Saída", -360, None),
+    ("10000000001", "2024-03-04", "17:59:59", "Saída", 0, "Trânsito"),
+    # Sem entrada.
+    ("10000000001", "2024-03-05", "18:10:00", "Saída", 10, "Esqueceu a entrada"),
+    # Saída antes da entrada.
+    ("10000000002", "2024-03-04", "07:00:00", "Saída", -660, None),
+    ("10000000002", "2024-03-04", "09:30:00", "Entrada", 90, "Corrigido"),
+    # Entradas repetidas: vale a primeira.
+    ("10000000002", "2024-03-05", "08:00:00", "Entrada", 0, None),
+    ("10000000002", "2024-03-05", "08:20:00", "Entrada", 20, "Clique duplo"),
+    ("10000000002", "2024-03-05", "17:00:00", "Saída", -60, ""),
+    # Nomes antigos dos eventos; observações distintas na ordem em que aparecem.
+    ("10000000003", "2024-03-04", "07:45:00", "Início do Expediente", 15, "Médico"),
+    ("10000000003", "2024-03-04", "16:30:30", "Fim do Expediente", -60, "Banco"),
+    ("10000000003", "2024-03-04", "16:31:00", "Fim do Expediente", -59, "Médico"),
+    # Funcionário de empresa sem CNPJ: fica fora do relatório.
+    ("10000000004", "2024-03-04", "08:00:00", "Entrada", 0, "Fora"),
+    ("10000000004", "2024-03-04", "18:00:00", "Saída", 0, None),
+]
+
+
+def _registros_fixture():
+    """Os EVENTOS no formato de `ler_registros_df`."""
+    cadastro = {cpf: linha for cpf, *linha in FUNCIONARIOS}
+    linhas = []
+    for id_registro, (cpf, data, hora, descricao, diferenca, observacao) in enumerate(EVENTOS, start=1):
+        codigo, nome, empresa, cnpj, filial, setor = cadastro[cpf]
+        linhas.append((id_registro, codigo, nome, data, hora, descricao, diferenca, observacao, empresa, cnpj, setor, filial))
+    return pd.DataFrame(linhas, columns=['ID', 'Código Forte', 'Nome', 'Data', 'Hora', 'Descrição', 'Diferença (min)', 'Observação', 'Empresa', 'CNPJ', 'Setor', 'Filial'])
+
+
+@pytest.fixture
+def registros_gravados():
+    for cpf, codigo, nome, empresa, cnpj, filial, setor in FUNCIONARIOS:
+        assert services.adicionar_funcionario(codigo, nome, empresa, cnpj, cpf, "1", setor, filial)[1] == "success"
+    nomes = {cpf: nome for cpf, _, nome, *_ in FUNCIONARIOS}
+    with services.get_db_connection() as conn:
+        for data in sorted({evento[1] for evento in EVENTOS}):
+            services._banco.garantir_particao_do_mes(conn, pd.Timestamp(data).date())
+        with conn.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO registros (cpf_funcionario, nome, data, hora, descricao, diferenca_min, observacao) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                [(cpf, nomes[cpf], data, hora, descricao, diferenca, observacao) for cpf, data, hora, descricao, diferenca, observacao in EVENTOS]
+            )
+        conn.commit()
+    services.reconstruir_registros_diarios()
+
+
+def test_fixture_cobre_os_casos_de_borda():
+    esperado = _relatorio_original(_registros_fixture())
+    assert "Davi" not in esperado['Nome do Funcionário'].tolist()
+    assert esperado['Total Horas Trabalhadas'].tolist() == ["03:56", "-3:30", "08:45", "00:00", "09:00"]
+
+
+def test_pivot_em_pandas_igual_ao_original():
+    registros = _registros_fixture()
+    pd.testing.assert_frame_equal(services.gerar_relatorio_organizado_df(registros), _relatorio_original(registros))
+
+
+def test_registros_diarios_igual_ao_original(registros_gravados):
+    registros = services.ler_registros_filtrados_df()
+    esperado = _relatorio_original(_registros_fixture())
+    pd.testing.assert_frame_equal(_relatorio_original(registros), esperado)
+    pd.testing.assert_frame_equal(services.gerar_relatorio_organizado_df(registros), esperado)
+    pd.testing.assert_frame_equal(services.gerar_relatorio_diario_df(), esperado, check_dtype=False)
@@ -0,0 +1,43 @@
+import pandas as pd
+
+import services
+
+
+def _relatorio_dos_eventos(**filtros):
+    return services.gerar_relatorio_organizado_df(services.ler_registros_filtrados_df(**filtros))
+
+
+def test_relatorio_diario_vazio():
+    assert services.gerar_relatorio_diario_df().empty
+
+
+def test_relatorio_diario_igual_ao_dos_eventos(funcionario):
+    cpf, nome = funcionario
+    services.adicionar_funcionario("222", "Bia", "Beta", "456", "22222222222", "2", "Obra", "Filial 02")
+    services.adicionar_funcionario("333", "Caio", "Sem CNPJ", None, "33333333333", "2", "Obra", "Matriz")
+    services.bater_ponto(cpf, nome)
+    services.bater_ponto(cpf, nome)
+    services.bater_ponto("22222222222", "Bia")
+    services.bater_ponto("33333333333", "Caio")
+
+    diario = services.gerar_relatorio_diario_df()
+    assert diario['Nome do Funcionário'].tolist() == ["Ana", "Bia"]
+    pd.testing.assert_frame_equal(diario, _relatorio_dos_eventos(), check_dtype=False)
+
+    empresa_id = services.ler_funcionarios_df().set_index('cpf').loc['22222222222', 'empresa_id']
+    filtrado = services.gerar_relatorio_diario_df(empresa_id=int(empresa_id))
+    assert filtrado['Nome do Funcionário'].tolist() == ["Bia"]
+    pd.testing.assert_frame_equal(filtrado, _relatorio_dos_eventos(empresa_id=int(empresa_id)), check_dtype=False)
+
+
+def test_relatorio_diario_acompanha_correcoes(funcionario):
+    cpf, nome = funcionario
+    services.bater_ponto(cpf, nome)
+    services.bater_ponto(cpf, nome)
+    entrada = int(services.ler_registros_filtrados_df()['ID'].iloc[0])
+    services.atualizar_registro(entrada, "00:00:01", "Plantão")
+
+    diario = services.gerar_relatorio_diario_df()
+    # A saída veio sem observação (""), que também entra na junção, como no relatório dos eventos.
+    assert diario['Observação'].tolist() == ["Plantão | "]
+    pd.testing.assert_frame_equal(diario, _relatorio_dos_eventos(), check_dtype=False)